@@ -12,6 +12,7 @@ export default function AttendanceManagement() {
   const [exams, setExams] = useState([])
   const [selectedExam, setSelectedExam] = useState('')
   const [attendance, setAttendance] = useState([])
+  const [summary, setSummary] = useState(null)
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const [success, setSuccess] = useState('')
@@ -23,6 +24,7 @@ export default function AttendanceManagement() {
   useEffect(() => {
     if (selectedExam) {
       fetchAttendance()
+      fetchSummary()
     }
   }, [selectedExam])
 
@@ -46,6 +48,17 @@ export default function AttendanceManagement() {
     }
   }
 
+  // Written by the terminal when the exam is closed; null until then
+  const fetchSummary = async () => {
+    const { data, error } = await supabase
+      .from('exam_summaries')
+      .select('*')
+      .eq('exam_id', selectedExam)
+      .maybeSingle()
+
+    setSummary(error ? null : data)
+  }
+
   const fetchAttendance = async () => {
     if (!selectedExam) return
 
@@ -196,17 +209,28 @@ export default function AttendanceManagement() {
   }
 
   const getStatusBadge = (status) => {
+    if (status === 'Absent') {
+      return <Badge variant="secondary">Absent</Badge>
+    }
     return status === 'Verified' 
       ? <Badge className="bg-green-100 text-green-800">Verified</Badge>
       : <Badge variant="destructive">Failed</Badge>
   }
 
   const getAttendanceStats = () => {
+    // A closed exam has its counts in exam_summaries; no need to go over every attendance row
+    if (summary) {
+      const verified = summary.verified_attempts
+      const failed = summary.failed_attempts
+      return { verified, failed, total: verified + failed, rate: summary.success_rate ?? 0 }
+    }
+
+    // Still open: count the attempts so far. Absent rows are only written at close
     const verified = attendance.filter(record => record.verification_status === 'Verified').length
     const failed = attendance.filter(record => record.verification_status === 'Failed').length
-    const total = attendance.length
+    const total = verified + failed
 
-    return { verified, failed, total }
+    return { verified, failed, total, rate: total > 0 ? (verified / total) * 100 : 0 }
   }
 
   const stats = getAttendanceStats()
@@ -258,8 +282,13 @@ export default function AttendanceManagement() {
           </CardHeader>
           <CardContent>
             <div className="text-2xl font-bold">
-              {stats.total > 0 ? Math.round((stats.verified / stats.total) * 100) : 0}%
+              {Math.round(stats.rate)}%
             </div>
+            {summary && (
+              <p className="text-xs text-muted-foreground">
+                {summary.verified_count} of {summary.roster_size} present, {summary.absent_count} absent
+              </p>
+            )}
           </CardContent>
         </Card>
       </div>
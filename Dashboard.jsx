@@ -37,11 +37,12 @@ export default function Dashboard() {
         .gte('exam_datetime', new Date().toISOString())
         .lte('exam_datetime', nextWeek.toISOString())
 
-      // Get today's attendance
+      // Get today's attendance (Absent rows written when exams close are not attempts)
       const today = new Date().toISOString().split('T')[0]
       const { count: attendanceCount } = await supabase
         .from('attendance')
         .select('*', { count: 'exact', head: true })
+        .neq('verification_status', 'Absent')
         .gte('timestamp', `${today}T00:00:00`)
         .lt('timestamp', `${today}T23:59:59`)
 
@@ -0,0 +1,310 @@
+"""
+Offline-first attendance write queue for SVA Terminal
+
+Attendance records are appended to a local SQLite database (WAL mode) so
+the touchscreen never waits on the network. A background worker drains
+the queue into Supabase with batched multi-row inserts and only deletes
+rows after the server has accepted them, so records survive Wi-Fi drops
+and application restarts.
+
+Each record carries a client_ref generated when it is queued. Uploads
+are upserts that ignore rows whose client_ref the server already has,
+so retrying a batch that was stored but not acknowledged cannot create
+duplicate rows. The queue also keeps a per-exam set of students already
+verified, seeded from the server's attendance rows and the rows still
+waiting here, so repeat scans are answered without writing anything.
+
+Closing an exam (reconciliation.py) queues an Absent row for each roster
+student who was never verified, then uploads everything still queued in
+one request with upload_pending. A close that cannot reach the server is
+kept in the queue's pending_closes table, and the sync worker runs it
+again once the attendance queue has drained.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import (ATTENDANCE_QUEUE_DB, ATTENDANCE_BATCH_SIZE,
+                    ATTENDANCE_SYNC_INTERVAL, RETRY_ATTEMPTS, RETRY_DELAY)
+from instrumentation import metrics, ATTENDANCE_ENQUEUE, ATTENDANCE_UPLOAD
+
+logger = logging.getLogger(__name__)
+
+
+def attendance_record(exam_id, student_id, status, method):
+    """Build one attendance row as inserted into Supabase"""
+    return {
+        'exam_id': exam_id,
+        'student_id': student_id,
+        'verification_status': status,
+        'verification_method': method,
+        'timestamp': datetime.now().isoformat(),
+        'client_ref': str(uuid.uuid4()),  # idempotency key for upload retries
+    }
+
+
+def absent_record(exam_id, student_id):
+    """Build the Absent row written for a student when their exam is closed
+
+    The client_ref is derived from the exam and student, so closing the
+    same exam again, here or on another terminal, adds no second row.
+    """
+    record = attendance_record(exam_id, student_id, 'Absent', 'session_close')
+    record['client_ref'] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"sva-absent/{exam_id}/{student_id}"))
+    record['notes'] = "No verified attendance when the exam was closed"
+    return record
+
+
+def upload_pending(client, queue):
+    """Upload every queued row in one multi-row upsert; returns the rows uploaded"""
+    batch = queue.peek_batch(queue.pending_count())
+    if not batch:
+        return 0
+    # The sync thread may send some of these rows too; client_ref makes that harmless
+    with metrics.span(ATTENDANCE_UPLOAD):
+        client.table('attendance').upsert(
+            [record for _, record in batch], on_conflict='client_ref',
+            ignore_duplicates=True).execute()
+    queue.ack([row_id for row_id, _ in batch])
+    return len(batch)
+
+
+class AttendanceQueue:
+    """Durable local queue of attendance rows waiting to be uploaded"""
+
+    def __init__(self, path=ATTENDANCE_QUEUE_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.has_work = threading.Event()
+        self._lock = threading.Lock()
+        self._verified = {}  # exam id -> ids of students verified for that exam
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is crash-safe in WAL mode and avoids an fsync per append
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_attendance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                queued_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_closes (
+                exam_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                queued_at REAL NOT NULL
+            )
+        """)
+        if self.pending_count() or self.pending_close_count():
+            self.has_work.set()
+
+    def enqueue(self, record):
+        """Append one attendance row to the queue"""
+        with metrics.span(ATTENDANCE_ENQUEUE), self._lock:
+            self.conn.execute(
+                "INSERT INTO pending_attendance (payload, queued_at) VALUES (?, ?)",
+                (json.dumps(record), time.time()))
+            if record['verification_status'] == 'Verified':
+                self._verified_for(record['exam_id']).add(record['student_id'])
+        self.has_work.set()
+
+    def enqueue_many(self, records):
+        """Append attendance rows to the queue in one transaction"""
+        if not records:
+            return
+        with metrics.span(ATTENDANCE_ENQUEUE), self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO pending_attendance (payload, queued_at) VALUES (?, ?)",
+                    [(json.dumps(record), now) for record in records])
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            for record in records:
+                if record['verification_status'] == 'Verified':
+                    self._verified_for(record['exam_id']).add(record['student_id'])
+        self.has_work.set()
+
+    def _verified_for(self, exam_id):
+        # Called with the lock held; the first use for an exam picks up rows
+        # queued before a restart that have not been uploaded yet
+        verified = self._verified.get(exam_id)
+        if verified is None:
+            verified = self._verified[exam_id] = set()
+            for (payload,) in self.conn.execute("SELECT payload FROM pending_attendance"):
+                record = json.loads(payload)
+                if record['exam_id'] == exam_id and record['verification_status'] == 'Verified':
+                    verified.add(record['student_id'])
+        return verified
+
+    def seed_verified(self, exam_id, student_ids):
+        """Add students the server already has as verified for an exam"""
+        with self._lock:
+            self._verified_for(exam_id).update(student_ids)
+
+    def is_verified(self, exam_id, student_id):
+        """True if the student already has a Verified row for this exam"""
+        with self._lock:
+            return student_id in self._verified_for(exam_id)
+
+    def verified_students(self, exam_id):
+        """Ids of the students known here to be verified for an exam"""
+        with self._lock:
+            return set(self._verified_for(exam_id))
+
+    def peek_batch(self, limit=ATTENDANCE_BATCH_SIZE):
+        """Return up to limit (row_id, record) pairs, least-retried first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, payload FROM pending_attendance ORDER BY attempts, id LIMIT ?",
+                (limit,)).fetchall()
+        batch = []
+        for row_id, payload in rows:
+            record = json.loads(payload)
+            if 'client_ref' not in record:
+                # Queued by an older version; derive a key that stays the same across retries
+                record['client_ref'] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"sva-queue/{row_id}/{payload}"))
+            batch.append((row_id, record))
+        return batch
+
+    def ack(self, row_ids):
+        """Remove rows that the server has accepted"""
+        with self._lock:
+            self.conn.executemany("DELETE FROM pending_attendance WHERE id = ?",
+                                  [(row_id,) for row_id in row_ids])
+
+    def mark_failed(self, row_ids):
+        """Record a failed upload attempt so healthy rows are tried first"""
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE pending_attendance SET attempts = attempts + 1 WHERE id = ?",
+                [(row_id,) for row_id in row_ids])
+
+    def pending_count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pending_attendance").fetchone()[0]
+
+    def defer_close(self, exam_data, roster_ids, report):
+        """Keep an exam close that could not finish, to be run again by the sync worker"""
+        payload = json.dumps({'exam_data': exam_data, 'roster_ids': sorted(roster_ids),
+                              'report': report})
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO pending_closes (exam_id, payload, queued_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(exam_id) DO UPDATE SET attempts = attempts + 1",
+                (exam_data['id'], payload, time.time()))
+
+    def pending_closes(self):
+        """(exam_data, roster_ids, report) for every deferred exam close, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT payload FROM pending_closes ORDER BY queued_at").fetchall()
+        closes = []
+        for (payload,) in rows:
+            close = json.loads(payload)
+            closes.append((close['exam_data'], close['roster_ids'], close['report']))
+        return closes
+
+    def drop_close(self, exam_id):
+        """Forget a deferred exam close once it has been run"""
+        with self._lock:
+            self.conn.execute("DELETE FROM pending_closes WHERE exam_id = ?", (exam_id,))
+
+    def pending_close_count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pending_closes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class AttendanceSyncThread(QThread):
+    """Background worker that uploads queued attendance rows in batches"""
+    sync_status = pyqtSignal(int, str)  # pending rows, last error ('' when healthy)
+
+    def __init__(self, supabase_client, queue, batch_size=ATTENDANCE_BATCH_SIZE):
+        super().__init__()
+        self.supabase = supabase_client
+        self.queue = queue
+        self.batch_size = batch_size
+        self.running = True
+        self._wake = threading.Event()
+        self._close_failures = 0
+        self._close_retry_at = 0.0
+
+    def run(self):
+        failures = 0
+        while self.running:
+            self.queue.has_work.wait(ATTENDANCE_SYNC_INTERVAL)
+            if not self.running:
+                break
+
+            # Fall back to single-row inserts while failing so one bad row
+            # cannot hold back the rest of the queue
+            batch = self.queue.peek_batch(self.batch_size if failures < RETRY_ATTEMPTS else 1)
+            if not batch:
+                self.queue.has_work.clear()
+                self.retry_closes()
+                continue
+
+            row_ids = [row_id for row_id, _ in batch]
+            try:
+                with metrics.span(ATTENDANCE_UPLOAD):
+                    self.supabase.table('attendance').upsert(
+                        [record for _, record in batch], on_conflict='client_ref',
+                        ignore_duplicates=True).execute()
+            except Exception as e:
+                failures += 1
+                self.queue.mark_failed(row_ids)
+                self.sync_status.emit(self.queue.pending_count(), str(e))
+                # Exponential backoff starting at RETRY_DELAY
+                delay = RETRY_DELAY * (2 ** min(failures - 1, RETRY_ATTEMPTS))
+                self._wake.wait(delay)
+                self._wake.clear()
+                continue
+
+            failures = 0
+            self.queue.ack(row_ids)
+            self.sync_status.emit(self.queue.pending_count(), "")
+
+    def retry_closes(self):
+        """Run deferred exam closes once the queue is empty, backing off while they fail"""
+        from reconciliation import close_exam
+
+        if time.monotonic() < self._close_retry_at or not self.queue.pending_close_count():
+            return
+        for exam_data, roster_ids, report in self.queue.pending_closes():
+            if not self.running:
+                return
+            try:
+                summary = close_exam(self.supabase, self.queue, exam_data, roster_ids, report)
+            except Exception as e:
+                summary = {'deferred': True}
+                logger.error(f"Closing exam {exam_data['id']} failed: {e}")
+            if summary.get('deferred'):
+                self._close_failures += 1
+                delay = RETRY_DELAY * (2 ** min(self._close_failures - 1, RETRY_ATTEMPTS))
+                self._close_retry_at = time.monotonic() + delay
+                return
+            self._close_failures = 0
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        self.queue.has_work.set()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Report the memory and disk footprint of a synthetic exam cache
+
+Builds a roster cache of --students students, each with a fingerprint
+template, and their embedding store, in a temporary directory. It then
+loads both again as a session would and reports bytes per student. The
+roster is measured with tracemalloc. The gallery is measured by the size
+of its arrays, which are memory-mapped. The roster is also loaded as the
+plain row dicts older caches held, for comparison. The run fails if the
+total is over --budget-mb.
+
+Usage: python bench_cache.py [--students 10000] [--dtype int8] [--budget-mb 50]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from embedding_store import DTYPES, EmbeddingStore
+from face_engine import FaceEmbedder, FaceGallery
+from roster_cache import RosterCache, StudentRecord, directory_size
+from secure_store import encryption_enabled
+
+CLASSES = ("100L", "200L", "300L", "400L", "500L")
+DEPARTMENTS = ("Computer Science", "Mathematics", "Physics", "Chemistry", "Statistics")
+SURNAMES = ("Adeyemi", "Okafor", "Bello", "Eze", "Ibrahim", "Okonkwo", "Balogun", "Musa")
+GIVEN_NAMES = ("Chidi", "Aisha", "Tunde", "Ngozi", "Emeka", "Fatima", "Segun", "Amaka")
+
+
+def synthetic_rows(count, rng):
+    """Roster rows shaped like the students table, with 512-byte templates"""
+    stamp = "2026-09-01T08:00:00+00:00"
+    for i in range(count):
+        yield {
+            'id': i + 1,
+            'matric_number': f"CSC/20{20 + i % 6}/{i:05d}",
+            'name': f"{SURNAMES[i % len(SURNAMES)]} {GIVEN_NAMES[i // 7 % len(GIVEN_NAMES)]} {i}",
+            'class': CLASSES[i % len(CLASSES)],
+            'department': DEPARTMENTS[i % len(DEPARTMENTS)],
+            'faculty': "Science",
+            'photo_url': f"https://storage.example.edu/photos/{i + 1}.jpg",
+            'fingerprint_template': rng.integers(0, 256, 512, dtype=np.uint8).tobytes(),
+            'updated_at': stamp,
+            'synced_at': stamp,
+        }
+
+
+def traced(load):
+    """(result, bytes still allocated by load once it returns)"""
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--dtype', choices=DTYPES, default='int8')
+    parser.add_argument('--budget-mb', type=float, default=50.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embedder = FaceEmbedder()
+    exam = {'id': 1, 'course_id': 1}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        roster = RosterCache(exam, cache_dir)
+        rows = list(synthetic_rows(args.students, rng))
+        for row in rows:
+            roster._index(StudentRecord.from_row(row))
+        started = time.perf_counter()
+        roster.save()
+        save_s = time.perf_counter() - started
+
+        store = EmbeddingStore.create(os.path.join(roster.dir, "embeddings.bin"), embedder.dim,
+                                      embedder.model_name, capacity=args.students, dtype=args.dtype)
+        vectors = rng.standard_normal((args.students, embedder.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for row, vector in zip(rows, vectors):
+            store.append(row['id'], vector, flush=False)
+        store.flush()
+        del roster, store
+
+        started = time.perf_counter()
+        roster, roster_bytes = traced(lambda: RosterCache(exam, cache_dir))
+        load_s = time.perf_counter() - started
+        gallery = FaceGallery.from_store(EmbeddingStore.open(os.path.join(roster.dir, "embeddings.bin")))
+        disk_bytes = directory_size(roster.dir)
+
+        # Rows as older caches kept them: dicts with base64 template text
+        legacy = json.dumps([dict(row, fingerprint_template=StudentRecord.from_row(row).saved()[7])
+                             for row in rows])
+        _, legacy_bytes = traced(lambda: {row['id']: row for row in json.loads(legacy)})
+
+    total = roster_bytes + gallery.memory_bytes
+    per_student = total / args.students
+    print(f"{args.students} students, {args.dtype} embeddings ({embedder.dim}-d), "
+          f"encryption {'on' if encryption_enabled() else 'off'}")
+    print(f"{'':>24} {'total MB':>9} {'B/student':>10}")
+    for label, size in (("roster (tracemalloc)", roster_bytes),
+                        ("roster (memory_bytes)", roster.memory_bytes()),
+                        ("gallery arrays", gallery.memory_bytes),
+                        ("memory total", total),
+                        ("on disk", disk_bytes),
+                        ("legacy roster dicts", legacy_bytes)):
+        print(f"{label:>24} {size / 2**20:>9.2f} {size / args.students:>10.0f}")
+    print(f"roster save {save_s * 1000:.0f} ms, load {load_s * 1000:.0f} ms")
+
+    within = total <= args.budget_mb * 2**20
+    print(f"{'within' if within else 'OVER'} the {args.budget_mb:.0f} MB budget "
+          f"({per_student:.0f} bytes per student)")
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
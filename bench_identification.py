@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark 1:N face identification latency against gallery size
+
+Builds random galleries of unit-length embeddings with the same
+dimension as FaceEmbedder and times FaceGallery.identify for a batch of
+live queries, with the gallery stored as --dtype (see EMBEDDING_DTYPE).
+
+Usage: python bench_identification.py [--sizes 100 1000 10000] [--queries 200] [--dtype int8]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from embedding_store import DTYPES, quantize
+from face_engine import FaceEmbedder, FaceGallery
+
+
+def random_unit_vectors(rng, count, dim):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def quantized_gallery(vectors, dtype):
+    """A FaceGallery holding vectors as dtype, as an EmbeddingStore would"""
+    dtype = np.dtype(dtype)
+    rows, scales = zip(*(quantize(vector, dtype) for vector in vectors))
+    return FaceGallery(np.arange(len(vectors)), np.stack(rows),
+                       np.array(scales, dtype=np.float32) if dtype == np.int8 else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--dtype', choices=DTYPES, default='float32')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    dim = FaceEmbedder().dim
+    print(f"embedding dim {dim}, {args.dtype}, {args.queries} queries per gallery size")
+    print(f"{'gallery':>8} {'MB':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'max err':>8}")
+
+    for size in args.sizes:
+        vectors = random_unit_vectors(rng, size, dim)
+        gallery = quantized_gallery(vectors, args.dtype)
+        queries = random_unit_vectors(rng, args.queries, dim)
+        # Largest score error against the float32 gallery
+        error = float(np.abs(gallery.scores(queries) - queries @ vectors.T).max())
+        gallery.identify(queries[0], args.k)  # warm up
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            gallery.identify(query, args.k, threshold=-1.0)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        p50, p95 = np.percentile(timings, [50, 95])
+        print(f"{size:>8} {gallery.memory_bytes / 2**20:>7.2f} {p50:>8.3f} {p95:>8.3f} "
+              f"{max(timings):>8.3f} {error:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Deterministic replay benchmark for the verification pipeline
+
+Replays a corpus of recorded scans through the real VerificationEngine
+without a display: the same detection, quality fusion, identification, fusion
+policy, repeat-scan check and attendance queue that the kiosk runs.
+Camera frames come from each scan's clip in lockstep, so every frame is
+processed and decisions do not depend on machine speed. Fingerprints are
+placed on the built-in sensor simulator. Supabase is the in-process
+fake, and roster photos are downloaded over a local HTTP server through
+the normal roster code. Attendance goes through the queue and the sync
+thread into the fake.
+
+A corpus is a directory with manifest.json, enrollment photos and one
+clip per scan:
+
+    {"exam": {...}, "students": [{"id", "matric_number", "name", "photo",
+     "fingerprint"}], "scans": [{"clip", "student_id", "finger"}]}
+
+student_id is who is in front of the camera (null for someone not on
+the roster) and finger is the base64 characteristics placed on the
+sensor. --make-corpus writes a synthetic corpus with drawn faces.
+
+Results (throughput, latency percentiles, FAR/FRR per modality and
+fused, per-stage timings, CPU and memory) are printed and written as
+JSON; --compare prints the change against an earlier results file.
+
+Usage:
+    python bench_pipeline.py --make-corpus corpus [--students 200] [--scans 200]
+    python bench_pipeline.py corpus [--json results.json] [--compare baseline.json]
+"""
+
+import argparse
+import base64
+import functools
+import http.server
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from orchestrator import FACE, FINGERPRINT
+
+CLIP_FPS = 30
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(max(values))}
+
+
+def rate(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+# Synthetic corpus
+
+def render_face(identity, face_width, rng=None, size=(640, 480)):
+    """Draw a face whose layout and skin texture are fixed by identity
+
+    rng adds the per-frame variation of a live camera: position jitter
+    and sensor noise. Without it the image is a clean enrollment photo.
+    """
+    p = np.random.default_rng(identity)
+    eye_dx, eye_y, eye_r = p.uniform(0.17, 0.24), p.uniform(0.36, 0.44), p.uniform(0.06, 0.09)
+    brow, nose = p.uniform(0.06, 0.1), p.uniform(0.12, 0.2)
+    mouth_w, mouth_y = p.uniform(0.15, 0.28), p.uniform(0.74, 0.8)
+    skin, aspect, hair = p.uniform(150, 210), p.uniform(1.2, 1.4), p.uniform(0.05, 0.25)
+    texture = p.normal(0, 1, (8, 6)).astype(np.float32)
+    marks = [(p.uniform(-0.35, 0.35), p.uniform(0.2, 0.9), p.uniform(0.03, 0.07), p.choice([20.0, 250.0]))
+             for _ in range(8)]
+
+    width, height = size
+    # The same textured background for everyone, like a fixed kiosk scene
+    scene = np.random.default_rng(12345).normal(0, 1, (12, 16)).astype(np.float32)
+    image = np.clip(80 + 25 * cv2.resize(scene, size, interpolation=cv2.INTER_CUBIC), 0, 255)
+
+    cx, cy = width // 2, height // 2
+    if rng is not None:
+        cx += int(rng.integers(-15, 16))
+        cy += int(rng.integers(-10, 11))
+    fw = face_width
+    fh = int(fw * aspect)
+    x0, y0 = cx - fw // 2, cy - fh // 2
+
+    mask = np.zeros((height, width), np.uint8)
+    cv2.ellipse(mask, (cx, cy), (fw // 2, fh // 2), 0, 0, 360, 255, -1)
+    face = np.full((height, width), skin, np.float32)
+    face[y0:y0 + fh, x0:x0 + fw] += 25 * cv2.resize(texture, (fw, fh), interpolation=cv2.INTER_CUBIC)
+    image[mask > 0] = face[mask > 0]
+
+    cv2.ellipse(image, (cx, y0 + int(hair * fh * 0.5)), (fw // 2, int(hair * fh)), 0, 180, 360, 25, -1)
+    for side in (-1, 1):
+        ex, ey = int(cx + side * eye_dx * fw), int(y0 + eye_y * fh)
+        cv2.ellipse(image, (ex, ey), (int(eye_r * fw * 1.4), int(eye_r * fw * 0.8)), 0, 0, 360, 30, -1)
+        brow_y = int(ey - brow * fh)
+        cv2.line(image, (ex - fw // 10, brow_y), (ex + fw // 10, brow_y), 40, max(2, fw // 30))
+    cv2.line(image, (cx, int(y0 + eye_y * fh)), (cx, int(y0 + (eye_y + nose) * fh)), skin * 0.7,
+             max(2, fw // 40))
+    cv2.ellipse(image, (cx, int(y0 + mouth_y * fh)), (int(mouth_w * fw / 2), int(0.03 * fh)),
+                0, 0, 360, 45, -1)
+    for u, v, r, shade in marks:
+        cv2.circle(image, (int(cx + u * fw), int(y0 + v * fh)), max(2, int(r * fw)), shade, -1)
+
+    if rng is not None:
+        image += rng.integers(-8, 9, image.shape)
+    image = cv2.GaussianBlur(np.clip(image, 0, 255).astype(np.uint8), (5, 5), 0)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def make_corpus(path, students=200, scans=200, impostor_rate=0.1, repeat_rate=0.1, frames=30, seed=0):
+    """Write a synthetic corpus: enrollment photos, scan clips and manifest.json"""
+    os.makedirs(os.path.join(path, "photos"), exist_ok=True)
+    os.makedirs(os.path.join(path, "clips"), exist_ok=True)
+    rng = random.Random(seed)
+
+    def template():
+        return base64.b64encode(bytes(rng.randrange(256) for _ in range(512))).decode()
+
+    roster = []
+    for student_id in range(1, students + 1):
+        photo = os.path.join("photos", f"{student_id}.png")
+        cv2.imwrite(os.path.join(path, photo), render_face(student_id, 220))
+        roster.append({'id': student_id, 'matric_number': f"BENCH/{student_id:05d}",
+                       'name': f"Student {student_id}", 'photo': photo, 'fingerprint': template()})
+
+    manifest_scans = []
+    unseen = rng.sample(roster, len(roster))
+    seen = []
+    for index in range(scans):
+        roll = rng.random()
+        if roll < impostor_rate:
+            # Someone not on the roster, with an unenrolled finger
+            student_id, identity, finger = None, 100000 + index, template()
+        else:
+            if (roll < impostor_rate + repeat_rate or not unseen) and seen:
+                student = rng.choice(seen)
+            else:
+                student = unseen.pop()
+                seen.append(student)
+            student_id, identity, finger = student['id'], student['id'], student['fingerprint']
+
+        clip = os.path.join("clips", f"{index:05d}.avi")
+        frame_rng = np.random.default_rng(seed * 1000003 + index)
+        writer = cv2.VideoWriter(os.path.join(path, clip), cv2.VideoWriter_fourcc(*'MJPG'),
+                                 CLIP_FPS, (640, 480))
+        for frame_index in range(frames):
+            # The student steps up to the camera during the clip
+            face_width = int(170 + 65 * frame_index / max(frames - 1, 1))
+            writer.write(render_face(identity, face_width, frame_rng))
+        writer.release()
+        manifest_scans.append({'clip': clip, 'student_id': student_id, 'finger': finger})
+
+    exam = {'id': 1, 'course_id': 1, 'exam_datetime': "2030-01-01T09:00:00+00:00",
+            'courses': {'course_code': "BENCH101", 'course_name': "Replay Benchmark"}}
+    with open(os.path.join(path, "manifest.json"), 'w') as f:
+        json.dump({'exam': exam, 'students': roster, 'scans': manifest_scans}, f, indent=1)
+    print(f"wrote {students} students and {scans} scans to {path}")
+
+
+def read_clip(path):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+# Replay
+
+def serve_directory(path):
+    """Serve path over HTTP on a free local port; returns the server"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), functools.partial(QuietHandler, directory=path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def replay(args):
+    # Scratch state and the simulator must be configured before the engine is imported
+    workdir = tempfile.mkdtemp(prefix="sva_bench_")
+    import config
+    config.FINGERPRINT_PORT = 'sim'
+    config.ROSTER_CACHE_DIR = os.path.join(workdir, "roster_cache")
+    config.ATTENDANCE_QUEUE_DB = os.path.join(workdir, "attendance_queue.db")
+    config.METRICS_FILE = os.path.join(workdir, "metrics.json")
+    config.LANES = []
+
+    from PyQt5.QtCore import QCoreApplication, QObject, pyqtSignal
+    from attendance_queue import AttendanceQueue, AttendanceSyncThread
+    from data_access import DataService, fetch_verified_students
+    from engine import VerificationEngine, ALREADY_VERIFIED
+    from fake_supabase import FakeSupabase
+    from instrumentation import metrics
+
+    class ClipReplay(QObject):
+        """Stands in for CaptureService and hands out a clip's frames in lockstep
+
+        wait_for_frame() returns the next frame of the clip however long the
+        caller took, and raises EOFError once the clip has been consumed.
+        """
+        camera_ready = pyqtSignal(float)
+        camera_error = pyqtSignal(str)
+
+        def __init__(self):
+            super().__init__()
+            self.frames = []
+            self.frame_listeners = []
+            self.running = True
+            self._lock = threading.Lock()
+
+        def play(self, frames):
+            with self._lock:
+                self.frames = frames
+                self.position = 0
+
+        def wait_for_frame(self, after_seq=0, timeout=1.0):
+            with self._lock:
+                if self.position >= len(self.frames):
+                    raise EOFError("end of clip")
+                self.position += 1
+                frame = self.frames[self.position - 1]
+            for listener in self.frame_listeners:
+                listener(self.position, frame)
+            return self.position, 0.0, frame
+
+        def latest_frame(self):
+            with self._lock:
+                return (self.position, 0.0, self.frames[self.position - 1]) if self.position else None
+
+        def isRunning(self):
+            return self.running
+
+        def start(self):
+            self.running = True
+
+        def stop(self):
+            self.running = False
+
+        def wait(self):
+            return True
+
+    with open(os.path.join(args.corpus, "manifest.json")) as f:
+        manifest = json.load(f)
+    exam = manifest['exam']
+    server = serve_directory(args.corpus)
+    photo_base = f"http://127.0.0.1:{server.server_address[1]}/"
+    rows = [{'student_id': s['id'], 'course_id': exam['course_id'], 'students': {
+        'id': s['id'], 'matric_number': s['matric_number'], 'name': s['name'], 'class': "",
+        'department': "", 'faculty': "", 'photo_url': photo_base + s['photo'],
+        'fingerprint_template': s['fingerprint'], 'updated_at': "2026-01-01T00:00:00+00:00"}}
+        for s in manifest['students']]
+    fake = FakeSupabase({'student_courses': rows, 'exams': [exam], 'attendance': []},
+                        unique={'attendance': ('client_ref',)}, latency=args.db_latency)
+
+    app = QCoreApplication(sys.argv[:1])
+
+    def pump(condition, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            app.processEvents()
+            if condition():
+                return True
+            time.sleep(0.001)
+        return False
+
+    # Session start: roster, photos, gallery and sensor, as on the kiosk
+    setup_started = time.perf_counter()
+    data_service = DataService(client_factory=lambda url, key: fake)
+    queue = AttendanceQueue(config.ATTENDANCE_QUEUE_DB)
+    sync = AttendanceSyncThread(data_service, queue)
+    sync.start()
+    queue.seed_verified(exam['id'], fetch_verified_students(fake, exam['id']))
+    camera = ClipReplay()
+    engine = VerificationEngine(data_service, exam, queue, camera, power_saving=False)
+    engine.start()
+    if not pump(lambda: engine.gallery is not None and engine.fingerprint_load_thread is not None
+                and engine.fingerprint_load_thread.isFinished(), args.timeout):
+        raise RuntimeError("Roster, gallery or sensor did not load")
+    simulator = engine.fingerprint_sensor.simulator
+    setup_ms = (time.perf_counter() - setup_started) * 1000
+    print(f"session ready in {setup_ms:.0f} ms: {len(engine.roster)} students, "
+          f"{len(engine.gallery)} faces, {len(engine.fingerprint_sensor.slots)} fingerprints")
+
+    # Keep every sample of the run rather than a rolling window
+    metrics.window = 10 ** 7
+    metrics.drain()
+    results = []
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    for index, scan in enumerate(manifest['scans']):
+        camera.play(read_clip(os.path.join(args.corpus, scan['clip'])))
+        outcome = {'expected': scan['student_id'], 'stages': {}, 'decision': None}
+
+        def on_decided(success, student_id, method, message, outcome=outcome):
+            outcome['decision'] = (success, student_id if student_id >= 0 else None)
+
+        def on_stage(modality, success, student_id, message, outcome=outcome):
+            outcome['stages'][modality] = student_id if success and student_id >= 0 else None
+
+        def on_finished(result, outcome=outcome):
+            outcome['result'] = result
+
+        simulator.place_finger(base64.b64decode(scan['finger']))
+        scan_started = time.perf_counter()
+        engine.attempt_finished.connect(on_finished)
+        engine.start_attempt()
+        engine.attempt.orchestrator.decided.connect(on_decided)
+        engine.attempt.orchestrator.stage_result.connect(on_stage)
+        pump(lambda: not engine.attempt.active
+             and engine.face_thread.isFinished() and engine.fingerprint_thread.isFinished(),
+             args.timeout)
+        outcome['latency_ms'] = (time.perf_counter() - scan_started) * 1000
+        engine.attempt_finished.disconnect(on_finished)
+        result = outcome.pop('result', None)
+        if outcome['decision'] is None:
+            # Cancelled by the repeat-scan check, which reports the student it recognised
+            if result is not None and result['outcome'] == ALREADY_VERIFIED:
+                outcome['decision'] = ('repeat', result['student']['id'])
+            else:
+                outcome['decision'] = ('timeout', None)
+        simulator.remove_finger()
+        engine.cancel_attempt()
+        results.append(outcome)
+        if args.progress and (index + 1) % args.progress == 0:
+            print(f"  {index + 1} scans, {(index + 1) / (time.perf_counter() - started):.1f} scans/s",
+                  flush=True)
+    wall = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    stages = {stage: percentiles(values) for stage, values in metrics.drain().items()}
+
+    pump(lambda: queue.pending_count() == 0, args.timeout)
+    attendance = fake.rows('attendance')
+    verified_rows = [r for r in attendance if r['verification_status'] == 'Verified']
+    pending = queue.pending_count()
+    engine.end()
+    sync.stop()
+    sync.wait()
+    queue.close()
+    data_service.shutdown()
+    server.shutdown()
+
+    return {
+        'corpus': os.path.abspath(args.corpus),
+        'commit': git_commit(),
+        'config': {name: getattr(config, name) for name in (
+            'FUSION_POLICY', 'FACE_MATCH_THRESHOLD', 'FACE_EARLY_ACCEPT_THRESHOLD', 'FACE_MIN_QUALITY',
+            'FACE_FUSION_FRAMES', 'FACE_DETECT_WIDTH', 'FACE_REDETECT_INTERVAL')},
+        'students': len(manifest['students']),
+        'scans': len(results),
+        'session_setup_ms': setup_ms,
+        'wall_s': wall,
+        'throughput_per_min': len(results) / wall * 60 if wall else None,
+        'latency_ms': percentiles([r['latency_ms'] for r in results]),
+        'accuracy': accuracy(results),
+        'stages_ms': stages,
+        'resources': {
+            'cpu_user_s': usage_after.ru_utime - usage_before.ru_utime,
+            'cpu_system_s': usage_after.ru_stime - usage_before.ru_stime,
+            'cpu_percent': 100 * ((usage_after.ru_utime - usage_before.ru_utime)
+                                  + (usage_after.ru_stime - usage_before.ru_stime)) / wall,
+            'peak_rss_mb': usage_after.ru_maxrss / 1024.0,
+            'rss_growth_mb': rss_mb() - rss_before,
+        },
+        'attendance': {
+            'rows': len(attendance),
+            'verified_rows': len(verified_rows),
+            'duplicate_verified_rows': len(verified_rows) - len({r['student_id'] for r in verified_rows}),
+            'pending': pending,
+        },
+    }
+
+
+def accuracy(results):
+    """False accept/reject rates for the fused decision and for each modality
+
+    A genuine scan is someone on the roster; it is a false reject unless
+    it is accepted (or recognised as a repeat) as that student, and a
+    misidentification if accepted as someone else. An impostor scan is a
+    false accept if it is accepted, or turned away as a repeat, as anyone.
+    """
+    genuine = [r for r in results if r['expected'] is not None]
+    impostors = [r for r in results if r['expected'] is None]
+
+    def accepted_as(result):
+        kind, student_id = result['decision']
+        return student_id if kind is True or kind == 'repeat' else None
+
+    fused_accepts = [accepted_as(r) for r in genuine]
+    report = {
+        'genuine_scans': len(genuine),
+        'impostor_scans': len(impostors),
+        'repeats_suppressed': sum(1 for r in results if r['decision'][0] == 'repeat'),
+        'timeouts': sum(1 for r in results if r['decision'][0] == 'timeout'),
+        'frr': rate(sum(1 for r, sid in zip(genuine, fused_accepts) if sid != r['expected']), len(genuine)),
+        'misidentification_rate': rate(
+            sum(1 for r, sid in zip(genuine, fused_accepts) if sid is not None and sid != r['expected']),
+            len(genuine)),
+        'far': rate(sum(1 for r in impostors if accepted_as(r) is not None), len(impostors)),
+        'modalities': {},
+    }
+    for modality in (FACE, FINGERPRINT):
+        # Scans where the modality finished before the decision cancelled it
+        ran_genuine = [r for r in genuine if modality in r['stages']]
+        ran_impostors = [r for r in impostors if modality in r['stages']]
+        report['modalities'][modality] = {
+            'genuine_scans': len(ran_genuine),
+            'impostor_scans': len(ran_impostors),
+            'frr': rate(sum(1 for r in ran_genuine if r['stages'][modality] != r['expected']),
+                        len(ran_genuine)),
+            'far': rate(sum(1 for r in ran_impostors if r['stages'][modality] is not None),
+                        len(ran_impostors)),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Reporting
+
+COMPARED = [
+    ('throughput_per_min', "throughput /min"),
+    ('latency_ms.p50', "latency p50 ms"),
+    ('latency_ms.p95', "latency p95 ms"),
+    ('latency_ms.p99', "latency p99 ms"),
+    ('accuracy.frr', "FRR"),
+    ('accuracy.far', "FAR"),
+    ('accuracy.modalities.face.frr', "face FRR"),
+    ('accuracy.modalities.face.far', "face FAR"),
+    ('stages_ms.face_detect.p50', "face detect p50 ms"),
+    ('stages_ms.face_identify.p50', "face identify p50 ms"),
+    ('resources.cpu_percent', "CPU %"),
+    ('resources.peak_rss_mb', "peak RSS MB"),
+]
+
+
+def lookup(report, path):
+    for part in path.split('.'):
+        if not isinstance(report, dict):
+            return None
+        report = report.get(part)
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"\n{report['scans']} scans in {report['wall_s']:.1f} s "
+          f"({report['throughput_per_min']:.1f} scans/min) at commit {report['commit']}")
+    header = f"{'metric':>22} {'value':>10}"
+    if baseline:
+        header += f" {'baseline':>10} {'change':>8}"
+    print(header)
+    for path, label in COMPARED:
+        value = lookup(report, path)
+        line = f"{label:>22} {value:>10.3f}" if value is not None else f"{label:>22} {'-':>10}"
+        if baseline:
+            before = lookup(baseline, path)
+            if value is not None and before is not None:
+                change = f"{(value - before) / before * 100:+.1f}%" if before else "-"
+                line += f" {before:>10.3f} {change:>8}"
+        print(line)
+    attendance = report['attendance']
+    print(f"attendance rows {attendance['rows']}, duplicate verified rows "
+          f"{attendance['duplicate_verified_rows']}, still queued {attendance['pending']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('corpus', nargs='?', help="corpus directory to replay")
+    parser.add_argument('--make-corpus', metavar='DIR', help="write a synthetic corpus and exit")
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--scans', type=int, default=200)
+    parser.add_argument('--impostor-rate', type=float, default=0.1)
+    parser.add_argument('--repeat-rate', type=float, default=0.1)
+    parser.add_argument('--frames', type=int, default=30, help="frames per synthetic scan clip")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-latency', type=float, default=0.0, help="seconds added to every fake Supabase request")
+    parser.add_argument('--timeout', type=float, default=60.0, help="give up on a scan or setup step after this long")
+    parser.add_argument('--progress', type=int, default=50, help="print progress every N scans (0 for quiet)")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    if args.make_corpus:
+        make_corpus(args.make_corpus, args.students, args.scans, args.impostor_rate,
+                    args.repeat_rate, args.frames, args.seed)
+        return 0
+    if not args.corpus:
+        parser.error("a corpus directory is required (create one with --make-corpus)")
+
+    report = replay(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
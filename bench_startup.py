@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark kiosk cold start: time from process start to an interactive exam list
+
+Launches the terminal in a fresh interpreter several times. Each run
+reports when the splash screen appeared, when each warmup task finished
+and when the exam selection screen became usable (time-to-interactive,
+counted from process start). Run as root with --drop-caches to empty the
+page cache before every run, which is the closest to a cold Pi boot
+without rebooting.
+
+Usage: python bench_startup.py [--runs 5] [--drop-caches] [--offscreen] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MARKER = "SVA_STARTUP "
+
+
+def run_child():
+    """Start the terminal, print its startup timings once interactive, then exit"""
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+    import main
+
+    terminal = main.SVATerminal()
+
+    def report(timings):
+        print(MARKER + json.dumps(timings), flush=True)
+        terminal.close()
+        app.quit()
+
+    terminal.interactive.connect(report)
+    terminal.show()
+    app.exec_()
+
+
+def drop_caches():
+    os.sync()
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError:
+        return False
+
+
+def run_once(args):
+    env = dict(os.environ)
+    if args.offscreen:
+        env['QT_QPA_PLATFORM'] = 'offscreen'
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            capture_output=True, text=True, timeout=args.timeout)
+    wall = (time.perf_counter() - started) * 1000
+    for line in result.stdout.splitlines():
+        if line.startswith(MARKER):
+            timings = json.loads(line[len(MARKER):])
+            timings['wall_exit'] = wall
+            return timings
+    raise RuntimeError(f"Terminal exited without reaching interactive:\n{result.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--drop-caches', action='store_true',
+                        help="empty the page cache before each run (needs root)")
+    parser.add_argument('--offscreen', action='store_true', help="use Qt's offscreen platform")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--json', help="also write all runs to this file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    runs = []
+    for index in range(args.runs):
+        if args.drop_caches and not drop_caches():
+            print("warning: could not drop caches (not root?); runs are warm")
+            args.drop_caches = False
+        timings = run_once(args)
+        runs.append(timings)
+        pending = f" (splash timed out waiting for {', '.join(timings['pending'])})" \
+            if timings['pending'] else ""
+        print(f"run {index + 1}: interactive {timings['interactive']:.0f} ms{pending}")
+
+    stages = ['splash', 'vision', 'supabase', 'embeddings', 'camera', 'exams', 'interactive']
+    print(f"\n{'stage':>12} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for stage in stages:
+        values = [run[stage] for run in runs if stage in run]
+        if values:
+            print(f"{stage:>12} {statistics.median(values):>10.0f} {min(values):>8.0f} {max(values):>8.0f}")
+    print("splash is counted from process start; warmup stages from when the splash was shown")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cold': args.drop_caches, 'runs': runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Camera capture service for SVA Terminal
+
+Keeps one cv2.VideoCapture open for a whole verification session and
+publishes the most recent frames through a small ring buffer. Face
+recognition threads pull frames from the service instead of opening the
+camera device themselves. Frame listeners, such as the live preview,
+are called with each new frame on the capture thread.
+
+set_frame_rate() lowers the rate while the kiosk is idle: frames in
+between are grabbed from the driver, so the buffer stays fresh, but not
+decoded or published, which saves the decode, the preview paint and the
+listeners' work.
+
+FrameFeed offers the same interface for frames that arrive from
+elsewhere, such as a remote UI posting camera frames to the engine
+service.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from config import CAMERA_INDEX, FACE_CASCADE_PATH
+from instrumentation import metrics, CAMERA_OPEN
+
+_cascade_cache = {}
+
+
+class CameraUnavailable(Exception):
+    """The camera could not be opened or stopped delivering frames"""
+
+
+def load_face_cascade(path=FACE_CASCADE_PATH, shared=True):
+    """Load the Haar cascade once per process and reuse it
+
+    Pass shared=False to get a private instance for a second thread that
+    runs detection at the same time as the face recognition thread.
+    """
+    if not os.path.exists(path):
+        path = os.path.join(cv2.data.haarcascades, os.path.basename(path))
+    if shared and path in _cascade_cache:
+        return _cascade_cache[path]
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise RuntimeError(f"Could not load face cascade: {path}")
+    if shared:
+        _cascade_cache[path] = cascade
+    return cascade
+
+
+class CaptureService(QThread):
+    """Long-lived camera reader with a ring buffer of the latest frames"""
+    camera_ready = pyqtSignal(float)  # time to first frame in seconds
+    camera_error = pyqtSignal(str)
+
+    def __init__(self, camera_index=CAMERA_INDEX, buffer_size=4):
+        super().__init__()
+        self.camera_index = camera_index
+        self.frames = deque(maxlen=buffer_size)  # (seq, timestamp, frame)
+        self.frame_seq = 0
+        self.time_to_first_frame = None
+        # Set here, not in run(), so a stop() that lands before the thread starts sticks
+        self.running = True
+        self.frame_listeners = []  # fn(seq, frame), called on the capture thread
+        self.frame_interval = 0.0  # seconds between published frames; 0 publishes every frame
+        self._stopped = False
+        self._cond = threading.Condition()
+
+    def set_frame_rate(self, fps=None):
+        """Publish at most fps frames per second, or every frame with None"""
+        self.frame_interval = 1.0 / fps if fps else 0.0
+
+    def run(self):
+        open_started = time.perf_counter()
+        cap = cv2.VideoCapture(self.camera_index)
+        published = 0.0
+        try:
+            if not cap.isOpened():
+                self.camera_error.emit("Camera not available")
+                return
+
+            while self.running:
+                if not cap.grab():
+                    time.sleep(0.01)
+                    continue
+                now = time.perf_counter()
+                if now - published < self.frame_interval:
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+
+                published = now
+                with self._cond:
+                    self.frame_seq += 1
+                    self.frames.append((self.frame_seq, now, frame))
+                    self._cond.notify_all()
+                for listener in self.frame_listeners:
+                    listener(self.frame_seq, frame)
+
+                if self.time_to_first_frame is None:
+                    self.time_to_first_frame = now - open_started
+                    metrics.record(CAMERA_OPEN, self.time_to_first_frame * 1000)
+                    self.camera_ready.emit(self.time_to_first_frame)
+        except Exception as e:
+            self.camera_error.emit(f"Camera error: {str(e)}")
+        finally:
+            cap.release()
+            with self._cond:
+                self._stopped = True
+                self.running = False
+                self.frames.clear()
+                self._cond.notify_all()
+
+    def latest_frame(self):
+        """Return the newest (seq, timestamp, frame) tuple or None"""
+        with self._cond:
+            return self.frames[-1] if self.frames else None
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """Block until a frame newer than after_seq arrives, or return None"""
+        def has_new_frame():
+            return self._stopped or (self.frames and self.frames[-1][0] > after_seq)
+
+        with self._cond:
+            self._cond.wait_for(has_new_frame, timeout)
+            if self.frames and self.frames[-1][0] > after_seq:
+                return self.frames[-1]
+            return None
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+
+
+class FrameFeed(QObject):
+    """CaptureService stand-in fed with frames by put() instead of a camera"""
+    camera_ready = pyqtSignal(float)  # time from start() to the first frame in seconds
+    camera_error = pyqtSignal(str)
+
+    def __init__(self, buffer_size=4):
+        super().__init__()
+        self.frames = deque(maxlen=buffer_size)  # (seq, timestamp, frame)
+        self.frame_seq = 0
+        self.time_to_first_frame = None
+        self.running = True
+        self.frame_listeners = []  # fn(seq, frame), called on the thread calling put()
+        self.frame_interval = 0.0
+        self._published = 0.0
+        self._started = time.perf_counter()
+        self._cond = threading.Condition()
+
+    def start(self):
+        self._started = time.perf_counter()
+
+    def isRunning(self):
+        return self.running
+
+    def set_frame_rate(self, fps=None):
+        """Drop frames put faster than fps per second; None keeps every frame"""
+        self.frame_interval = 1.0 / fps if fps else 0.0
+
+    def put(self, frame):
+        """Publish one BGR frame; ignored once stopped"""
+        now = time.perf_counter()
+        with self._cond:
+            if not self.running or now - self._published < self.frame_interval:
+                return
+            self._published = now
+            self.frame_seq += 1
+            seq = self.frame_seq
+            self.frames.append((seq, now, frame))
+            self._cond.notify_all()
+        for listener in self.frame_listeners:
+            listener(seq, frame)
+        if self.time_to_first_frame is None:
+            self.time_to_first_frame = now - self._started
+            self.camera_ready.emit(self.time_to_first_frame)
+
+    def latest_frame(self):
+        with self._cond:
+            return self.frames[-1] if self.frames else None
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        with self._cond:
+            self._cond.wait_for(lambda: not self.running or (self.frames and self.frames[-1][0] > after_seq),
+                                timeout)
+            if self.frames and self.frames[-1][0] > after_seq:
+                return self.frames[-1]
+            return None
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self.frames.clear()
+            self._cond.notify_all()
+
+    def wait(self):
+        return True
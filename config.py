@@ -8,8 +8,11 @@ SUPABASE_ANON_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZS
 
 # Hardware Configuration
 CAMERA_INDEX = 0  # Default camera index
-FINGERPRINT_PORT = '/dev/ttyUSB0'  # USB-TTL converter port
+FINGERPRINT_PORT = '/dev/ttyUSB0'  # USB-TTL converter port ('sim' for the built-in simulator)
 FINGERPRINT_BAUDRATE = 57600
+# Two or more (camera index, fingerprint port) pairs turn on multi-lane mode, with
+# one worker process per lane, e.g. [(0, '/dev/ttyUSB0'), (2, '/dev/ttyUSB1')]
+LANES = []
 
 # Display Configuration
 SCREEN_WIDTH = 800
@@ -20,30 +23,106 @@ FULLSCREEN = True
 FACE_CASCADE_PATH = 'haarcascade_frontalface_default.xml'
 FACE_RECOGNITION_TIMEOUT = 10  # seconds
 FACE_MATCH_THRESHOLD = 0.6
+FACE_DETECT_WIDTH = 320  # frames are downscaled to this width for detection
+PHOTO_DETECT_WIDTH = 640  # enrollment photos are downscaled to this width for detection
+PHOTO_MIN_FACE_RATIO = 0.1  # smallest face searched for, as a fraction of photo width
+FACE_MIN_SIZE_RATIO = 0.2  # smallest expected face, as a fraction of frame width
+FACE_REDETECT_INTERVAL = 5  # full detection every N frames, tracking in between
+FACE_FUSION_FRAMES = 5  # best-quality frames fused per decision
+FACE_EARLY_ACCEPT_THRESHOLD = 0.8  # stop as soon as the fused score reaches this
+FACE_MIN_QUALITY = 0.2  # frames scoring below this are ignored
 
 # Fingerprint Configuration
 FINGERPRINT_TIMEOUT = 15  # seconds
 MAX_FINGERPRINT_ATTEMPTS = 3
+FINGERPRINT_FULL_ACCURACY = 200  # sensor accuracy score treated as a certain match
+
+# Verification Fusion Configuration
+FUSION_POLICY = 'both'  # 'both', 'either' or 'score'
+FUSION_FACE_WEIGHT = 0.5  # face share of the combined score for the 'score' policy
+FUSION_SCORE_THRESHOLD = 0.7  # combined score needed for the 'score' policy
+MATRIC_LOOKUP_RESULTS = 6  # type-ahead matches listed by the matric-number fallback
 
 # Application Configuration
 AUTO_RESET_DELAY = 5000  # milliseconds
-SPLASH_SCREEN_DURATION = 3000  # milliseconds
+SPLASH_SCREEN_DURATION = 15000  # milliseconds; the splash ends earlier once startup warmup finishes
 
 # Logging Configuration
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'logs/sva_terminal.log'
 MAX_LOG_SIZE = 10 * 1024 * 1024  # 10MB
 LOG_BACKUP_COUNT = 5
+METRICS_FILE = 'logs/metrics.json'  # rolling latency and throughput snapshot
+METRICS_INTERVAL = 30  # seconds between metrics snapshots
+METRICS_WINDOW = 1000  # samples kept per stage for percentiles
 
 # Network Configuration
 CONNECTION_TIMEOUT = 30  # seconds
 RETRY_ATTEMPTS = 3
 RETRY_DELAY = 5  # seconds
+DATA_WORKERS = 2  # threads running Supabase requests for the UI
+
+# Offline Attendance Queue Configuration
+ATTENDANCE_QUEUE_DB = 'data/attendance_queue.db'
+ATTENDANCE_BATCH_SIZE = 50  # rows per multi-row insert
+ATTENDANCE_SYNC_INTERVAL = 2  # seconds between idle queue checks
+SESSION_SUMMARY_DIR = 'logs/sessions'  # per-exam summaries written when an exam is closed
 
 # Security Configuration
 SESSION_TIMEOUT = 300  # 5 minutes of inactivity
 ADMIN_PASSWORD = "admin123"  # Change in production
 
+# Roster Cache Configuration
+ROSTER_CACHE_DIR = 'data/roster_cache'
+ROSTER_PAGE_SIZE = 1000  # rows per paginated roster request
+PHOTO_DOWNLOAD_WORKERS = 4
+ROSTER_SYNC_INTERVAL = 10  # seconds between roster delta checks during a session
+EXAM_SYNC_INTERVAL = 30  # seconds between exam list delta checks on the selection screen
+SYNC_OVERLAP = 60  # seconds re-read before each high-water mark, for rows committed late
+
+# Biometric Cache Configuration
+CACHE_ENCRYPTION = True  # encrypt cached rosters, templates and photos (needs the cryptography package)
+CACHE_KEY_FILE = 'data/cache.key'  # AES-256 key for the caches, created on first use
+CACHE_MEMORY_BUDGET_MB = 64  # rosters kept in memory for quick session starts, least recently used evicted
+EMBEDDING_DTYPE = 'int8'  # face embeddings on disk and in memory: 'float32', 'float16' or 'int8'
+
+# Exam-day Prefetch Configuration
+PREFETCH_INTERVAL = 900  # seconds between checks for upcoming exams
+PREFETCH_DAYS_AHEAD = 2  # rosters of exams this many days ahead are prefetched
+PREFETCH_DISK_BUDGET_MB = 2048  # roster caches beyond this are evicted, least recently used first
+
+# Bulk Enrollment Configuration
+ENROLLMENT_DIR = 'data/enrollment'  # embedding store built by enroll_students.py
+ENROLLMENT_PAGE_SIZE = 1000  # students per page when streaming the students table
+ENROLLMENT_DOWNLOAD_WORKERS = 16  # concurrent photo downloads over one pooled client
+
+# Power Governor Configuration
+AUTO_START = True  # start verifying when someone steps up to the kiosk, without a button press
+IDLE_FRAME_RATE = 4  # frames per second decoded while nobody is at the kiosk
+IDLE_FRAME_RATE_HOT = 2  # idle frame rate while the CPU is hot or throttled
+MOTION_FRAME_WIDTH = 64  # idle frames are shrunk to this width for motion detection
+MOTION_THRESHOLD = 0.03  # fraction of the tiny frame that must change to count as motion
+APPROACH_TIMEOUT = 3  # seconds of face search after motion before going back to idle
+APPROACH_CHECK_RATE = 5  # face presence checks per second after motion
+AUTO_START_COOLDOWN = 5  # seconds after an attempt before the kiosk re-arms
+THERMAL_INTERVAL = 10  # seconds between temperature and throttle readings
+THERMAL_HOT_C = 75  # CPU temperature treated as hot
+
+# Engine Service Configuration
+# Where the UI finds a headless engine (engine_service.py), e.g. 'unix:data/engine.sock' or
+# 'http://10.0.0.5:8765'; None runs the engine inside the UI process
+ENGINE_ADDRESS = None
+ENGINE_SOCKET = 'data/engine.sock'  # default Unix socket of engine_service.py
+ENGINE_FRAME_RATE = 10  # frames per second a remote UI uploads during an attempt
+ENGINE_JPEG_QUALITY = 80  # JPEG quality of uploaded frames
+ENGINE_EVENT_BACKLOG = 1000  # recent events kept for clients that reconnect
+ENGINE_HEARTBEAT = 5  # seconds between heartbeats on an idle event stream
+ENGINE_INTERACTIVE_TIMEOUT = 0.5  # seconds the UI waits for an attempt to start or a matric search
+# Shared secret sent in the X-Engine-Token header of every engine API request; the service
+# refuses requests without it. None leaves the API open and only allows a Unix socket or a
+# loopback address
+ENGINE_API_TOKEN = None
+
 # File Paths
 ASSETS_DIR = "assets"
 TEMP_DIR = "/tmp/sva_terminal"
@@ -0,0 +1,141 @@
+"""
+Data-access layer for SVA Terminal
+
+Every Supabase call runs on a small worker pool instead of the Qt GUI
+thread. The client is created on a worker at startup, so the window
+appears without waiting for it. Results and errors come back through
+Qt signals, which are delivered to the GUI thread. Each request carries
+a key. Submitting a newer request with the same key supersedes the old
+one: it is cancelled if it has not started yet, and its result is
+dropped otherwise.
+
+Background QThreads that already run off the GUI thread (roster refresh,
+attendance sync) use the service like a plain supabase client through
+table() and rpc(), which wait for the client to be ready.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from config import SUPABASE_URL, SUPABASE_ANON_KEY, CONNECTION_TIMEOUT, DATA_WORKERS, ROSTER_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def create_supabase_client(url=SUPABASE_URL, key=SUPABASE_ANON_KEY):
+    """Create a client whose REST, storage and function calls all use CONNECTION_TIMEOUT
+
+    The PostgREST client is created once and reused, so its httpx
+    connection pool is shared by every table and rpc request.
+    """
+    # Imported here: supabase is the slowest import at startup and this
+    # always runs on a worker thread
+    from supabase import create_client, ClientOptions
+    options = ClientOptions(postgrest_client_timeout=CONNECTION_TIMEOUT,
+                            storage_client_timeout=CONNECTION_TIMEOUT,
+                            function_client_timeout=CONNECTION_TIMEOUT)
+    return create_client(url, key, options=options)
+
+
+EXAM_FIELDS = """
+    *,
+    courses (
+        course_code,
+        course_name
+    )
+"""
+
+
+def fetch_exams(client, since):
+    """Exams on or after a date (YYYY-MM-DD) with their course, soonest first"""
+    return client.table('exams').select(EXAM_FIELDS) \
+        .gte('exam_datetime', since).order('exam_datetime').execute().data
+
+
+def fetch_verified_students(client, exam_id, page_size=ROSTER_PAGE_SIZE):
+    """Ids of students with a Verified attendance row for an exam, fetched in pages"""
+    student_ids = set()
+    start = 0
+    while True:
+        rows = client.table('attendance').select('student_id') \
+            .eq('exam_id', exam_id).eq('verification_status', 'Verified') \
+            .order('id').range(start, start + page_size - 1).execute().data
+        student_ids.update(row['student_id'] for row in rows)
+        if len(rows) < page_size:
+            return student_ids
+        start += page_size
+
+
+class DataService(QObject):
+    """Runs Supabase requests on worker threads and reports back through signals"""
+    finished = pyqtSignal(str, object)  # request key, result
+    failed = pyqtSignal(str, str)  # request key, error message
+
+    def __init__(self, url=SUPABASE_URL, key=SUPABASE_ANON_KEY, max_workers=DATA_WORKERS,
+                 client_factory=create_supabase_client):
+        super().__init__()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+        self._lock = threading.Lock()
+        self._pending = {}  # request key -> future of the newest request
+        self._client_future = self._pool.submit(client_factory, url, key)
+        self._client_future.add_done_callback(self._on_client_done)
+
+    def _on_client_done(self, future):
+        if future.exception() is not None:
+            logger.error(f"Could not create Supabase client: {future.exception()}")
+
+    def client(self, timeout=CONNECTION_TIMEOUT):
+        """The supabase client; blocks until created, so never call it on the GUI thread"""
+        return self._client_future.result(timeout)
+
+    def table(self, name):
+        return self.client().table(name)
+
+    def rpc(self, fn, params=None):
+        return self.client().rpc(fn, params)
+
+    def submit(self, key, fn, *args):
+        """Run fn(client, *args) on a worker; supersedes any pending request with this key"""
+        with self._lock:
+            previous = self._pending.get(key)
+            future = self._pool.submit(self._run, fn, args)
+            self._pending[key] = future
+        # Outside the lock: cancel() runs done callbacks in this thread
+        if previous is not None:
+            previous.cancel()
+        future.add_done_callback(lambda f: self._deliver(key, f))
+        return future
+
+    def cancel(self, key):
+        """Drop a pending request; a request already on the wire is ignored when it returns"""
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def _run(self, fn, args):
+        return fn(self.client(), *args)
+
+    def _deliver(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is not future:
+                return  # superseded or cancelled
+            del self._pending[key]
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.failed.emit(key, str(error))
+        else:
+            self.finished.emit(key, future.result())
+
+    def shutdown(self):
+        """Cancel queued requests and let running ones finish in the background"""
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for future in pending:
+            future.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
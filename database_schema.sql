@@ -7,7 +7,9 @@
 ALTER DATABASE postgres SET "app.jwt_secret" TO 'your-jwt-secret';
 
 -- Create custom types
-CREATE TYPE verification_status AS ENUM ('Verified', 'Failed');
+-- Absent rows are written by the terminal when an exam is closed, one per
+-- roster student without a Verified row; they are not verification attempts
+CREATE TYPE verification_status AS ENUM ('Verified', 'Failed', 'Absent');
 
 -- =====================================================
 -- COURSES TABLE
@@ -48,6 +50,7 @@ CREATE TABLE students (
 CREATE INDEX idx_students_matric ON students(matric_number);
 CREATE INDEX idx_students_name ON students(name);
 CREATE INDEX idx_students_department ON students(department);
+CREATE INDEX idx_students_updated_at ON students(updated_at);
 
 -- =====================================================
 -- STUDENT_COURSES TABLE
@@ -58,12 +61,14 @@ CREATE TABLE student_courses (
     student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
     course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
     enrolled_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(student_id, course_id)
 );
 
 -- Add indexes for better performance
 CREATE INDEX idx_student_courses_student ON student_courses(student_id);
 CREATE INDEX idx_student_courses_course ON student_courses(course_id);
+CREATE INDEX idx_student_courses_course_updated ON student_courses(course_id, updated_at);
 
 -- =====================================================
 -- EXAMS TABLE
@@ -82,6 +87,7 @@ CREATE TABLE exams (
 CREATE INDEX idx_exams_course ON exams(course_id);
 CREATE INDEX idx_exams_datetime ON exams(exam_datetime);
 CREATE INDEX idx_exams_created_by ON exams(created_by);
+CREATE INDEX idx_exams_updated_at ON exams(updated_at);
 
 -- =====================================================
 -- ATTENDANCE TABLE
@@ -93,8 +99,9 @@ CREATE TABLE attendance (
     student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
     verification_status verification_status NOT NULL,
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    verification_method VARCHAR(50) DEFAULT 'biometric', -- face+fingerprint, face_only, fingerprint_only
-    notes TEXT
+    verification_method VARCHAR(50) DEFAULT 'biometric', -- face+fingerprint, face_only, fingerprint_only, session_close
+    notes TEXT,
+    client_ref UUID -- set by the terminal when the row is queued; makes upload retries idempotent
 );
 
 -- Add indexes for better performance
@@ -102,6 +109,30 @@ CREATE INDEX idx_attendance_exam ON attendance(exam_id);
 CREATE INDEX idx_attendance_student ON attendance(student_id);
 CREATE INDEX idx_attendance_timestamp ON attendance(timestamp);
 CREATE INDEX idx_attendance_status ON attendance(verification_status);
+-- Terminals load an exam's verified students at session start
+CREATE INDEX idx_attendance_exam_student ON attendance(exam_id, student_id);
+-- Target of the terminal's upsert (ON CONFLICT (client_ref) DO NOTHING); NULLs never conflict
+CREATE UNIQUE INDEX idx_attendance_client_ref ON attendance(client_ref);
+
+-- =====================================================
+-- EXAM_SUMMARIES TABLE
+-- One row per exam, upserted by the terminal that closes the exam, so
+-- dashboards do not aggregate the attendance table on every page load.
+-- Roster, verified and absent counts cover every terminal; attempt counts,
+-- success rate and stage latencies are those of the closing terminal
+-- =====================================================
+CREATE TABLE exam_summaries (
+    exam_id INTEGER PRIMARY KEY REFERENCES exams(id) ON DELETE CASCADE,
+    roster_size INTEGER NOT NULL,
+    verified_count INTEGER NOT NULL,
+    absent_count INTEGER NOT NULL,
+    verified_attempts INTEGER NOT NULL DEFAULT 0,
+    failed_attempts INTEGER NOT NULL DEFAULT 0,
+    success_rate NUMERIC(5, 2), -- verified attempts / attempts, percent
+    attendance_rate NUMERIC(5, 2), -- verified students / roster, percent
+    stage_latency JSONB, -- stage -> {count, p50_ms, p95_ms, p99_ms, max_ms}
+    closed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
 
 -- =====================================================
 -- TRIGGERS FOR UPDATED_AT TIMESTAMPS
@@ -126,6 +157,42 @@ CREATE TRIGGER update_students_updated_at BEFORE UPDATE ON students
 CREATE TRIGGER update_exams_updated_at BEFORE UPDATE ON exams
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+CREATE TRIGGER update_student_courses_updated_at BEFORE UPDATE ON student_courses
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- =====================================================
+-- DELETED ROWS LOG
+-- Terminals sync exams and rosters by updated_at; deletions leave no row
+-- to compare, so they are logged here and read the same way
+-- =====================================================
+CREATE TABLE deleted_rows (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    row_id INTEGER NOT NULL,
+    old_row JSONB NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_deleted_rows_deleted_at ON deleted_rows(deleted_at);
+
+CREATE OR REPLACE FUNCTION log_deleted_row()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO deleted_rows (table_name, row_id, old_row)
+    VALUES (TG_TABLE_NAME, OLD.id, to_jsonb(OLD));
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER log_students_deleted AFTER DELETE ON students
+    FOR EACH ROW EXECUTE FUNCTION log_deleted_row();
+
+CREATE TRIGGER log_student_courses_deleted AFTER DELETE ON student_courses
+    FOR EACH ROW EXECUTE FUNCTION log_deleted_row();
+
+CREATE TRIGGER log_exams_deleted AFTER DELETE ON exams
+    FOR EACH ROW EXECUTE FUNCTION log_deleted_row();
+
 -- =====================================================
 -- ROW LEVEL SECURITY (RLS) POLICIES
 -- =====================================================
@@ -136,6 +203,8 @@ ALTER TABLE students ENABLE ROW LEVEL SECURITY;
 ALTER TABLE student_courses ENABLE ROW LEVEL SECURITY;
 ALTER TABLE exams ENABLE ROW LEVEL SECURITY;
 ALTER TABLE attendance ENABLE ROW LEVEL SECURITY;
+ALTER TABLE deleted_rows ENABLE ROW LEVEL SECURITY;
+ALTER TABLE exam_summaries ENABLE ROW LEVEL SECURITY;
 
 -- Courses policies
 CREATE POLICY "Allow authenticated users to read courses" ON courses
@@ -189,6 +258,10 @@ CREATE POLICY "Allow authenticated users to update exams" ON exams
 CREATE POLICY "Allow authenticated users to delete exams" ON exams
     FOR DELETE USING (auth.role() = 'authenticated');
 
+-- Deleted rows policies (rows are written by the SECURITY DEFINER trigger)
+CREATE POLICY "Allow authenticated users to read deleted_rows" ON deleted_rows
+    FOR SELECT USING (auth.role() = 'authenticated');
+
 -- Attendance policies
 CREATE POLICY "Allow authenticated users to read attendance" ON attendance
     FOR SELECT USING (auth.role() = 'authenticated');
@@ -202,6 +275,16 @@ CREATE POLICY "Allow authenticated users to update attendance" ON attendance
 CREATE POLICY "Allow authenticated users to delete attendance" ON attendance
     FOR DELETE USING (auth.role() = 'authenticated');
 
+-- Exam summaries policies
+CREATE POLICY "Allow authenticated users to read exam_summaries" ON exam_summaries
+    FOR SELECT USING (auth.role() = 'authenticated');
+
+CREATE POLICY "Allow authenticated users to insert exam_summaries" ON exam_summaries
+    FOR INSERT WITH CHECK (auth.role() = 'authenticated');
+
+CREATE POLICY "Allow authenticated users to update exam_summaries" ON exam_summaries
+    FOR UPDATE USING (auth.role() = 'authenticated');
+
 -- =====================================================
 -- USEFUL VIEWS FOR REPORTING
 -- =====================================================
@@ -221,19 +304,20 @@ FROM students s
 JOIN student_courses sc ON s.id = sc.student_id
 JOIN courses c ON sc.course_id = c.id;
 
--- View for exam attendance summary
+-- View for exam attendance summary, computed from every attendance row;
+-- dashboards should prefer exam_summaries, which closed exams keep ready
 CREATE VIEW exam_attendance_summary AS
 SELECT 
     e.id as exam_id,
     c.course_code,
     c.course_name,
     e.exam_datetime,
-    COUNT(a.id) as total_attempts,
+    COUNT(CASE WHEN a.verification_status <> 'Absent' THEN 1 END) as total_attempts,
     COUNT(CASE WHEN a.verification_status = 'Verified' THEN 1 END) as verified_count,
     COUNT(CASE WHEN a.verification_status = 'Failed' THEN 1 END) as failed_count,
     ROUND(
         COUNT(CASE WHEN a.verification_status = 'Verified' THEN 1 END) * 100.0 / 
-        NULLIF(COUNT(a.id), 0), 2
+        NULLIF(COUNT(CASE WHEN a.verification_status <> 'Absent' THEN 1 END), 0), 2
     ) as success_rate
 FROM exams e
 JOIN courses c ON e.course_id = c.id
@@ -303,10 +387,11 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- Function to get upcoming exams
+-- Function to get upcoming exams (the terminal prefetches their rosters)
 CREATE OR REPLACE FUNCTION get_upcoming_exams(days_ahead INTEGER DEFAULT 7)
 RETURNS TABLE (
     exam_id INTEGER,
+    course_id INTEGER,
     course_code VARCHAR(20),
     course_name VARCHAR(255),
     exam_datetime TIMESTAMP WITH TIME ZONE,
@@ -316,6 +401,7 @@ BEGIN
     RETURN QUERY
     SELECT 
         e.id,
+        e.course_id,
         c.course_code,
         c.course_name,
         e.exam_datetime,
@@ -411,8 +497,27 @@ FROM courses c WHERE c.course_code = 'COEN 403';
 -- PERFORMANCE OPTIMIZATION NOTES
 -- =====================================================
 
--- Consider adding these indexes for large datasets:
+-- To add the terminal's idempotency key to an existing database:
+-- ALTER TABLE attendance ADD COLUMN client_ref UUID;
+-- CREATE UNIQUE INDEX CONCURRENTLY idx_attendance_client_ref ON attendance(client_ref);
 -- CREATE INDEX CONCURRENTLY idx_attendance_exam_student ON attendance(exam_id, student_id);
+
+-- get_upcoming_exams gained a course_id column; its return type changed, so
+-- on an existing database drop it before re-running its CREATE statement:
+-- DROP FUNCTION get_upcoming_exams(INTEGER);
+
+-- Delta sync needs student_courses.updated_at and the deleted_rows log. On an
+-- existing database add the column and its trigger and index, and run the
+-- DELETED ROWS LOG section above:
+-- ALTER TABLE student_courses ADD COLUMN updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+-- Closing exams from the terminal needs the Absent status and the
+-- exam_summaries table. On an existing database run the EXAM_SUMMARIES
+-- TABLE section and its policies above, re-create exam_attendance_summary,
+-- and add the status (ALTER TYPE ... ADD VALUE cannot run inside a transaction):
+-- ALTER TYPE verification_status ADD VALUE 'Absent';
+
+-- Consider adding these indexes for large datasets:
 -- CREATE INDEX CONCURRENTLY idx_attendance_timestamp_status ON attendance(timestamp, verification_status);
 
 -- For very large datasets, consider partitioning the attendance table by date:
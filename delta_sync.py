@@ -0,0 +1,94 @@
+"""
+Delta sync of exams and rosters for SVA Terminal
+
+The database sets updated_at on every insert and update of exams,
+students and student_courses. The log_deleted_row trigger records
+deletions in deleted_rows with a deleted_at. A terminal keeps the newest
+of these timestamps it has seen as a high-water mark and only asks for
+rows changed after it. They all come from the database clock, so one
+mark covers every table. Stamps are compared as instants, not strings,
+since PostgREST and the terminal may write them with different offsets.
+
+NOW() is taken when a transaction starts, but its rows only become
+visible at commit, so a slow transaction can commit a row stamped
+before the mark. Each request therefore re-reads SYNC_OVERLAP seconds
+before the mark, and callers drop rows identical to the ones they have.
+
+Supabase realtime could push the same changes, but it needs the async
+client and a websocket per kiosk; polling a few indexed columns keeps
+the terminal on the synchronous client it already uses.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from config import SYNC_OVERLAP, ROSTER_PAGE_SIZE
+from data_access import EXAM_FIELDS
+
+
+EARLIEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def stamp_moment(stamp):
+    """An ISO timestamp as an aware datetime for ordering; empty or invalid stamps sort first
+
+    Stamps without an offset are taken as UTC, like the database's.
+    """
+    try:
+        moment = datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return EARLIEST
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def newest_stamp(*stamps):
+    """The latest of some timestamps, ignoring empty ones; None if there are none"""
+    stamps = [stamp for stamp in stamps if stamp]
+    return max(stamps, key=stamp_moment) if stamps else None
+
+
+def overlap_since(stamp, seconds=SYNC_OVERLAP):
+    """The timestamp to ask for changes after, SYNC_OVERLAP before the mark"""
+    try:
+        moment = datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+    except ValueError:
+        return stamp
+    return (moment - timedelta(seconds=seconds)).isoformat()
+
+
+def fetch_deleted_rows(client, table, since, page_size=ROSTER_PAGE_SIZE):
+    """Logged deletions from one table after since, oldest first"""
+    rows = []
+    start = 0
+    while True:
+        page = client.table('deleted_rows').select('row_id, old_row, deleted_at') \
+            .eq('table_name', table).gt('deleted_at', since) \
+            .order('id').range(start, start + page_size - 1).execute().data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def fetch_exam_changes(client, since):
+    """Exams changed or deleted after since; returns (changed exams, deleted ids, high-water)"""
+    reread_from = overlap_since(since)
+    changed = client.table('exams').select(EXAM_FIELDS) \
+        .gt('updated_at', reread_from).order('exam_datetime').execute().data
+    deleted = fetch_deleted_rows(client, 'exams', reread_from)
+    # An exam deleted after its last change is gone; a later change wins
+    changed_at = {exam['id']: exam.get('updated_at') for exam in changed}
+    removed = {row['row_id'] for row in deleted
+               if stamp_moment(row['deleted_at']) >= stamp_moment(changed_at.get(row['row_id']))}
+    changed = [exam for exam in changed if exam['id'] not in removed]
+    high_water = newest_stamp(since, *changed_at.values(), *(row['deleted_at'] for row in deleted))
+    return changed, removed, high_water
+
+
+def apply_exam_changes(exams, changed, removed, today):
+    """The exam list after a delta, without exams before today, soonest first"""
+    merged = {exam['id']: exam for exam in exams}
+    merged.update((exam['id'], exam) for exam in changed)
+    for exam_id in removed:
+        merged.pop(exam_id, None)
+    return sorted((exam for exam in merged.values() if exam['exam_datetime'][:10] >= today),
+                  key=lambda exam: exam['exam_datetime'])
@@ -0,0 +1,266 @@
+"""
+Memory-mapped face embedding store for SVA Terminal
+
+File layout (little endian):
+
+    header   128 bytes  magic, format version, embedding dim, capacity,
+                        row count, CRC32 of the used rows, embedder model
+                        name, the roster stamp the rows were built from
+                        and the element type
+    ids      int64[capacity]          student id per row, -1 = tombstone
+    scales   float32[capacity]        per-row scale of int8 rows (1 otherwise)
+    matrix   dtype[capacity, dim]     one embedding per row
+
+Embeddings are stored as float32, float16 or int8 (EMBEDDING_DTYPE). An
+int8 row holds the embedding divided by its scale, max|x| / 127, which
+keeps cosine scores within about 0.005 of float32 at a quarter of the
+size.
+
+The arrays are opened with numpy.memmap, so opening a store is near
+instant and several processes share the same pages. Readers such as lane
+workers open it with readonly=True, which maps the file read-only. Rows are appended in
+place until capacity runs out, at which point the file is rewritten with
+twice the capacity. Removing a student tombstones its row.
+"""
+
+import logging
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from config import EMBEDDING_DTYPE
+
+MAGIC = b"SVAEMB\0\0"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sIIQQI16s32sI")
+HEADER_SIZE = 128
+TOMBSTONE = -1
+DTYPES = ('float32', 'float16', 'int8')  # header element type code -> name
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStoreError(Exception):
+    """Raised when a store file is corrupt, stale or incompatible"""
+
+
+def quantize(embedding, dtype):
+    """(row, scale) to store an embedding as dtype"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    if dtype == np.int8:
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        return np.round(vector / scale).astype(np.int8), scale
+    return vector.astype(dtype), 1.0
+
+
+def file_size(capacity, dim, dtype):
+    return HEADER_SIZE + capacity * 12 + capacity * dim * np.dtype(dtype).itemsize
+
+
+class EmbeddingStore:
+    """Append-only embedding matrix backed by a memory-mapped file"""
+
+    def __init__(self, path, ids, scales, matrix, count, model_name, source_stamp, checksum,
+                 readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.ids = ids
+        self.scales = scales
+        self.matrix = matrix
+        self.count = count
+        self.model_name = model_name
+        self.source_stamp = source_stamp
+        self.checksum = checksum
+        self._checksum_stale = False
+        self.rows = {int(sid): row for row, sid in enumerate(ids[:count]) if sid != TOMBSTONE}
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    @property
+    def capacity(self):
+        return len(self.ids)
+
+    @property
+    def dtype(self):
+        return self.matrix.dtype
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, student_id):
+        return student_id in self.rows
+
+    @classmethod
+    def create(cls, path, dim, model_name, capacity=1024, source_stamp="", dtype=EMBEDDING_DTYPE):
+        """Create an empty store file and open it"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(cls._pack_header(dim, capacity, 0, zlib.crc32(b""), model_name, source_stamp,
+                                     np.dtype(dtype)))
+            f.truncate(file_size(capacity, dim, dtype))
+        os.replace(tmp_path, path)
+        return cls.open(path, model_name=model_name)
+
+    @classmethod
+    def open(cls, path, model_name=None, verify=True, readonly=False):
+        """Open an existing store, checking format, model and checksum
+
+        A readonly store maps the file with mode 'r'; appending to it,
+        tombstoning a row or flushing raises EmbeddingStoreError.
+        """
+        with open(path, 'rb') as f:
+            raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE:
+            raise EmbeddingStoreError(f"Truncated embedding store header: {path}")
+        magic, version, dim, capacity, count, checksum, model, stamp, dtype_code = HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise EmbeddingStoreError(f"Not an embedding store: {path}")
+        if version != FORMAT_VERSION or dtype_code >= len(DTYPES):
+            raise EmbeddingStoreError(f"Unsupported embedding store version {version}: {path}")
+        stored_model = model.rstrip(b"\0").decode()
+        if model_name is not None and stored_model != model_name:
+            raise EmbeddingStoreError(
+                f"Embedding store built with {stored_model}, expected {model_name}: {path}")
+        dtype = np.dtype(DTYPES[dtype_code])
+        if os.path.getsize(path) != file_size(capacity, dim, dtype) or count > capacity:
+            raise EmbeddingStoreError(f"Embedding store size does not match header: {path}")
+
+        mode = 'r' if readonly else 'r+'
+        ids = np.memmap(path, dtype=np.int64, mode=mode, offset=HEADER_SIZE, shape=(capacity,))
+        scales = np.memmap(path, dtype=np.float32, mode=mode,
+                           offset=HEADER_SIZE + capacity * 8, shape=(capacity,))
+        matrix = np.memmap(path, dtype=dtype, mode=mode,
+                           offset=HEADER_SIZE + capacity * 12, shape=(capacity, dim))
+        store = cls(path, ids, scales, matrix, count, stored_model, stamp.rstrip(b"\0").decode(), checksum,
+                    readonly=readonly)
+        if verify and store.compute_checksum() != checksum:
+            raise EmbeddingStoreError(f"Embedding store checksum mismatch: {path}")
+        return store
+
+    @classmethod
+    def open_or_create(cls, path, dim, model_name, dtype=EMBEDDING_DTYPE):
+        """Open a store, starting a fresh one if it is missing, stale, corrupt or of another dtype"""
+        if os.path.exists(path):
+            try:
+                store = cls.open(path, model_name=model_name)
+                if store.dim == dim and store.dtype == np.dtype(dtype):
+                    return store
+                logger.info(f"Rebuilding embedding store as {dim}-d {dtype}: {path}")
+            except EmbeddingStoreError as e:
+                logger.warning(f"Rebuilding embedding store: {e}")
+        return cls.create(path, dim, model_name, dtype=dtype)
+
+    @staticmethod
+    def _pack_header(dim, capacity, count, checksum, model_name, source_stamp, dtype):
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, dim, capacity, count, checksum,
+                             model_name.encode()[:16], source_stamp.encode()[:32],
+                             DTYPES.index(dtype.name))
+        return header.ljust(HEADER_SIZE, b"\0")
+
+    def _check_writable(self):
+        if self.readonly:
+            raise EmbeddingStoreError(f"Embedding store opened read-only: {self.path}")
+
+    def flush(self):
+        """Write pending rows and the header (count, checksum) to disk"""
+        self._check_writable()
+        if self._checksum_stale:
+            self.checksum = self.compute_checksum()
+            self._checksum_stale = False
+        self.ids.flush()
+        self.scales.flush()
+        self.matrix.flush()
+        with open(self.path, 'r+b') as f:
+            f.write(self._pack_header(self.dim, self.capacity, self.count, self.checksum,
+                                      self.model_name, self.source_stamp, self.dtype))
+
+    def _row_checksum(self, row, crc):
+        crc = zlib.crc32(self.ids[row:row + 1].tobytes(), crc)
+        crc = zlib.crc32(self.scales[row:row + 1].tobytes(), crc)
+        return zlib.crc32(self.matrix[row].tobytes(), crc)
+
+    def compute_checksum(self):
+        """CRC32 over the used id, scale and matrix rows, record by record"""
+        crc = zlib.crc32(b"")
+        for row in range(self.count):
+            crc = self._row_checksum(row, crc)
+        return crc
+
+    def _grow(self):
+        self.flush()
+        new_capacity = self.capacity * 2
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._pack_header(self.dim, new_capacity, self.count, self.checksum,
+                                      self.model_name, self.source_stamp, self.dtype))
+            f.write(np.asarray(self.ids[:self.count]).tobytes())
+            f.seek(HEADER_SIZE + new_capacity * 8)
+            f.write(np.asarray(self.scales[:self.count]).tobytes())
+            f.seek(HEADER_SIZE + new_capacity * 12)
+            f.write(np.asarray(self.matrix[:self.count]).tobytes())
+            f.truncate(file_size(new_capacity, self.dim, self.dtype))
+        os.replace(tmp_path, self.path)
+        grown = EmbeddingStore.open(self.path, verify=False)
+        self.ids, self.scales, self.matrix = grown.ids, grown.scales, grown.matrix
+
+    def append(self, student_id, embedding, flush=True):
+        """Add or replace a student's embedding
+
+        Pass flush=False when adding many rows and call flush() once at the end.
+        """
+        self._check_writable()
+        if student_id in self.rows:
+            self.tombstone(student_id, flush=False)
+        if self.count == self.capacity:
+            self._grow()
+        row = self.count
+        self.ids[row] = student_id
+        self.matrix[row], self.scales[row] = quantize(embedding, self.dtype)
+        if not self._checksum_stale:
+            # Appends extend the running CRC instead of rehashing every row
+            self.checksum = self._row_checksum(row, self.checksum)
+        self.count += 1
+        self.rows[student_id] = row
+        if flush:
+            self.flush()
+
+    def tombstone(self, student_id, flush=True):
+        """Remove a student; the row stays in the file but never matches"""
+        self._check_writable()
+        row = self.rows.pop(student_id, None)
+        if row is None:
+            return False
+        self.ids[row] = TOMBSTONE
+        self.scales[row] = 1.0
+        self.matrix[row] = 0
+        self._checksum_stale = True
+        if flush:
+            self.flush()
+        return True
+
+    def set_source_stamp(self, stamp):
+        """Record which roster version the stored embeddings reflect"""
+        self.source_stamp = stamp or ""
+        self.flush()
+
+    def embedding(self, student_id):
+        """A student's embedding as float32, or None"""
+        row = self.rows.get(student_id)
+        if row is None:
+            return None
+        return self.matrix[row].astype(np.float32) * self.scales[row]
+
+    def live_view(self):
+        """(ids, matrix, scales) views of the used rows, including tombstones
+
+        scales is None unless rows are int8.
+        """
+        scales = self.scales[:self.count] if self.dtype == np.int8 else None
+        return self.ids[:self.count], self.matrix[:self.count], scales
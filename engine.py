@@ -0,0 +1,676 @@
+"""
+Verification engine for SVA Terminal
+
+One exam session without any widgets: the roster cache and its polling,
+the face gallery, the fingerprint sensor, the camera (or frames handed
+in through the API), orchestrated attempts, repeat-scan checks and
+attendance logging. It only needs QtCore, so it runs under a
+QCoreApplication in the headless engine service (engine_service.py),
+in benchmarks and in load tests, as well as inside the kiosk UI.
+Between attempts a PowerGovernor (governor.py) keeps the camera at a
+low frame rate and starts an attempt when someone steps up.
+
+The kiosk's VerificationScreen is a view over an engine. It drives the
+engine with start_attempt() and cancel_attempt() and shows what the
+engine's signals report. RemoteEngine (engine_client.py) has the same
+signals and methods, for a UI talking to an engine in another process
+or on another machine. EVENTS maps each signal to the event the API
+streams for it. VerificationAttempt runs a single attempt, with its
+repeat-scan checks and attendance logging, for the engine and for each
+lane of the multi-lane kiosk.
+"""
+
+import logging
+import time
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from config import (FACE_RECOGNITION_TIMEOUT, FINGERPRINT_TIMEOUT, MAX_FINGERPRINT_ATTEMPTS,
+                    ROSTER_SYNC_INTERVAL, MATRIC_LOOKUP_RESULTS, AUTO_START)
+from attendance_queue import attendance_record
+from fingerprint import FingerprintSensor, FingerprintLoadThread
+from orchestrator import VerificationOrchestrator, FINGERPRINT
+from instrumentation import metrics, VERIFICATION_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# Attempt outcomes
+VERIFIED = 'verified'
+FAILED = 'failed'
+ALREADY_VERIFIED = 'already_verified'
+
+# Student fields shown to the invigilator; templates and file paths stay in the engine
+PUBLIC_FIELDS = ('id', 'matric_number', 'name', 'class', 'department', 'faculty')
+
+# API event type -> (engine signal, event fields in signal argument order)
+EVENTS = {
+    'camera_ready': ('camera_ready', ('seconds',)),
+    'camera_error': ('camera_error', ('message',)),
+    'roster_ready': ('roster_ready', ('students', 'changed')),
+    'gallery_ready': ('gallery_ready', ('faces',)),
+    'sensor_ready': ('sensor_ready', ('fingerprints',)),
+    'attempt_started': ('attempt_started', ('student',)),
+    'stage': ('stage_changed', ('modality', 'status')),
+    'student': ('student_identified', ('student',)),
+    'attempt_finished': ('attempt_finished', ('outcome',)),
+}
+
+
+# Engines and screens whose worker threads are still stopping after end();
+# holding them here keeps the QThread objects alive until the threads exit
+_ending = set()
+
+
+def finish_ending_engines():
+    """Wait for every ended engine or screen to finish its teardown, for application shutdown"""
+    for engine in list(_ending):
+        for thread in list(engine.stopping):
+            thread.wait()
+        engine.finish_end()
+
+
+class DeferredTeardown:
+    """Ends a session without waiting on its worker threads on the GUI thread
+
+    For QObjects with a torn_down signal. Once the threads have been asked
+    to stop, end_when_stopped() hands them over; teardown() runs when the
+    last one has exited, and torn_down is emitted after it. Engines with
+    a capture and an ended flag start the camera through start_capture(),
+    which waits for ended sessions to release the device first.
+    """
+    stopping = frozenset()  # threads still being waited on
+    is_torn_down = False
+
+    def end_when_stopped(self, threads):
+        threads = [thread for thread in threads if isinstance(thread, QThread)]
+        _ending.add(self)
+        # Connected before checking isRunning() so an exit in between is not missed
+        for thread in threads:
+            thread.finished.connect(self.on_thread_stopped)
+        self.stopping = {thread for thread in threads if thread.isRunning()}
+        if not self.stopping:
+            self.finish_end()
+
+    def on_thread_stopped(self):
+        self.stopping.discard(self.sender())
+        if not self.stopping:
+            self.finish_end()
+
+    def finish_end(self):
+        if self.is_torn_down:
+            return
+        self.is_torn_down = True
+        self.stopping = set()
+        _ending.discard(self)
+        self.teardown()
+        self.torn_down.emit()
+
+    def teardown(self):
+        """Release what the threads were using; runs once, after they have all exited"""
+
+    def start_capture(self):
+        """Start the camera thread once no ended session is still releasing the device"""
+        if self.ended or self.capture.isRunning():
+            return
+        if isinstance(self.capture, QThread):
+            releasing = [engine.capture for engine in _ending
+                         if isinstance(getattr(engine, 'capture', None), QThread)
+                         and engine.capture is not self.capture]
+            for capture in releasing:
+                capture.finished.connect(self.start_capture)
+            if any(capture.isRunning() for capture in releasing):
+                return
+        self.capture.start()
+
+
+def public_record(student):
+    """The display fields of a roster record, or None"""
+    if student is None:
+        return None
+    return {field: student.get(field) for field in PUBLIC_FIELDS}
+
+
+class FaceRecognitionThread(QThread):
+    """Thread for face recognition processing"""
+    face_detected = pyqtSignal(bool, str)  # success, message
+    face_identified = pyqtSignal(int, float)  # student id, similarity
+    stage_timings = pyqtSignal(dict)  # per-frame detect/track timing summary
+
+    def __init__(self, capture, face_cascade, embedder, gallery, on_faces=None):
+        super().__init__()
+        self.capture = capture
+        self.face_cascade = face_cascade
+        self.embedder = embedder
+        self.gallery = gallery
+        self.on_faces = on_faces  # called with each frame's face boxes (live preview)
+        self.running = True
+
+    def run(self):
+        from camera import CameraUnavailable
+        from face_detection import AdaptiveFaceDetector
+        from face_quality import run_face_attempt
+
+        detector = AdaptiveFaceDetector(self.face_cascade)
+        try:
+            if self.gallery is None or len(self.gallery) == 0:
+                self.face_detected.emit(False, "No enrolled faces available")
+                return
+
+            last_seq = 0
+
+            def next_frame():
+                nonlocal last_seq
+                # Pull the newest frame from the shared capture service; this
+                # paces the loop to the camera and skips frames we fell behind on
+                latest = self.capture.wait_for_frame(last_seq, timeout=0.5)
+                if latest is None:
+                    if not self.capture.isRunning():
+                        raise CameraUnavailable("Camera not available")
+                    return None
+                last_seq = latest[0]
+                return latest[2]
+
+            result = run_face_attempt(next_frame, detector, self.embedder, self.gallery,
+                                      FACE_RECOGNITION_TIMEOUT, lambda: self.running, self.on_faces)
+            if result is not None:
+                self.emit_result(*result)
+
+        except CameraUnavailable as e:
+            self.face_detected.emit(False, str(e))
+        except Exception as e:
+            self.face_detected.emit(False, f"Face recognition error: {str(e)}")
+        finally:
+            self.stage_timings.emit(detector.timing_summary())
+
+    def emit_result(self, decision, frames_kept):
+        """Report a finished attempt to the orchestrator"""
+        if decision:
+            self.face_identified.emit(*decision)
+            self.face_detected.emit(True, "Face recognized successfully")
+        elif frames_kept:
+            self.face_detected.emit(False, "Face not recognized")
+        else:
+            self.face_detected.emit(False, "Face recognition timeout")
+
+    def stop(self):
+        self.running = False
+
+
+class FingerprintThread(QThread):
+    """Thread for fingerprint authentication"""
+    fingerprint_verified = pyqtSignal(bool, str)  # success, message
+    fingerprint_identified = pyqtSignal(int, int)  # student id, sensor accuracy score
+    fingerprint_retry = pyqtSignal(int)  # attempts left
+
+    def __init__(self, sensor, expected_student_id=None):
+        super().__init__()
+        self.sensor = sensor
+        self.expected_student_id = expected_student_id
+        self.running = True
+
+    def run(self):
+        try:
+            if not self.sensor.connected:
+                self.fingerprint_verified.emit(False, "Fingerprint scanner not available")
+                return
+
+            for attempt in range(1, MAX_FINGERPRINT_ATTEMPTS + 1):
+                # Matching happens on the sensor against the preloaded roster
+                result = self.sensor.identify(FINGERPRINT_TIMEOUT, lambda: self.running)
+                if not self.running:
+                    return
+                if result is None:
+                    self.fingerprint_verified.emit(False, "Fingerprint scan timeout")
+                    return
+
+                student_id, accuracy = result
+                if student_id is not None and self.expected_student_id in (None, student_id):
+                    self.fingerprint_identified.emit(student_id, accuracy)
+                    self.fingerprint_verified.emit(True, "Fingerprint verified successfully")
+                    return
+
+                if attempt < MAX_FINGERPRINT_ATTEMPTS:
+                    self.fingerprint_retry.emit(MAX_FINGERPRINT_ATTEMPTS - attempt)
+                    time.sleep(1)  # give the student time to lift and re-place the finger
+
+            self.fingerprint_verified.emit(False, "Fingerprint verification failed")
+
+        except Exception as e:
+            self.fingerprint_verified.emit(False, f"Fingerprint error: {str(e)}")
+
+    def stop(self):
+        self.running = False
+
+
+class VerificationAttempt(QObject):
+    """One orchestrated attempt: stage progress, repeat-scan checks and attendance logging
+
+    Shared by VerificationEngine and the multi-lane kiosk's lanes, which
+    supply the modality threads and report what the signals say. With a
+    claimed student (picked by matric number) only the fingerprint can
+    verify them; face_thread is None then.
+    """
+    stage_changed = pyqtSignal(str, str)  # modality, status text
+    student_identified = pyqtSignal(object)  # roster record of the student in front of the kiosk
+    finished = pyqtSignal(str, object, object, str)  # outcome, roster record, method, message
+
+    def __init__(self, roster, exam_id, attendance_queue, face_thread, fingerprint_thread,
+                 claimed_student=None):
+        super().__init__()
+        self.roster = roster
+        self.exam_id = exam_id
+        self.attendance_queue = attendance_queue
+        self.face_thread = face_thread
+        self.fingerprint_thread = fingerprint_thread
+        self.current_student = claimed_student
+        self.started = None
+        if claimed_student is None:
+            # Fingerprint runs 1:N on the sensor; the orchestrator checks both
+            # modalities agree on the student
+            self.orchestrator = VerificationOrchestrator()
+        else:
+            # A typed matric number is only a claim, and a 1:1 face match at
+            # FACE_MATCH_THRESHOLD is too weak to back it, so the fingerprint decides
+            self.orchestrator = VerificationOrchestrator(policy='either')
+        self.orchestrator.stage_result.connect(self.on_stage_result)
+        self.orchestrator.decided.connect(self.on_verification_decided)
+        if face_thread is not None:
+            face_thread.face_identified.connect(self.on_face_identified)
+        fingerprint_thread.fingerprint_retry.connect(self.on_fingerprint_retry)
+
+    @property
+    def active(self):
+        return self.orchestrator.active
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.orchestrator.start(self.face_thread, self.fingerprint_thread)
+
+    def cancel(self):
+        """Stop any modality that is still running"""
+        self.orchestrator.cancel()
+
+    def on_face_identified(self, student_id, score):
+        """Show the student as soon as the face stage identifies them"""
+        self.show_student(student_id)
+
+    def show_student(self, student_id):
+        self.current_student = self.roster.get(student_id) or self.current_student
+        if self.current_student:
+            self.student_identified.emit(self.current_student)
+
+    def on_stage_result(self, modality, success, student_id, message):
+        """Report per-modality progress while the other modality keeps running"""
+        self.stage_changed.emit(modality, "matched" if success else "failed")
+        # A face match alone is not trusted to turn a student away: a false
+        # match onto someone already verified would block a genuine student
+        if success and modality == FINGERPRINT and self.suppress_repeat_scan(student_id):
+            return
+        if success and self.current_student is None:
+            self.show_student(student_id)
+
+    def suppress_repeat_scan(self, student_id):
+        """Stop the attempt if the student is already verified for this exam
+
+        Returns True when the scan was a repeat; nothing is written for it.
+        """
+        if not self.attendance_queue.is_verified(self.exam_id, student_id):
+            return False
+        self.orchestrator.cancel()
+        self.current_student = self.roster.get(student_id)
+        self.finished.emit(ALREADY_VERIFIED, self.current_student, None,
+                           "This student has already been verified for this exam")
+        return True
+
+    def on_fingerprint_retry(self, attempts_left):
+        """Ask the student to scan again"""
+        self.stage_changed.emit(FINGERPRINT, f"not matched, {attempts_left} tries left")
+
+    def on_verification_decided(self, success, student_id, method, message):
+        """Handle the fused verification result"""
+        # Another lane or terminal may have verified the student meanwhile
+        if success and self.suppress_repeat_scan(student_id):
+            return
+        metrics.record(VERIFICATION_TOTAL, (time.perf_counter() - self.started) * 1000)
+        metrics.record_outcome(success, self.exam_id)
+        if student_id >= 0:
+            self.current_student = self.roster.get(student_id) or self.current_student
+
+        self.log_attendance("Verified" if success else "Failed", method)
+        self.finished.emit(VERIFIED if success else FAILED, self.current_student, method, message)
+
+    def log_attendance(self, status, method='biometric'):
+        """Queue attendance locally; AttendanceSyncThread uploads it to Supabase"""
+        try:
+            if self.current_student:
+                self.attendance_queue.enqueue(attendance_record(
+                    self.exam_id, self.current_student['id'], status, method))
+
+        except Exception as e:
+            logger.error(f"Error queueing attendance: {e}")
+
+
+class VerificationEngine(QObject, DeferredTeardown):
+    """One exam's verification session: roster, gallery, sensor, camera and attempts"""
+    camera_ready = pyqtSignal(float)  # time to first frame in seconds
+    camera_error = pyqtSignal(str)
+    roster_ready = pyqtSignal(int, int)  # students, changed or removed in this refresh
+    gallery_ready = pyqtSignal(int)  # enrolled faces
+    sensor_ready = pyqtSignal(int)  # fingerprint templates on the sensor
+    attempt_started = pyqtSignal(object)  # picked student (public record) or None
+    stage_changed = pyqtSignal(str, str)  # modality, status text
+    student_identified = pyqtSignal(dict)  # public record of the student in front of the kiosk
+    attempt_finished = pyqtSignal(dict)  # outcome, student, method, message, claimed
+    torn_down = pyqtSignal()  # after end(): threads stopped, camera and sensor released
+
+    def __init__(self, supabase_client, exam_data, attendance_queue, capture=None, on_faces=None,
+                 power_saving=True, auto_start=AUTO_START):
+        """capture is any CaptureService-like frame source; a CaptureService is opened if None
+
+        With power_saving, a PowerGovernor idles the camera between
+        attempts, and with auto_start as well, it starts an attempt when
+        someone steps up to the kiosk.
+        """
+        from camera import CaptureService
+
+        super().__init__()
+        self.supabase = supabase_client
+        self.exam_data = exam_data
+        self.attendance_queue = attendance_queue
+        self.capture = capture if capture is not None else CaptureService()
+        self.on_faces = on_faces  # face boxes of each frame, for a live preview
+        self.power_saving = power_saving
+        self.auto_start = auto_start and power_saving
+        self.governor = None
+        self.claimed_student_id = None  # student picked by matric number for this attempt
+        self.face_thread = None
+        self.fingerprint_thread = None
+        self.attempt = None
+        self.fingerprint_sensor = FingerprintSensor()
+        self.fingerprint_load_thread = None
+        self.fingerprints_stale = False
+        self.gallery = None
+        self.gallery_thread = None
+        self.gallery_stale = False
+        self.roster = None
+        self.roster_thread = None
+        self.ended = False
+        self.close_on_end = False
+
+    def start(self):
+        """Open the camera and load the roster, gallery and sensor in the background"""
+        from camera import load_face_cascade
+        from face_engine import FaceEmbedder
+
+        metrics.begin_session(self.exam_data['id'])
+        self.capture.camera_ready.connect(self.on_camera_ready)
+        self.capture.camera_error.connect(self.camera_error)
+        self.start_capture()
+        self.face_cascade = load_face_cascade()
+        self.embedder = FaceEmbedder()
+        if self.power_saving:
+            self.start_governor()
+        self.load_roster()
+
+    def start_governor(self):
+        from camera import load_face_cascade
+        from governor import PowerGovernor
+
+        self.governor = PowerGovernor(self.capture, load_face_cascade(shared=False))
+        self.governor.person_approached.connect(self.on_person_approached)
+        self.governor.start()
+
+    def on_person_approached(self):
+        """Start an attempt for whoever stepped up, if auto-start is on and the gallery is ready"""
+        if self.attempt_active:
+            return
+        if not (self.auto_start and self.gallery is not None and self.start_attempt()):
+            self.governor.attempt_finished()
+
+    def hold_auto_start(self, held):
+        """Keep the governor from starting attempts, e.g. while the matric keypad is open"""
+        if self.governor is not None:
+            self.governor.hold(held)
+
+    @property
+    def attempt_active(self):
+        return self.attempt is not None and self.attempt.active
+
+    def status(self):
+        """Session state for the API and monitoring"""
+        return {
+            'exam_id': self.exam_data['id'],
+            'students': len(self.roster) if self.roster is not None else 0,
+            'faces': len(self.gallery) if self.gallery is not None else 0,
+            'fingerprints': len(self.fingerprint_sensor.slots),
+            'camera': self.capture.isRunning(),
+            'attempt_active': self.attempt_active,
+            'governor': self.governor.state if self.governor is not None else None,
+        }
+
+    def search(self, query, limit=MATRIC_LOOKUP_RESULTS):
+        """Roster students matching a matric number or name prefix"""
+        return [public_record(student) for student in self.roster.search(query, limit)]
+
+    def on_camera_ready(self, time_to_first_frame):
+        logger.info(f"Camera ready: time to first frame {time_to_first_frame * 1000:.0f} ms")
+        self.camera_ready.emit(time_to_first_frame)
+
+    def load_roster(self):
+        """Load the cached exam roster and refresh it in the background
+
+        A cached (usually prefetched) roster is used straight away, and
+        the refresh runs once the gallery is built from it. Without a
+        cache, the gallery and sensor wait for the refresh.
+        """
+        from roster_cache import RosterLoadThread, open_roster
+
+        self.roster = open_roster(self.exam_data)
+        self.roster.mark_used()
+        self.roster_thread = RosterLoadThread(self.supabase, self.roster, ROSTER_SYNC_INTERVAL)
+        self.roster_thread.roster_loaded.connect(self.on_roster_loaded)
+        self.roster_thread.roster_failed.connect(self.on_roster_failed)
+        if len(self.roster):
+            logger.info(f"Starting from {len(self.roster)} cached students")
+            self.roster_ready.emit(len(self.roster), 0)
+            self.build_gallery()
+            self.load_fingerprints()
+        else:
+            self.roster_thread.start()
+
+    def refresh_roster(self):
+        """Start the deferred refresh of a cached roster, once"""
+        if not self.ended and not self.roster_thread.isRunning() \
+                and not self.roster_thread.isFinished():
+            self.roster_thread.start()
+
+    def on_roster_loaded(self, total, changed):
+        """Report roster cache state once the refresh finishes"""
+        if self.ended:
+            return
+        logger.info(f"Roster ready: {total} students cached ({changed} updated)")
+        self.roster_ready.emit(total, changed)
+        if self.gallery_thread is None or changed:
+            self.build_gallery()
+            self.load_fingerprints()
+
+    def on_roster_failed(self, message):
+        """Keep verifying from the cached roster when the refresh fails"""
+        if self.ended:
+            return
+        logger.warning(f"{message}; using {len(self.roster)} cached students")
+        if self.gallery_thread is None:
+            self.build_gallery()
+            self.load_fingerprints()
+
+    def load_fingerprints(self):
+        """Upload the roster's fingerprint templates into the sensor"""
+        if self.fingerprint_load_thread is not None and self.fingerprint_load_thread.isRunning():
+            # The roster changed while uploading; upload again once this load ends
+            self.fingerprints_stale = True
+            return
+        self.fingerprints_stale = False
+        self.fingerprint_load_thread = FingerprintLoadThread(self.fingerprint_sensor, self.roster)
+        self.fingerprint_load_thread.templates_loaded.connect(self.on_templates_loaded)
+        self.fingerprint_load_thread.load_failed.connect(self.on_fingerprint_load_failed)
+        self.fingerprint_load_thread.finished.connect(self.on_fingerprint_load_finished)
+        self.fingerprint_load_thread.start()
+
+    def on_templates_loaded(self, count):
+        """Report how many templates the sensor can match locally"""
+        logger.info(f"Fingerprint sensor ready: {count} templates loaded")
+        self.sensor_ready.emit(count)
+
+    def on_fingerprint_load_failed(self, message):
+        """Keep the session usable when the sensor cannot be prepared"""
+        logger.warning(message)
+
+    def on_fingerprint_load_finished(self):
+        if self.fingerprints_stale and not self.ended:
+            self.load_fingerprints()
+
+    def build_gallery(self):
+        """Compute face embeddings for the roster in the background"""
+        from camera import load_face_cascade
+        from face_engine import GalleryBuildThread
+
+        if self.gallery_thread is not None and self.gallery_thread.isRunning():
+            # The roster changed during the build; build again once it ends
+            self.gallery_stale = True
+            return
+        self.gallery_stale = False
+        self.gallery_thread = GalleryBuildThread(self.roster, self.embedder,
+                                                 load_face_cascade(shared=False))
+        self.gallery_thread.gallery_ready.connect(self.on_gallery_ready)
+        self.gallery_thread.gallery_failed.connect(self.on_gallery_failed)
+        self.gallery_thread.start()
+
+    def on_gallery_ready(self, gallery):
+        """Swap in the freshly built face gallery"""
+        if self.ended:
+            return
+        self.gallery = gallery
+        footprint = self.roster.footprint()
+        per_student = footprint['memory_bytes_per_student'] + gallery.memory_bytes / max(len(gallery), 1)
+        metrics.set_gauge('cache_bytes_per_student', round(per_student))
+        logger.info(f"Face gallery ready: {len(gallery)} enrolled faces; "
+                    f"{per_student / 1024:.1f} KB in memory per student")
+        self.gallery_ready.emit(len(gallery))
+        self.on_gallery_done()
+
+    def on_gallery_failed(self, message):
+        logger.warning(message)
+        self.on_gallery_done()
+
+    def on_gallery_done(self):
+        if self.ended:
+            return
+        if self.gallery_stale:
+            self.build_gallery()
+        self.refresh_roster()
+
+    def start_attempt(self, claimed_student_id=None):
+        """Verify whoever is at the kiosk, or the student picked by matric number
+
+        With a picked student, only the fingerprint can verify them: it
+        counts if the sensor finds their template, and the face is not
+        checked. Returns False if no attempt was started: one is already
+        running, the picked student is not on the roster, or they were
+        already verified.
+        """
+        if self.ended or self.attempt_active:
+            return False
+        self.claimed_student_id = claimed_student_id
+        claimed_student = None
+        if claimed_student_id is not None:
+            claimed_student = self.roster.get(claimed_student_id)
+            if claimed_student is None:
+                return False
+            if self.attendance_queue.is_verified(self.exam_data['id'], claimed_student_id):
+                self.finish_attempt(ALREADY_VERIFIED, claimed_student, None,
+                                    "This student has already been verified for this exam")
+                return False
+
+        self.face_thread = None
+        if claimed_student_id is None:
+            self.face_thread = FaceRecognitionThread(self.capture, self.face_cascade,
+                                                     self.embedder, self.gallery, self.on_faces)
+            self.face_thread.stage_timings.connect(self.on_face_timings)
+        self.fingerprint_thread = FingerprintThread(self.fingerprint_sensor, claimed_student_id)
+
+        self.attempt = VerificationAttempt(self.roster, self.exam_data['id'], self.attendance_queue,
+                                           self.face_thread, self.fingerprint_thread, claimed_student)
+        self.attempt.stage_changed.connect(self.stage_changed)
+        self.attempt.student_identified.connect(
+            lambda student: self.student_identified.emit(public_record(student)))
+        self.attempt.finished.connect(self.finish_attempt)
+        if self.governor is not None:
+            self.governor.attempt_started()
+        self.attempt_started.emit(public_record(claimed_student))
+        self.attempt.start()
+        return True
+
+    def cancel_attempt(self):
+        """Stop any modality that is still running"""
+        if self.governor is not None and self.attempt_active:
+            self.governor.attempt_finished()
+        if self.attempt:
+            self.attempt.cancel()
+        self.claimed_student_id = None
+
+    def on_face_timings(self, summary):
+        """Report per-frame detection and tracking cost for this attempt"""
+        for mode, stats in summary.items():
+            logger.debug(f"Face {mode}: {stats['frames']} frames, "
+                         f"mean {stats['mean_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+
+    def finish_attempt(self, outcome, student, method, message):
+        if self.governor is not None:
+            self.governor.attempt_finished()
+        self.attempt_finished.emit({
+            'outcome': outcome,
+            'student': public_record(student),
+            'method': method,
+            'message': message,
+            'claimed': self.claimed_student_id is not None,
+        })
+
+    def end(self, close_exam=False):
+        """Stop worker threads, release the camera and the sensor, without blocking
+
+        Every thread is asked to stop, and the rest of the teardown runs
+        once the last one has exited; torn_down is emitted then. With
+        close_exam, the exam is reconciled as well: absentees are written
+        and a summary is published (see reconciliation.py).
+        """
+        if self.ended:
+            return
+        self.ended = True
+        self.close_on_end = close_exam
+        metrics.end_session(self.exam_data['id'])
+        self.cancel_attempt()
+        # CaptureService releases the device when its thread exits
+        for worker in (self.roster_thread, self.gallery_thread, self.governor, self.capture):
+            if worker is not None:
+                worker.stop()
+
+        self.end_when_stopped((self.face_thread, self.fingerprint_thread, self.roster_thread,
+                               self.gallery_thread, self.fingerprint_load_thread,
+                               self.governor, self.capture))
+
+    def teardown(self):
+        """Close the sensor and reconcile the exam once every thread has exited"""
+        self.fingerprint_sensor.close()
+        self.face_thread = self.fingerprint_thread = self.attempt = None
+        self.gallery = None
+        if self.close_on_end:
+            self.close_exam()
+
+    def close_exam(self):
+        """Reconcile the exam against the cached roster on a data service worker"""
+        from reconciliation import submit_close
+
+        if self.roster is None or not len(self.roster):
+            logger.warning(f"Exam {self.exam_data['id']} not reconciled: no roster is loaded")
+            return
+        submit_close(self.supabase, self.attendance_queue, self.exam_data, self.roster.students)
@@ -0,0 +1,403 @@
+"""
+Client for the headless engine service (engine_service.py)
+
+EngineClient wraps the service's HTTP API, over a Unix socket
+('unix:path/to/engine.sock') or TCP ('http://host:port'). RemoteEngine
+puts the same signals and methods as VerificationEngine on top of it,
+so VerificationScreen can drive an engine in another process, or on a
+stronger machine, when ENGINE_ADDRESS is set.
+
+A RemoteEngine keeps the camera local: the preview shows local frames,
+and during an attempt frames are sent to the engine as JPEGs at
+ENGINE_FRAME_RATE. Events come back over one long-lived streaming
+request. The fingerprint sensor is attached to the engine's machine.
+Face boxes are not drawn on the preview, since the engine does not
+stream them. The UI's own PowerGovernor watches the local camera between
+attempts and asks the engine for an attempt when someone steps up.
+
+Requests carry ENGINE_API_TOKEN in the X-Engine-Token header when it is
+set, as the service then requires.
+
+RemoteEngine is called from the GUI thread, so it never waits on the
+network or its own threads for long. Cancelling an attempt and ending
+the session run on a request worker; like VerificationEngine.end(),
+end() returns at once and torn_down follows when its threads exit. Starting an attempt goes through the same worker, so it
+cannot overtake a cancel. The UI waits at most ENGINE_INTERACTIVE_TIMEOUT
+for that call, and for a matric search.
+"""
+
+import http.client
+import json
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import urlencode, urlsplit
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from config import (CONNECTION_TIMEOUT, ENGINE_FRAME_RATE, ENGINE_JPEG_QUALITY, ENGINE_HEARTBEAT,
+                    ENGINE_INTERACTIVE_TIMEOUT, ENGINE_API_TOKEN, MATRIC_LOOKUP_RESULTS, AUTO_START)
+from engine import EVENTS, DeferredTeardown
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Engine-Token'
+
+
+class EngineError(Exception):
+    """The engine service rejected a request"""
+
+
+def parse_address(address):
+    """('unix', socket path) or ('tcp', (host, port)) for an engine address"""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    parts = urlsplit(address if '//' in address else f"http://{address}")
+    if parts.scheme != 'http' or not parts.hostname or not parts.port:
+        raise ValueError(f"Engine address must be unix:PATH or http://HOST:PORT, not {address!r}")
+    return 'tcp', (parts.hostname, parts.port)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket"""
+
+    def __init__(self, path, timeout=CONNECTION_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class EngineClient:
+    """Blocking calls to the engine service; one connection per request"""
+
+    def __init__(self, address, timeout=CONNECTION_TIMEOUT, token=ENGINE_API_TOKEN):
+        self.address = address
+        self.kind, self.target = parse_address(address)
+        self.timeout = timeout
+        self.token = token
+
+    def headers(self, content_type=None):
+        headers = {TOKEN_HEADER: self.token} if self.token is not None else {}
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        return headers
+
+    def connection(self, timeout=None):
+        timeout = timeout or self.timeout
+        if self.kind == 'unix':
+            return UnixHTTPConnection(self.target, timeout)
+        return http.client.HTTPConnection(*self.target, timeout=timeout)
+
+    def request(self, method, path, body=None, content_type='application/json', timeout=None):
+        """Send one request; returns the decoded JSON reply (None when empty)"""
+        if body is not None and content_type == 'application/json':
+            body = json.dumps(body).encode()
+        headers = self.headers(content_type if body is not None else None)
+        connection = self.connection(timeout)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        reply = json.loads(data) if data else None
+        if response.status >= 400:
+            raise EngineError((reply or {}).get('error') or f"HTTP {response.status}")
+        return reply
+
+    def status(self):
+        return self.request('GET', '/status')
+
+    def start_session(self, exam):
+        """Start a session for an exam row; returns {'session', 'after'}"""
+        return self.request('POST', '/session', {'exam': exam})
+
+    def end_session(self, close_exam=False):
+        self.request('DELETE', '/session?close=1' if close_exam else '/session')
+
+    def start_attempt(self, student_id=None):
+        return self.request('POST', '/attempts', {'student_id': student_id})['started']
+
+    def cancel_attempt(self):
+        self.request('DELETE', '/attempts')
+
+    def search(self, query, limit=MATRIC_LOOKUP_RESULTS, timeout=None):
+        return self.request('GET', '/search?' + urlencode({'q': query, 'limit': limit}),
+                            timeout=timeout)
+
+    def submit_frame(self, jpeg):
+        self.request('POST', '/frames', jpeg, 'image/jpeg')
+
+    def events(self, after=0, on_connect=None):
+        """Yield events after a sequence number as they happen, heartbeats included
+
+        on_connect is called with the open connection, so another thread
+        can close it to end the stream.
+        """
+        connection = self.connection(timeout=ENGINE_HEARTBEAT * 3)
+        try:
+            connection.request('GET', '/events?' + urlencode({'after': after}), headers=self.headers())
+            if on_connect:
+                on_connect(connection)
+            response = connection.getresponse()
+            if response.status >= 400:
+                raise EngineError(f"Event stream refused: HTTP {response.status}")
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            connection.close()
+
+
+class EventStreamThread(QThread):
+    """Start the remote session, then follow its events, reconnecting as needed"""
+    event_received = pyqtSignal(dict)
+    stream_failed = pyqtSignal(str)
+
+    def __init__(self, client, exam):
+        super().__init__()
+        self.client = client
+        self.exam = exam
+        self.session = None
+        self.after = 0
+        self.running = True
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        failing = False
+        while self.running:
+            try:
+                if self.session is None or self.client.status().get('session') != self.session:
+                    # First connection, or the service restarted and lost the session
+                    started = self.client.start_session(self.exam)
+                    self.session, self.after = started['session'], started['after']
+                for event in self.client.events(self.after, self.set_connection):
+                    if not self.running:
+                        break
+                    failing = False
+                    if event['type'] == 'heartbeat':
+                        continue
+                    self.after = event['seq']
+                    if event.get('session') == self.session:
+                        self.event_received.emit(event)
+            except Exception as e:
+                if self.running and not failing:
+                    self.stream_failed.emit(f"Engine unavailable: {e}")
+                failing = True
+            if self.running:
+                time.sleep(1)
+
+    def set_connection(self, connection):
+        # The socket itself: the connection lets go of it once the response is open
+        with self._lock:
+            self._sock = connection.sock
+
+    def stop(self):
+        self.running = False
+        with self._lock:
+            sock = self._sock
+        # Unblocks the read the stream is waiting in
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class FrameUploader(QThread):
+    """Send the newest camera frame to the engine while an attempt runs"""
+
+    def __init__(self, client, engine, rate=ENGINE_FRAME_RATE, quality=ENGINE_JPEG_QUALITY):
+        super().__init__()
+        self.client = client
+        self.engine = engine
+        self.interval = 1.0 / rate
+        self.quality = quality
+        self.running = True
+        self._frame = None
+        self._new_frame = threading.Event()
+
+    def offer_frame(self, seq, frame):
+        """Frame listener; called on the capture thread, so it only keeps a reference"""
+        self._frame = frame
+        self._new_frame.set()
+
+    def run(self):
+        import cv2
+
+        failing = False
+        while self.running:
+            started = time.perf_counter()
+            if not self._new_frame.wait(0.5):
+                continue
+            self._new_frame.clear()
+            if not self.engine.attempt_active:
+                continue
+            ok, jpeg = cv2.imencode('.jpg', self._frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            try:
+                if ok:
+                    self.client.submit_frame(jpeg.tobytes())
+                failing = False
+            except Exception as e:
+                if not failing:
+                    logger.warning(f"Could not send frames to the engine: {e}")
+                failing = True
+            time.sleep(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def stop(self):
+        self.running = False
+        self._new_frame.set()
+
+
+class RemoteEngine(QObject, DeferredTeardown):
+    """VerificationEngine's interface, served by an engine service"""
+    camera_ready = pyqtSignal(float)
+    camera_error = pyqtSignal(str)
+    roster_ready = pyqtSignal(int, int)
+    gallery_ready = pyqtSignal(int)
+    sensor_ready = pyqtSignal(int)
+    attempt_started = pyqtSignal(object)
+    stage_changed = pyqtSignal(str, str)
+    student_identified = pyqtSignal(dict)
+    attempt_finished = pyqtSignal(dict)
+    torn_down = pyqtSignal()  # after end(): threads stopped, the session ended on the service
+
+    def __init__(self, address, exam_data, capture=None, power_saving=True, auto_start=AUTO_START):
+        from camera import CaptureService
+
+        super().__init__()
+        self.client = EngineClient(address)
+        self.exam_data = exam_data
+        self.capture = capture if capture is not None else CaptureService()
+        self.on_faces = None  # face boxes are not streamed by the service
+        self.power_saving = power_saving
+        self.auto_start = auto_start and power_saving
+        self.governor = None
+        self.gallery_faces = 0
+        self.attempt_active = False
+        self.ended = False
+        self.close_on_end = False
+        self.events = EventStreamThread(self.client, exam_data)
+        self.events.event_received.connect(self.on_event)
+        self.events.stream_failed.connect(self.camera_error)
+        self.uploader = FrameUploader(self.client, self)
+        # One worker, so calls reach the engine in the order the UI made them
+        self.requests = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine-requests")
+
+    def post(self, fn, *args, failure):
+        """Run a call whose reply the UI does not need on the request worker"""
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.warning(f"{failure}: {future.exception()}")
+
+        self.requests.submit(fn, *args).add_done_callback(log_failure)
+
+    def start(self):
+        self.capture.camera_error.connect(self.camera_error)
+        self.capture.frame_listeners.append(self.uploader.offer_frame)
+        self.start_capture()
+        if self.power_saving:
+            self.start_governor()
+        self.uploader.start()
+        self.events.start()
+
+    def start_governor(self):
+        from camera import load_face_cascade
+        from governor import PowerGovernor
+
+        self.governor = PowerGovernor(self.capture, load_face_cascade(shared=False))
+        self.governor.person_approached.connect(self.on_person_approached)
+        self.governor.start()
+
+    def on_person_approached(self):
+        if self.attempt_active:
+            return
+        if not (self.auto_start and self.gallery_faces and self.start_attempt()):
+            self.governor.attempt_finished()
+
+    def hold_auto_start(self, held):
+        if self.governor is not None:
+            self.governor.hold(held)
+
+    def on_event(self, event):
+        """Re-emit an engine event as the matching signal"""
+        if event['type'] == 'attempt_started':
+            self.attempt_active = True
+            if self.governor is not None:
+                self.governor.attempt_started()
+        elif event['type'] == 'attempt_finished':
+            self.attempt_active = False
+            if self.governor is not None:
+                self.governor.attempt_finished()
+        elif event['type'] == 'gallery_ready':
+            self.gallery_faces = event['faces']
+        if event['type'] in EVENTS:
+            signal, fields = EVENTS[event['type']]
+            getattr(self, signal).emit(*(event[field] for field in fields))
+
+    def status(self):
+        return self.client.status()
+
+    def start_attempt(self, claimed_student_id=None):
+        if self.ended:
+            return False
+        request = self.requests.submit(self.client.start_attempt, claimed_student_id)
+        try:
+            started = request.result(ENGINE_INTERACTIVE_TIMEOUT)
+        except FutureTimeout:
+            # It may still start; its attempt_started event then updates the UI
+            self.camera_error.emit("Engine is not responding")
+            return False
+        except Exception as e:
+            self.camera_error.emit(f"Engine unavailable: {e}")
+            return False
+        # Frames flow before the attempt_started event arrives
+        self.attempt_active = self.attempt_active or started
+        if started and self.governor is not None:
+            self.governor.attempt_started()
+        return started
+
+    def cancel_attempt(self):
+        if not self.attempt_active:
+            return
+        self.attempt_active = False
+        if self.governor is not None:
+            self.governor.attempt_finished()
+        self.post(self.client.cancel_attempt, failure="Could not cancel the engine's attempt")
+
+    def search(self, query, limit=MATRIC_LOOKUP_RESULTS):
+        """Matching students, or none if the engine does not answer within ENGINE_INTERACTIVE_TIMEOUT"""
+        try:
+            return self.client.search(query, limit, timeout=ENGINE_INTERACTIVE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Matric lookup failed: {e}")
+            return []
+
+    def end(self, close_exam=False):
+        """Stop the local threads and end the remote session, without blocking
+
+        The session is ended on the service once the event stream has
+        stopped, so it cannot start the session again behind our back.
+        """
+        if self.ended:
+            return
+        self.ended = True
+        self.close_on_end = close_exam
+        for worker in (self.events, self.uploader, self.governor, self.capture):
+            if worker is not None:
+                worker.stop()
+        self.end_when_stopped((self.events, self.uploader, self.governor, self.capture))
+
+    def teardown(self):
+        """End the remote session once every local thread has exited"""
+        self.post(self.client.end_session, self.close_on_end, failure="Could not end the engine session")
+        self.requests.shutdown(wait=False)
+        self.capture.frame_listeners.remove(self.uploader.offer_frame)
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Headless verification engine service for SVA Terminal
+
+Runs the verification engine (engine.py), the attendance queue and its
+sync, and the exam prefetcher under a QCoreApplication, without a
+display. A local HTTP API drives it, over a Unix socket by default or
+over TCP:
+
+    GET    /status                 service and session state
+    POST   /session                {"exam": exam row} starts a session (ending any other)
+    DELETE /session?close=1        ends the session; close=1 also closes the exam
+                                   (absentees and summary, see reconciliation.py)
+    POST   /attempts               {"student_id": id or null} starts an attempt
+    DELETE /attempts               cancels the running attempt
+    GET    /search?q=..&limit=N    roster students matching a matric number or name
+    POST   /frames                 one JPEG camera frame (with --frames api)
+    GET    /events?after=SEQ       newline-delimited JSON events as they happen;
+                                   add stream=0 for the backlog as one JSON list
+
+Events carry a sequence number, the session they belong to and the
+fields listed in engine.EVENTS. Clients that reconnect pass the last
+sequence number they saw and miss nothing within ENGINE_EVENT_BACKLOG.
+
+With ENGINE_API_TOKEN set, every request must carry it in the
+X-Engine-Token header. Without it the service only listens on a Unix
+socket or a loopback address.
+
+API requests are served on worker threads and run on the Qt thread that
+owns the engine, one at a time. Frame uploads skip that hop and go
+straight into the engine's FrameFeed.
+
+Usage: python engine_service.py [--listen unix:data/engine.sock | --listen http://127.0.0.1:8765]
+                                [--frames camera|api] [--no-prefetch]
+"""
+
+import argparse
+import hmac
+import http.server
+import ipaddress
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from urllib.parse import parse_qs, urlsplit
+
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSignal
+
+from config import (ENGINE_SOCKET, ENGINE_EVENT_BACKLOG, ENGINE_HEARTBEAT, ENGINE_API_TOKEN,
+                    MATRIC_LOOKUP_RESULTS)
+from attendance_queue import AttendanceQueue, AttendanceSyncThread
+from data_access import DataService, fetch_verified_students
+from engine import VerificationEngine, EVENTS, finish_ending_engines
+from engine_client import TOKEN_HEADER, parse_address
+from instrumentation import metrics, read_thermal, setup_logging
+from prefetch import PrefetchThread
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 60  # seconds an API call may wait for the Qt thread (ending a session joins threads)
+
+
+class ApiError(Exception):
+    """A request the service refuses, with its HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class EventLog:
+    """Numbered events kept for streaming to clients"""
+
+    def __init__(self, size=ENGINE_EVENT_BACKLOG):
+        self.events = deque(maxlen=size)
+        self.seq = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def append(self, event_type, **fields):
+        with self._cond:
+            self.seq += 1
+            self.events.append({'seq': self.seq, 'type': event_type, 'time': time.time(), **fields})
+            self._cond.notify_all()
+
+    def after(self, seq, timeout=0):
+        """Events newer than seq, waiting up to timeout for the first one"""
+        with self._cond:
+            if seq > self.seq:
+                seq = 0  # the client saw an earlier run of the service
+            self._cond.wait_for(lambda: self.closed or self.seq > seq, timeout)
+            return [event for event in self.events if event['seq'] > seq]
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class QtCaller(QObject):
+    """Runs functions on the Qt thread for callers on other threads"""
+    _call = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        self._call.connect(self._run)
+
+    def _run(self, job):
+        fn, future = job
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+
+    def __call__(self, fn, timeout=REQUEST_TIMEOUT):
+        future = Future()
+        self._call.emit((fn, future))
+        return future.result(timeout)
+
+
+class EngineHost(QObject):
+    """Owns the current session's engine and turns its signals into events"""
+
+    def __init__(self, data_service, attendance_queue, events, prefetch_thread=None, frames='camera'):
+        super().__init__()
+        self.data_service = data_service
+        self.attendance_queue = attendance_queue
+        self.events = events
+        self.prefetch_thread = prefetch_thread
+        self.frames = frames  # 'camera' or 'api'
+        self.engine = None
+        self.session = 0
+        self.data_service.finished.connect(self.on_request_finished)
+        self.data_service.failed.connect(self.on_request_failed)
+
+    def require_engine(self):
+        if self.engine is None:
+            raise ApiError(409, "No session is running")
+        return self.engine
+
+    def status(self):
+        return {
+            'session': self.session if self.engine is not None else None,
+            'engine': self.engine.status() if self.engine is not None else None,
+            'frames': self.frames,
+            'attendance_pending': self.attendance_queue.pending_count(),
+            'events': self.events.seq,
+        }
+
+    def start_session(self, exam):
+        """Start verifying for an exam; returns the session id and the event to stream after"""
+        from camera import FrameFeed
+
+        if not isinstance(exam, dict) or not {'id', 'course_id', 'exam_datetime'} <= exam.keys():
+            raise ApiError(400, "exam needs id, course_id and exam_datetime")
+        self.end_session()
+        self.session += 1
+        after = self.events.seq
+        capture = FrameFeed() if self.frames == 'api' else None
+        # With posted frames the remote UI runs its own power governor
+        self.engine = VerificationEngine(self.data_service, exam, self.attendance_queue, capture,
+                                         power_saving=self.frames == 'camera')
+        for event_type, (signal_name, fields) in EVENTS.items():
+            getattr(self.engine, signal_name).connect(
+                lambda *args, event_type=event_type, fields=fields, session=self.session:
+                self.events.append(event_type, session=session, **dict(zip(fields, args))))
+        if self.prefetch_thread is not None:
+            self.prefetch_thread.set_active(exam['id'])
+        # Students verified earlier (on any terminal) are recognised as repeat scans
+        self.data_service.submit(f"verified:{exam['id']}", fetch_verified_students, exam['id'])
+        self.events.append('session_started', session=self.session, exam_id=exam['id'])
+        self.engine.start()
+        logger.info(f"Session {self.session} started for exam {exam['id']}")
+        return {'session': self.session, 'after': after}
+
+    def end_session(self, close_exam=False):
+        if self.engine is None:
+            return
+        engine, self.engine = self.engine, None
+        # Deleted once its threads have stopped; end() does not wait for them
+        engine.torn_down.connect(engine.deleteLater)
+        engine.end(close_exam)
+        if self.prefetch_thread is not None:
+            self.prefetch_thread.set_active(engine.exam_data['id'], False)
+        self.events.append('session_ended', session=self.session, exam_id=engine.exam_data['id'])
+        logger.info(f"Session {self.session} ended")
+
+    def start_attempt(self, student_id=None):
+        return {'started': self.require_engine().start_attempt(student_id)}
+
+    def cancel_attempt(self):
+        self.require_engine().cancel_attempt()
+
+    def search(self, query, limit):
+        engine = self.require_engine()
+        if engine.roster is None:
+            return []
+        return engine.search(query, limit)
+
+    def on_request_finished(self, key, result):
+        """Seed the repeat-scan index with the exam's verified students"""
+        if key.startswith('verified:'):
+            exam_id = int(key.split(':', 1)[1])
+            self.attendance_queue.seed_verified(exam_id, result)
+            logger.info(f"{len(result)} students already verified for exam {exam_id}")
+
+    def on_request_failed(self, key, message):
+        if key.startswith('verified:'):
+            logger.warning(f"Could not load verified students ({message}); "
+                           f"repeat scans are only caught for students verified here")
+        elif key.startswith('close:'):
+            logger.error(f"Closing exam {key.split(':', 1)[1]} failed: {message}")
+
+
+class EngineRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Routes API requests to the EngineHost on the Qt thread"""
+    host = None
+    call = None
+    token = None  # required in the TOKEN_HEADER header when set
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        route = getattr(self, f"{method.lower()}_{url.path.strip('/').replace('/', '_')}", None)
+        try:
+            if self.token is not None and not hmac.compare_digest(
+                    self.headers.get(TOKEN_HEADER, "").encode(), self.token.encode()):
+                raise ApiError(401, "Missing or wrong engine token")
+            if route is None:
+                raise ApiError(404, f"No route for {method} {url.path}")
+            reply = route()
+            if reply is not NotImplemented:
+                self.send_json(200 if reply is not None else 204, reply)
+        except ApiError as e:
+            self.send_json(e.status, {'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.exception(f"{method} {url.path} failed")
+            self.send_json(500, {'error': str(e)})
+
+    def send_json(self, status, reply):
+        body = json.dumps(reply).encode() if reply is not None else b""
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b""
+
+    def read_json(self):
+        try:
+            return json.loads(self.read_body() or b"{}")
+        except ValueError:
+            raise ApiError(400, "Body is not valid JSON")
+
+    def get_status(self):
+        return self.call(self.host.status)
+
+    def post_session(self):
+        exam = self.read_json().get('exam')
+        return self.call(lambda: self.host.start_session(exam))
+
+    def delete_session(self):
+        close_exam = self.query.get('close') == '1'
+        self.call(lambda: self.host.end_session(close_exam))
+
+    def post_attempts(self):
+        student_id = self.read_json().get('student_id')
+        if student_id is not None and not isinstance(student_id, int):
+            raise ApiError(400, "student_id must be an integer")
+        return self.call(lambda: self.host.start_attempt(student_id))
+
+    def delete_attempts(self):
+        self.call(self.host.cancel_attempt)
+
+    def get_search(self):
+        try:
+            limit = int(self.query.get('limit', MATRIC_LOOKUP_RESULTS))
+        except ValueError:
+            raise ApiError(400, "limit must be an integer")
+        query = self.query.get('q', "")
+        return self.call(lambda: self.host.search(query, limit))
+
+    def post_frames(self):
+        import cv2
+        import numpy as np
+
+        jpeg = self.read_body()
+        engine = self.host.engine
+        if engine is None or self.host.frames != 'api':
+            raise ApiError(409, "The engine is not taking frames")
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ApiError(400, "Body is not a JPEG image")
+        engine.capture.put(frame)
+
+    def get_events(self):
+        try:
+            seq = int(self.query.get('after', 0))
+        except ValueError:
+            raise ApiError(400, "after must be an integer")
+        events = self.host.events
+        if self.query.get('stream') == '0':
+            return events.after(seq)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        while not events.closed:
+            batch = events.after(seq, ENGINE_HEARTBEAT)
+            lines = [json.dumps(event) for event in batch] or [json.dumps({'type': 'heartbeat'})]
+            if batch:
+                seq = batch[-1]['seq']
+            self.wfile.write(("\n".join(lines) + "\n").encode())
+            self.wfile.flush()
+        return NotImplemented
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler logs client_address[0]
+        return request, ('local', 0)
+
+
+def is_loopback(hostname):
+    if hostname == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(hostname).is_loopback
+    except ValueError:
+        return False
+
+
+def check_address(address, token=ENGINE_API_TOKEN):
+    """(kind, target) of a listen address; ValueError if it is exposed without a token"""
+    kind, target = parse_address(address)
+    if kind == 'tcp' and token is None and not is_loopback(target[0]):
+        raise ValueError(f"Set ENGINE_API_TOKEN to listen on {target[0]}; "
+                         f"without it only a Unix socket or a loopback address is allowed")
+    return kind, target
+
+
+def make_server(address, host, call, token=ENGINE_API_TOKEN):
+    """An HTTP server for the API at a unix: or http:// address; requests must carry token, if set"""
+    handler = type('Handler', (EngineRequestHandler,),
+                   {'host': host, 'call': staticmethod(call), 'token': token})
+    kind, target = check_address(address, token)
+    if kind == 'tcp':
+        server = http.server.ThreadingHTTPServer(target, handler)
+        server.daemon_threads = True
+        return server
+    if os.path.exists(target):
+        os.remove(target)  # left behind by a service that did not shut down
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    return ThreadingUnixHTTPServer(target, handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--listen', default=f"unix:{ENGINE_SOCKET}",
+                        help="unix:PATH or http://HOST:PORT")
+    parser.add_argument('--frames', choices=('camera', 'api'), default='camera',
+                        help="read the local camera, or take frames posted to /frames")
+    parser.add_argument('--no-prefetch', action='store_true', help="do not prefetch upcoming exams")
+    args = parser.parse_args()
+    try:
+        check_address(args.listen)
+    except ValueError as e:
+        parser.error(str(e))
+
+    app = QCoreApplication(sys.argv[:1])
+    setup_logging()
+    metrics.add_sampler(read_thermal)
+    metrics.start_reporting()
+
+    data_service = DataService()
+    attendance_queue = AttendanceQueue()
+    attendance_sync = AttendanceSyncThread(data_service, attendance_queue)
+    attendance_sync.start()
+    prefetch_thread = None
+    if not args.no_prefetch:
+        prefetch_thread = PrefetchThread(data_service)
+        prefetch_thread.start()
+
+    events = EventLog()
+    host = EngineHost(data_service, attendance_queue, events, prefetch_thread, args.frames)
+    server = make_server(args.listen, host, QtCaller())
+    threading.Thread(target=server.serve_forever, name="engine-api", daemon=True).start()
+    logger.info(f"Engine service listening on {args.listen} (frames from {args.frames})")
+
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    # Python only runs signal handlers between bytecodes; wake it up regularly
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(250)
+    code = app.exec_()
+
+    events.close()
+    server.shutdown()
+    server.server_close()
+    host.end_session()
+    finish_ending_engines()
+    attendance_sync.stop()
+    attendance_sync.wait()
+    if prefetch_thread is not None:
+        prefetch_thread.stop()
+        prefetch_thread.wait()
+    attendance_queue.close()
+    data_service.shutdown()
+    metrics.stop_reporting()
+    metrics.write_snapshot()
+    kind, target = parse_address(args.listen)
+    if kind == 'unix' and os.path.exists(target):
+        os.remove(target)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Precompute face embeddings for every student before exam day
+
+Streams the students table, downloads each photo, and detects, scores
+and embeds the face in a pool of worker processes (see enrollment.py).
+Re-runs only process students whose updated_at changed. A quality
+report lists students whose photo has no face, several faces or a low
+quality score, so their photos can be retaken before the exam.
+
+Copy the output directory to each kiosk's ENROLLMENT_DIR; the gallery
+build then uses these embeddings instead of embedding roster photos.
+
+Usage: python enroll_students.py [--out data/enrollment] [--workers N] [--full]
+"""
+
+import argparse
+import sys
+
+from config import ENROLLMENT_DIR, ENROLLMENT_PAGE_SIZE, ENROLLMENT_DOWNLOAD_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default=ENROLLMENT_DIR, help="enrollment directory")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="embedding processes (default: one per CPU)")
+    parser.add_argument('--download-workers', type=int, default=ENROLLMENT_DOWNLOAD_WORKERS)
+    parser.add_argument('--page-size', type=int, default=ENROLLMENT_PAGE_SIZE)
+    parser.add_argument('--full', action='store_true', help="re-embed every student")
+    parser.add_argument('--issues', type=int, default=20, help="issues to print (the report has all)")
+    args = parser.parse_args()
+
+    from data_access import create_supabase_client
+    from enrollment import enroll_students
+
+    def progress(counts):
+        done = sum(n for outcome, n in counts.items() if outcome not in ('students', 'unchanged'))
+        if done % 500 == 0:
+            print(f"  {done} photos processed", flush=True)
+
+    report = enroll_students(create_supabase_client(), args.out, workers=args.workers,
+                             download_workers=args.download_workers, page_size=args.page_size,
+                             full=args.full, progress=progress)
+
+    counts, timings = report['counts'], report['timings']
+    print(f"\n{counts['students']} students, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, {report['enrolled_faces']} enrolled faces")
+    for outcome, n in sorted(counts.items()):
+        if outcome not in ('students', 'unchanged', 'removed'):
+            print(f"  {outcome:<16} {n}")
+    if timings['students_per_s']:
+        print(f"{timings['total_s']:.1f} s, {timings['students_per_s']:.1f} students/s "
+              f"with {timings['workers']} workers")
+    for issue in report['issues'][:args.issues]:
+        print(f"  {issue['matric_number']}: {issue['issue']}")
+    if len(report['issues']) > args.issues:
+        print(f"  ... {len(report['issues']) - args.issues} more in {args.out}/quality_report.json")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
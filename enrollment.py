@@ -0,0 +1,292 @@
+"""
+Bulk face enrollment for SVA Terminal
+
+Builds a face embedding store for the whole students table ahead of exam
+day, so kiosks do not have to download and embed every photo at session
+start. Student rows are streamed in pages. Photos are downloaded over
+one pooled HTTP client, and faces are detected, quality-scored and
+embedded in a pool of worker processes, using the same detection,
+embedding and quality code as the kiosk. A manifest records the
+updated_at each student was enrolled from, so a re-run only processes
+new or changed students and tombstones students that were removed.
+
+The output directory holds:
+
+    embeddings.bin        EmbeddingStore with one row per enrolled student
+    manifest.json         model name and updated_at per processed student
+    quality_report.json   counts, timings and per-student issues
+
+GalleryBuildThread uses the store through Enrollment.lookup() for every
+roster student whose updated_at still matches.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from config import (ENROLLMENT_DIR, ENROLLMENT_PAGE_SIZE, ENROLLMENT_DOWNLOAD_WORKERS,
+                    CONNECTION_TIMEOUT, FACE_MIN_QUALITY)
+from embedding_store import EmbeddingStore, EmbeddingStoreError
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = "embeddings.bin"
+MANIFEST_FILE = "manifest.json"
+REPORT_FILE = "quality_report.json"
+STUDENT_FIELDS = "id, matric_number, photo_url, updated_at"
+
+# Per-student outcomes in the quality report
+ENROLLED = 'enrolled'
+LOW_QUALITY = 'low_quality'  # enrolled, but the photo should be retaken
+MULTIPLE_FACES = 'multiple_faces'  # enrolled from the largest face
+NO_FACE = 'no_face'
+NO_PHOTO = 'no_photo'
+UNREADABLE = 'unreadable'
+DOWNLOAD_FAILED = 'download_failed'  # retried on the next run
+
+
+class Enrollment:
+    """Read side of an enrollment directory, used by the kiosk gallery build"""
+
+    def __init__(self, store, stamps):
+        self.store = store
+        self.stamps = stamps  # student id -> updated_at the row was built from
+
+    @classmethod
+    def open(cls, directory=ENROLLMENT_DIR, model_name=None):
+        """Open an enrollment directory, or return None if it is missing or unusable"""
+        store_path = os.path.join(directory, STORE_FILE)
+        if not os.path.exists(store_path):
+            return None
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            store = EmbeddingStore.open(store_path, model_name=model_name)
+        except (OSError, ValueError, EmbeddingStoreError) as e:
+            logger.warning(f"Ignoring enrollment store in {directory}: {e}")
+            return None
+        stamps = {int(sid): stamp for sid, stamp in manifest.get('students', {}).items()}
+        return cls(store, stamps)
+
+    def __len__(self):
+        return len(self.store)
+
+    def lookup(self, student_id, updated_at):
+        """The student's precomputed embedding, or None if missing or out of date"""
+        if self.stamps.get(student_id) != updated_at:
+            return None
+        return self.store.embedding(student_id)
+
+
+# Worker processes
+
+_worker = {}
+
+
+def _init_worker():
+    from camera import load_face_cascade
+    from face_engine import FaceEmbedder
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    _worker['cascade'] = load_face_cascade()
+    _worker['embedder'] = FaceEmbedder()
+
+
+def embed_photo(student_id, data):
+    """Detect, score and embed the face in one photo; runs in a worker process
+
+    Returns (student_id, embedding or None, outcome, details).
+    """
+    from face_engine import detect_photo_faces, largest_face
+    from face_quality import score_face_quality
+
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return student_id, None, UNREADABLE, {}
+    faces = detect_photo_faces(gray, _worker['cascade'])
+    box = largest_face(faces)
+    if box is None:
+        return student_id, None, NO_FACE, {'width': gray.shape[1], 'height': gray.shape[0]}
+
+    quality, details = score_face_quality(gray, box)
+    details['quality'] = quality
+    embedding = _worker['embedder'].embed(gray, box)
+    if len(faces) > 1:
+        outcome = MULTIPLE_FACES
+    elif quality < FACE_MIN_QUALITY:
+        outcome = LOW_QUALITY
+    else:
+        outcome = ENROLLED
+    return student_id, embedding, outcome, details
+
+
+# Batch build
+
+def stream_students(client, page_size=ENROLLMENT_PAGE_SIZE):
+    """Yield pages of student rows (id, matric, photo_url, updated_at) in id order"""
+    start = 0
+    while True:
+        rows = client.table('students').select(STUDENT_FIELDS) \
+            .order('id').range(start, start + page_size - 1).execute().data
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def enroll_students(client, directory=ENROLLMENT_DIR, workers=None,
+                    download_workers=ENROLLMENT_DOWNLOAD_WORKERS, page_size=ENROLLMENT_PAGE_SIZE,
+                    full=False, progress=None):
+    """Bring the enrollment store in line with the students table; returns the report
+
+    full=True re-embeds every student. progress, if given, is called
+    with the report's counts after each finished student.
+    """
+    import httpx
+    from face_engine import FaceEmbedder
+
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    embedder = FaceEmbedder()
+    store_path = os.path.join(directory, STORE_FILE)
+    manifest = read_manifest(directory)
+    if full or manifest.get('model') != embedder.model_name:
+        manifest = {}
+        if os.path.exists(store_path):
+            os.remove(store_path)
+    stamps = {int(sid): stamp for sid, stamp in manifest.get('students', {}).items()}
+    store = EmbeddingStore.open_or_create(store_path, embedder.dim, embedder.model_name)
+    if store.count == 0:
+        # A fresh store (new format or dtype) has none of the manifest's rows
+        stamps = {}
+
+    counts = {'students': 0, 'unchanged': 0, 'removed': 0}
+    issues = []
+    seen = set()
+    timings = {'download_s': 0.0}
+    lock = threading.Lock()
+    workers = workers or os.cpu_count() or 1
+    # Bounds how many downloaded photos are held in memory at once
+    in_flight = threading.Semaphore(workers * 4)
+
+    def record(student, outcome, details=None):
+        # Called on the main thread only
+        counts[outcome] = counts.get(outcome, 0) + 1
+        if outcome != ENROLLED:
+            issues.append(dict({'id': student['id'], 'matric_number': student['matric_number'],
+                                'issue': outcome}, **(details or {})))
+        if progress:
+            progress(counts)
+
+    limits = httpx.Limits(max_connections=download_workers, max_keepalive_connections=download_workers)
+    context = multiprocessing.get_context('spawn')
+    with httpx.Client(timeout=CONNECTION_TIMEOUT, follow_redirects=True, limits=limits) as http, \
+            ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=_init_worker) as pool:
+
+        def download(student):
+            in_flight.acquire()
+            try:
+                fetch_started = time.perf_counter()
+                response = http.get(student['photo_url'])
+                response.raise_for_status()
+                with lock:
+                    timings['download_s'] += time.perf_counter() - fetch_started
+                future = pool.submit(embed_photo, student['id'], response.content)
+            except BaseException:
+                in_flight.release()
+                raise
+            future.add_done_callback(lambda _: in_flight.release())
+            return future
+
+        pending = {}  # download future -> student
+        for page in stream_students(client, page_size):
+            for student in page:
+                counts['students'] += 1
+                seen.add(student['id'])
+                updated_at = student.get('updated_at') or ""
+                if stamps.get(student['id']) == updated_at and updated_at:
+                    counts['unchanged'] += 1
+                    continue
+                if not student.get('photo_url'):
+                    store.tombstone(student['id'], flush=False)
+                    stamps[student['id']] = updated_at
+                    record(student, NO_PHOTO)
+                    continue
+                pending[downloads.submit(download, student)] = student
+
+        embeddings = {}  # embed future -> student
+        for future in as_completed(pending):
+            student = pending[future]
+            try:
+                embeddings[future.result()] = student
+            except Exception as e:
+                record(student, DOWNLOAD_FAILED, {'error': str(e)})
+
+        for future in as_completed(embeddings):
+            student = embeddings[future]
+            try:
+                student_id, embedding, outcome, details = future.result()
+            except Exception as e:
+                record(student, UNREADABLE, {'error': str(e)})
+                continue
+            if embedding is None:
+                store.tombstone(student_id, flush=False)
+            else:
+                store.append(student_id, embedding, flush=False)
+            stamps[student_id] = student.get('updated_at') or ""
+            record(student, outcome, details)
+
+    for student_id in list(stamps):
+        if student_id not in seen:
+            store.tombstone(student_id, flush=False)
+            del stamps[student_id]
+            counts['removed'] += 1
+    store.set_source_stamp(max(stamps.values(), default=""))
+
+    write_json(os.path.join(directory, MANIFEST_FILE), {
+        'model': embedder.model_name,
+        'students': {str(sid): stamp for sid, stamp in sorted(stamps.items())},
+    })
+    elapsed = time.perf_counter() - started
+    processed = counts['students'] - counts['unchanged']
+    report = {
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'model': embedder.model_name,
+        'enrolled_faces': len(store),
+        'counts': counts,
+        'timings': {
+            'total_s': elapsed,
+            'download_s': timings['download_s'],
+            'students_per_s': processed / elapsed if elapsed else None,
+            'workers': workers,
+            'download_workers': download_workers,
+        },
+        'issues': sorted(issues, key=lambda issue: issue['id']),
+    }
+    write_json(os.path.join(directory, REPORT_FILE), report)
+    return report
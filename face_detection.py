@@ -0,0 +1,103 @@
+"""
+Adaptive face detection front end for SVA Terminal
+
+Runs the Haar cascade on a downscaled frame with a minimum face size
+taken from the expected distance to the camera, and only every few
+frames. In between, the last detected face is followed with a template
+match in a small search window, which costs a fraction of a full
+detectMultiScale pass.
+"""
+
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from config import FACE_DETECT_WIDTH, FACE_MIN_SIZE_RATIO, FACE_REDETECT_INTERVAL
+from instrumentation import metrics, FACE_DETECT, FACE_TRACK
+
+TRACK_MIN_SCORE = 0.6  # normalised correlation needed to keep a track
+
+
+class AdaptiveFaceDetector:
+    """Periodic downscaled detection with template tracking in between"""
+
+    def __init__(self, face_cascade, detect_width=FACE_DETECT_WIDTH,
+                 min_size_ratio=FACE_MIN_SIZE_RATIO, redetect_interval=FACE_REDETECT_INTERVAL):
+        self.face_cascade = face_cascade
+        self.detect_width = detect_width
+        self.min_size_ratio = min_size_ratio
+        self.redetect_interval = redetect_interval
+        self.timings = deque(maxlen=300)  # (mode, milliseconds) per frame
+        self.reset()
+
+    def reset(self):
+        """Forget the tracked face so the next frame runs a full detection"""
+        self.template = None
+        self.track_box = None  # (x, y, w, h) in downscaled coordinates
+        self.frames_since_detect = 0
+
+    def process(self, gray):
+        """Return face boxes (x, y, w, h) in full-resolution coordinates"""
+        scale = min(1.0, self.detect_width / gray.shape[1])
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) \
+            if scale < 1.0 else gray
+
+        faces = None
+        if self.template is not None and self.frames_since_detect < self.redetect_interval:
+            started = time.perf_counter()
+            faces = self._track(small)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings.append(('track', elapsed))
+            metrics.record(FACE_TRACK, elapsed)
+        if faces is None:
+            started = time.perf_counter()
+            faces = self._detect(small)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings.append(('detect', elapsed))
+            metrics.record(FACE_DETECT, elapsed)
+
+        return [tuple(int(round(v / scale)) for v in box) for box in faces]
+
+    def _detect(self, small):
+        min_side = max(int(small.shape[1] * self.min_size_ratio), 20)
+        faces = self.face_cascade.detectMultiScale(small, 1.1, 4, minSize=(min_side, min_side))
+        self.frames_since_detect = 0
+        if len(faces) == 0:
+            self.reset()
+            return []
+
+        x, y, w, h = max(faces, key=lambda box: box[2] * box[3])
+        self.track_box = (x, y, w, h)
+        self.template = small[y:y + h, x:x + w].copy()
+        return [tuple(box) for box in faces]
+
+    def _track(self, small):
+        x, y, w, h = self.track_box
+        # Search a window twice the face size around the last position
+        x0, y0 = max(x - w // 2, 0), max(y - h // 2, 0)
+        x1, y1 = min(x + w + w // 2, small.shape[1]), min(y + h + h // 2, small.shape[0])
+        window = small[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            return None
+
+        result = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(result)
+        if score < TRACK_MIN_SCORE:
+            return None
+
+        self.frames_since_detect += 1
+        self.track_box = (x0 + dx, y0 + dy, w, h)
+        return [self.track_box]
+
+    def timing_summary(self):
+        """Mean and max per-frame milliseconds for each mode"""
+        summary = {}
+        for mode in ('detect', 'track'):
+            values = np.array([ms for m, ms in self.timings if m == mode])
+            if len(values):
+                summary[mode] = {'frames': int(len(values)),
+                                 'mean_ms': float(values.mean()),
+                                 'max_ms': float(values.max())}
+        return summary
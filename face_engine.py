@@ -0,0 +1,237 @@
+"""
+Face identification engine for SVA Terminal
+
+Each enrolled student's photo is turned into a fixed-length embedding
+once, and all embeddings are kept in one contiguous matrix. A live face
+is identified with a single matrix product against the whole gallery
+(1:N search) instead of comparing images one by one. Quantized galleries
+(float16 or int8 rows, see embedding_store) are scored in blocks of
+GALLERY_BLOCK_ROWS, so only one block is ever widened to float32.
+"""
+
+import os
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import FACE_MATCH_THRESHOLD, PHOTO_DETECT_WIDTH, PHOTO_MIN_FACE_RATIO, ENROLLMENT_DIR
+from delta_sync import overlap_since
+from embedding_store import EmbeddingStore, TOMBSTONE
+from enrollment import Enrollment
+from secure_store import read_sealed
+
+GALLERY_BLOCK_ROWS = 1024
+
+
+def load_photo(path):
+    """Decode a cached student photo, sealed or (from older caches) plain; None if unreadable"""
+    try:
+        data = read_sealed(path, allow_plain=True)
+    except Exception:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def largest_face(faces):
+    """Return the (x, y, w, h) box with the largest area, or None"""
+    if len(faces) == 0:
+        return None
+    return max(faces, key=lambda box: box[2] * box[3])
+
+
+def detect_photo_faces(gray, face_cascade, detect_width=PHOTO_DETECT_WIDTH):
+    """Face boxes in an enrollment photo, in full-resolution coordinates
+
+    Large photos are downscaled before detection, and faces smaller than
+    PHOTO_MIN_FACE_RATIO of the width are not searched for; the face is
+    still embedded from the full-resolution image.
+    """
+    scale = min(1.0, detect_width / gray.shape[1])
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) \
+        if scale < 1.0 else gray
+    min_side = int(small.shape[1] * PHOTO_MIN_FACE_RATIO)
+    faces = face_cascade.detectMultiScale(small, 1.1, 4, minSize=(min_side, min_side))
+    return [tuple(int(round(v / scale)) for v in box) for box in faces]
+
+
+class FaceEmbedder:
+    """Turns a detected face into an L2-normalised float32 embedding
+
+    Uses a HOG descriptor of the histogram-equalised face crop, centred so
+    that cosine similarity behaves like a correlation score.
+    """
+    model_name = "hog64-v1"
+    face_size = (64, 64)
+
+    def __init__(self):
+        self.hog = cv2.HOGDescriptor(self.face_size, (16, 16), (8, 8), (8, 8), 9)
+        self.dim = int(self.hog.getDescriptorSize())
+
+    def embed(self, gray, box):
+        x, y, w, h = [int(v) for v in box]
+        # Small margin so the crop includes the jaw line and forehead
+        pad = int(0.1 * w)
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        crop = gray[y0:y + h + pad, x0:x + w + pad]
+        crop = cv2.resize(crop, self.face_size, interpolation=cv2.INTER_AREA)
+        crop = cv2.equalizeHist(crop)
+
+        vector = self.hog.compute(crop).reshape(-1).astype(np.float32)
+        vector -= vector.mean()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_image(self, image, face_cascade):
+        """Embed the largest face in a BGR or grayscale image, or return None"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        box = largest_face(detect_photo_faces(gray, face_cascade))
+        if box is None:
+            return None
+        return self.embed(gray, box)
+
+
+class FaceGallery:
+    """Enrolled embeddings stored as one (N, D) float32, float16 or int8 matrix
+
+    int8 rows come with a per-row scale (embedding = row * scale).
+    """
+
+    def __init__(self, student_ids, embeddings, scales=None):
+        self.student_ids = np.asarray(student_ids, dtype=np.int64)
+        embeddings = np.asarray(embeddings)
+        if embeddings.dtype not in (np.float16, np.int8):
+            embeddings = embeddings.astype(np.float32, copy=False)
+        self.matrix = np.ascontiguousarray(embeddings)
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+        if self.matrix.ndim != 2 or len(self.matrix) != len(self.student_ids):
+            raise ValueError("Gallery needs one embedding row per student id")
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @property
+    def memory_bytes(self):
+        """Bytes held by the gallery's arrays (shared pages when memory-mapped)"""
+        return self.student_ids.nbytes + self.matrix.nbytes + \
+            (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def from_store(cls, store):
+        """Wrap the memory-mapped rows of an EmbeddingStore without copying"""
+        return cls(*store.live_view())
+
+    def scores(self, queries):
+        """(F, N) cosine similarities of F float32 queries against every row"""
+        if self.matrix.dtype == np.float32:
+            return queries @ self.matrix.T
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), GALLERY_BLOCK_ROWS):
+            block = self.matrix[start:start + GALLERY_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def identify_batch(self, embeddings, k=3, threshold=FACE_MATCH_THRESHOLD):
+        """Match F live embeddings at once; returns F lists of (student_id, score)"""
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = self.scores(queries)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-row[candidates])]
+            results.append([(int(self.student_ids[i]), float(row[i]))
+                            for i in candidates
+                            if row[i] >= threshold and self.student_ids[i] != TOMBSTONE])
+        return results
+
+    def identify(self, embedding, k=3, threshold=FACE_MATCH_THRESHOLD):
+        """Top-k (student_id, score) candidates above threshold for one face"""
+        return self.identify_batch(embedding, k, threshold)[0]
+
+
+def embedding_store_path(roster):
+    """Location of the embedding store kept next to an exam's roster cache"""
+    return os.path.join(roster.dir, "embeddings.bin")
+
+
+def sync_store_with_roster(store, roster, embedder, face_cascade, enrollment=None,
+                           should_continue=lambda: True):
+    """Bring an embedding store in line with a roster; returns rows embedded
+
+    Only students whose record or enrollment changed since the store's
+    source stamp are re-embedded, and students no longer on the roster
+    are tombstoned. With an Enrollment, precomputed embeddings are used
+    for students whose updated_at still matches, and only the rest are
+    embedded from photos. should_continue is checked before each
+    student; when it returns False the rows so far are flushed but the
+    source stamp is left alone, so the next sync picks up the rest.
+    """
+    for student_id in list(store.rows):
+        if student_id not in roster.students:
+            store.tombstone(student_id, flush=False)
+
+    embedded = 0
+    # Rows committed late can carry a stamp just before the store's, so
+    # they are re-checked, as in delta_sync
+    cutoff = overlap_since(store.source_stamp) if store.source_stamp else None
+    for student in list(roster.students.values()):
+        if not should_continue():
+            store.flush()
+            return embedded
+        updated_at = student.get('updated_at') or ""
+        if cutoff and (student.get('synced_at') or updated_at) <= cutoff:
+            continue
+        embedding = enrollment.lookup(student['id'], updated_at) if enrollment else None
+        if embedding is None:
+            path = student.get('photo_path')
+            image = load_photo(path) if path else None
+            embedding = embedder.embed_image(image, face_cascade) if image is not None else None
+        if embedding is not None:
+            store.append(student['id'], embedding, flush=False)
+            embedded += 1
+        else:
+            store.tombstone(student['id'], flush=False)
+
+    if roster.high_water and roster.high_water != store.source_stamp:
+        store.set_source_stamp(roster.high_water)
+    else:
+        store.flush()
+    return embedded
+
+
+class GalleryBuildThread(QThread):
+    """Sync the roster's embedding store and build a FaceGallery from it"""
+    gallery_ready = pyqtSignal(object)
+    gallery_failed = pyqtSignal(str)
+
+    def __init__(self, roster, embedder, face_cascade):
+        super().__init__()
+        self.roster = roster
+        self.embedder = embedder
+        self.face_cascade = face_cascade
+        self.running = True
+
+    def run(self):
+        try:
+            enrollment = Enrollment.open(ENROLLMENT_DIR, self.embedder.model_name)
+            # Waits for the prefetcher if it is writing this exam's store
+            with self.roster.lock:
+                store = EmbeddingStore.open_or_create(embedding_store_path(self.roster),
+                                                      self.embedder.dim, self.embedder.model_name)
+                sync_store_with_roster(store, self.roster, self.embedder, self.face_cascade, enrollment,
+                                       lambda: self.running)
+            if self.running:
+                self.gallery_ready.emit(FaceGallery.from_store(store))
+        except Exception as e:
+            self.gallery_failed.emit(f"Face gallery build failed: {str(e)}")
+
+    def stop(self):
+        """Stop after the student being embedded; no gallery is emitted"""
+        self.running = False
@@ -0,0 +1,137 @@
+"""
+Quality-gated multi-frame fusion for face matching
+
+Each candidate face crop gets a cheap quality score (Laplacian
+sharpness, brightness and face size). Only the best frames seen during
+an attempt are kept, and their embeddings are fused with quality
+weights before the gallery is searched. A match is accepted early as
+soon as the fused score is confidently above the threshold.
+"""
+
+import heapq
+import itertools
+import time
+
+import cv2
+import numpy as np
+
+from config import (FACE_FUSION_FRAMES, FACE_EARLY_ACCEPT_THRESHOLD, FACE_MIN_QUALITY,
+                    FACE_MATCH_THRESHOLD, FACE_RECOGNITION_TIMEOUT)
+from instrumentation import metrics, FACE_IDENTIFY
+
+SHARPNESS_TARGET = 150.0  # Laplacian variance treated as fully sharp
+FACE_SIZE_TARGET = 0.3  # face width / frame width treated as ideal
+
+
+def score_face_quality(gray, box):
+    """Return (quality in [0, 1], metrics dict) for one face crop"""
+    x, y, w, h = box
+    crop = gray[y:y + h, x:x + w]
+    if crop.size == 0:
+        return 0.0, {}
+    # Score on a fixed-size crop so sharpness is comparable across distances
+    crop = cv2.resize(crop, (96, 96), interpolation=cv2.INTER_AREA)
+
+    sharpness = float(cv2.Laplacian(crop, cv2.CV_32F).var())
+    brightness = float(crop.mean())
+    size = w / gray.shape[1]
+
+    sharpness_score = min(sharpness / SHARPNESS_TARGET, 1.0)
+    brightness_score = max(1.0 - abs(brightness - 128.0) / 128.0, 0.0)
+    size_score = min(size / FACE_SIZE_TARGET, 1.0)
+    quality = sharpness_score * brightness_score * size_score
+    return quality, {'sharpness': sharpness, 'brightness': brightness, 'size': size}
+
+
+class MultiFrameFuser:
+    """Keep the best N face embeddings of an attempt and match their fusion"""
+
+    def __init__(self, gallery, best_n=FACE_FUSION_FRAMES, min_quality=FACE_MIN_QUALITY,
+                 early_accept=FACE_EARLY_ACCEPT_THRESHOLD, threshold=FACE_MATCH_THRESHOLD):
+        self.gallery = gallery
+        self.best_n = best_n
+        self.min_quality = min_quality
+        self.early_accept = early_accept
+        self.threshold = threshold
+        self.frames = []  # min-heap of (quality, tiebreak, embedding)
+        self._counter = itertools.count()
+        self.best = None  # (student_id, score) of the current fusion
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, embedding, quality):
+        """Offer one frame; returns True if it was kept"""
+        if quality < self.min_quality:
+            return False
+        entry = (quality, next(self._counter), embedding)
+        if len(self.frames) < self.best_n:
+            heapq.heappush(self.frames, entry)
+        elif quality > self.frames[0][0]:
+            heapq.heapreplace(self.frames, entry)
+        else:
+            return False
+        self.best = self._match()
+        return True
+
+    def fused_embedding(self):
+        weights = np.array([q for q, _, _ in self.frames], dtype=np.float32)
+        stacked = np.vstack([e for _, _, e in self.frames])
+        fused = weights @ stacked
+        norm = np.linalg.norm(fused)
+        return fused / norm if norm > 0 else fused
+
+    def _match(self):
+        with metrics.span(FACE_IDENTIFY):
+            candidates = self.gallery.identify(self.fused_embedding(), k=1, threshold=-1.0)
+        return candidates[0] if candidates else None
+
+    def confident(self):
+        """True once the fused match is good enough to stop early"""
+        return self.best is not None and self.best[1] >= self.early_accept
+
+    def decision(self):
+        """(student_id, score) if the fused match clears the threshold, else None"""
+        if self.best is not None and self.best[1] >= self.threshold:
+            return self.best
+        return None
+
+
+def run_face_attempt(next_frame, detector, embedder, gallery, timeout=FACE_RECOGNITION_TIMEOUT,
+                     should_continue=lambda: True, on_faces=None):
+    """Run one recognition attempt over frames from next_frame()
+
+    next_frame() returns the newest BGR frame, or None if none arrived in
+    time; it raises EOFError when a recorded clip runs out, which ends
+    the attempt like the timeout does. on_faces, if given, is called with
+    the boxes found in each frame (for the live preview). Returns
+    (decision, frames_kept) where decision is (student_id, score) or
+    None, or None if should_continue() turned False.
+    """
+    fuser = MultiFrameFuser(gallery)
+    deadline = time.time() + timeout
+    while should_continue() and time.time() < deadline:
+        try:
+            frame = next_frame()
+        except EOFError:
+            break
+        if frame is None:
+            continue
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = detector.process(gray)
+        if on_faces is not None:
+            on_faces(faces)
+        if len(faces) > 0:
+            # Only the student nearest the camera is scored; poor frames
+            # are dropped before paying for an embedding
+            box = max(faces, key=lambda b: b[2] * b[3])
+            quality, _ = score_face_quality(gray, box)
+            if quality >= fuser.min_quality:
+                fuser.add(embedder.embed(gray, box), quality)
+                if fuser.confident():
+                    break
+
+    if not should_continue():
+        return None
+    return fuser.decision(), len(fuser)
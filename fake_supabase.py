@@ -0,0 +1,205 @@
+"""
+In-process stand-in for the Supabase client, for soak tests and benchmarks
+
+Implements the part of the supabase-py query builder that the terminal
+uses (table, select, filters, order, range, insert, upsert, execute and
+rpc) over in-memory tables. Filters take dotted paths into embedded
+rows. A student_courses row seeded with a nested 'students' record
+therefore behaves like a students!inner(...) join. Column lists passed
+to select() are ignored and rows come back whole.
+"""
+
+import copy
+import threading
+import time
+
+
+class FakeAPIError(Exception):
+    """Raised where PostgREST would return an error response"""
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+def _lookup(row, path):
+    for part in path.split('.'):
+        if not isinstance(row, dict):
+            return None
+        row = row.get(part)
+    return row
+
+
+class FakeQuery:
+    """Chainable query against one in-memory table"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []  # (column path, predicate)
+        self.ordering = None  # (column path, descending)
+        self.bounds = None  # (first, last) row index, inclusive
+        self.write = None  # (operation, rows, options)
+
+    def select(self, *columns, **kwargs):
+        return self
+
+    def _filter(self, column, predicate):
+        self.filters.append((column, predicate))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._filter(column, lambda v: v in values)
+
+    def order(self, column, desc=False):
+        self.ordering = (column, desc)
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def limit(self, count):
+        self.bounds = (0, count - 1)
+        return self
+
+    def insert(self, rows):
+        self.write = ('insert', rows if isinstance(rows, list) else [rows], {})
+        return self
+
+    def upsert(self, rows, on_conflict="", ignore_duplicates=False):
+        self.write = ('upsert', rows if isinstance(rows, list) else [rows],
+                      {'on_conflict': on_conflict, 'ignore_duplicates': ignore_duplicates})
+        return self
+
+    def matches(self, row):
+        return all(predicate(_lookup(row, column)) for column, predicate in self.filters)
+
+    def execute(self):
+        return self.db.execute(self)
+
+
+class FakeRpc:
+    def __init__(self, db, fn, params):
+        self.db = db
+        self.fn = fn
+        self.params = params
+
+    def execute(self):
+        return self.db.call(self.fn, self.params)
+
+
+class FakeSupabase:
+    """Thread-safe in-memory tables with optional latency and injected failures"""
+
+    def __init__(self, tables=None, rpcs=None, unique=None, latency=0.0):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self.rpcs = dict(rpcs or {})  # name -> fn(db, params) returning rows
+        self.unique = dict(unique or {})  # table -> tuple of columns that must be unique
+        self.latency = latency  # seconds added to every request
+        self.requests = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, fn, params=None):
+        return FakeRpc(self, fn, params or {})
+
+    def fail_next(self, count=1):
+        """Make the next count requests raise FakeAPIError, like a dropped connection"""
+        with self._lock:
+            self._failures += count
+
+    def rows(self, table):
+        with self._lock:
+            return copy.deepcopy(self.tables.get(table, []))
+
+    def _begin_request(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if self._failures:
+                self._failures -= 1
+                raise FakeAPIError("Injected request failure")
+
+    def call(self, fn, params):
+        self._begin_request()
+        if fn not in self.rpcs:
+            raise FakeAPIError(f"Unknown function {fn}")
+        return FakeResponse(self.rpcs[fn](self, params))
+
+    def execute(self, query):
+        self._begin_request()
+        with self._lock:
+            table = self.tables.setdefault(query.table, [])
+            if query.write is not None:
+                return FakeResponse(self._write(table, query))
+
+            rows = [row for row in table if query.matches(row)]
+            if query.ordering:
+                column, desc = query.ordering
+                rows.sort(key=lambda row: (_lookup(row, column) is None, _lookup(row, column)),
+                          reverse=desc)
+            if query.bounds:
+                first, last = query.bounds
+                rows = rows[first:last + 1]
+            return FakeResponse(copy.deepcopy(rows))
+
+    def _key(self, row, columns):
+        return tuple(row.get(column) for column in columns)
+
+    def _write(self, table, query):
+        operation, rows, options = query.write
+        unique = self.unique.get(query.table, ())
+        conflict = tuple(c.strip() for c in options.get('on_conflict', '').split(',') if c.strip()) \
+            or unique
+        index = {self._key(row, conflict): row for row in table} if conflict else {}
+        unique_keys = {self._key(row, unique) for row in table} if unique else set()
+
+        # Statements are atomic: check every row before changing the table
+        updates, appends = [], []
+        for row in rows:
+            row = dict(row)
+            existing = index.get(self._key(row, conflict)) if conflict else None
+            if operation == 'upsert' and existing is not None:
+                if not options['ignore_duplicates']:
+                    updates.append((existing, row))
+                continue
+            if unique and self._key(row, unique) in unique_keys:
+                raise FakeAPIError(f"duplicate key value violates unique constraint on {query.table}")
+            if unique:
+                unique_keys.add(self._key(row, unique))
+            if conflict:
+                index[self._key(row, conflict)] = row
+            appends.append(row)
+
+        for existing, row in updates:
+            existing.update(row)
+        for row in appends:
+            row.setdefault('id', len(table) + 1)
+            table.append(row)
+        return copy.deepcopy([existing for existing, _ in updates] + appends)
@@ -0,0 +1,237 @@
+"""
+Fingerprint sensor driver for SVA Terminal
+
+Wraps a ZhianTec sensor through PyFingerprint. At session start the
+exam roster's fingerprint templates are uploaded into the sensor's own
+template slots, so a scan is matched on the sensor with searchTemplate
+(1:N) and never needs a network round trip. The slot assignment and a
+checksum of each stored template are remembered on disk. When the same
+exam's roster is loaded again, for a new session or after a roster
+change, only added, changed and removed templates are written.
+"""
+
+import base64
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import FINGERPRINT_PORT, FINGERPRINT_BAUDRATE, FINGERPRINT_TIMEOUT, ROSTER_CACHE_DIR
+from instrumentation import metrics, FINGERPRINT_CAPTURE, FINGERPRINT_MATCH
+
+try:
+    from pyfingerprint.pyfingerprint import PyFingerprint
+except ImportError:
+    PyFingerprint = None
+
+logger = logging.getLogger(__name__)
+
+CHAR_BUFFER = 0x01
+SIMULATOR_PORT = 'sim'
+SLOT_MANIFEST = os.path.join(ROSTER_CACHE_DIR, "fingerprint_slots.json")
+
+
+def slot_manifest_path(port):
+    """Slot manifest for one sensor; each lane's scanner keeps its own"""
+    if port == FINGERPRINT_PORT:
+        return SLOT_MANIFEST
+    name = "".join(c if c.isalnum() else "_" for c in port.strip("/"))
+    return os.path.join(ROSTER_CACHE_DIR, f"fingerprint_slots_{name}.json")
+
+
+def decode_template(text):
+    """Decode a students.fingerprint_template value into characteristic bytes
+
+    Templates are stored as base64 of the sensor's characteristics, or as
+    a JSON list of byte values; roster records hold the raw bytes. Returns
+    None for empty or invalid values.
+    """
+    if not text:
+        return None
+    if isinstance(text, bytes):
+        return list(text)
+    text = text.strip()
+    try:
+        if text.startswith('['):
+            values = [int(v) for v in json.loads(text)]
+        else:
+            values = list(base64.b64decode(text, validate=True))
+    except (ValueError, binascii.Error):
+        return None
+    if not values or any(v < 0 or v > 255 for v in values):
+        return None
+    return values
+
+
+class FingerprintSensor:
+    """Sensor connection holding one exam roster in its template slots"""
+
+    def __init__(self, port=FINGERPRINT_PORT, baudrate=FINGERPRINT_BAUDRATE):
+        self.port = port
+        self.baudrate = baudrate
+        self.device = None
+        self.simulator = None
+        self.capacity = 0
+        self.slots = {}  # sensor position -> student id
+        self.checksums = {}  # student id -> CRC of the template in its slot
+        self.exam_id = None
+        self.lock = threading.RLock()  # one serial conversation at a time
+        self.manifest_path = slot_manifest_path(port)
+
+    @property
+    def connected(self):
+        return self.device is not None
+
+    def connect(self):
+        """Open the serial port and check the sensor password"""
+        with self.lock:
+            if self.device is not None:
+                return
+            if PyFingerprint is None:
+                raise RuntimeError("pyfingerprint is not installed")
+
+            port = self.port
+            if port == SIMULATOR_PORT:
+                from fingerprint_sim import FingerprintSimulator
+                self.simulator = FingerprintSimulator()
+                self.simulator.start()
+                port = self.simulator.port
+
+            device = PyFingerprint(port, self.baudrate, 0xFFFFFFFF, 0x00000000)
+            if not device.verifyPassword():
+                raise ValueError("The fingerprint sensor password is wrong")
+            self.capacity = device.getStorageCapacity()
+            self.device = device
+
+    def close(self):
+        with self.lock:
+            # PyFingerprint closes its serial port when the last reference goes
+            self.device = None
+            if self.simulator:
+                self.simulator.stop()
+                self.simulator.join(timeout=1)
+                self.simulator = None
+
+    def load_roster(self, roster):
+        """Bring the sensor's slots in line with the roster; returns slots used"""
+        with self.lock:
+            self.connect()
+            if self.exam_id != roster.exam_id:
+                self._adopt_manifest(roster.exam_id)
+            if self.exam_id != roster.exam_id:
+                self.device.clearDatabase()
+                self.slots = {}
+                self.checksums = {}
+
+            wanted = {}  # student id -> (checksum, characteristics, student)
+            for student in list(roster.students.values()):
+                characteristics = decode_template(student.get('fingerprint_template'))
+                if characteristics is not None:
+                    wanted[student['id']] = (zlib.crc32(bytes(characteristics)), characteristics, student)
+
+            positions = {sid: pos for pos, sid in self.slots.items()}
+            for student_id, position in positions.items():
+                if student_id not in wanted:
+                    self.device.deleteTemplate(position)
+                    del self.slots[position]
+                    self.checksums.pop(student_id, None)
+
+            position = 0
+            for student_id, (checksum, characteristics, student) in wanted.items():
+                if self.checksums.get(student_id) == checksum:
+                    continue
+                # A changed template is rewritten in place; a new one takes the next free slot
+                target = positions.get(student_id)
+                if target is None:
+                    while position in self.slots:
+                        position += 1
+                    if position >= self.capacity:
+                        logger.warning(f"Fingerprint sensor full: {self.capacity} of {len(roster)} students loaded")
+                        break
+                    target = position
+                try:
+                    self.device.uploadCharacteristics(CHAR_BUFFER, characteristics)
+                    self.device.storeTemplate(target, CHAR_BUFFER)
+                except Exception as e:
+                    logger.warning(f"Error loading fingerprint for {student['matric_number']}: {e}")
+                    continue
+                self.slots[target] = student_id
+                self.checksums[student_id] = checksum
+
+            self.exam_id = roster.exam_id
+            self._write_manifest(roster)
+            return len(self.slots)
+
+    def _adopt_manifest(self, exam_id):
+        """Take over the slots a previous run left on the sensor for this exam"""
+        manifest = self._read_manifest()
+        slots = manifest.get('slots', {})
+        if (manifest.get('exam_id') == exam_id and 'checksums' in manifest
+                and self.device.getTemplateCount() == len(slots)):
+            self.slots = {int(pos): sid for pos, sid in slots.items()}
+            self.checksums = {int(sid): crc for sid, crc in manifest['checksums'].items()}
+            self.exam_id = exam_id
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # A simulator starts empty, so its manifest never applies to hardware
+        if manifest.get('port') != self.port or self.port == SIMULATOR_PORT:
+            return {}
+        return manifest
+
+    def _write_manifest(self, roster):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'port': self.port, 'exam_id': roster.exam_id, 'stamp': roster.high_water,
+                       'slots': self.slots, 'checksums': self.checksums}, f)
+
+    def identify(self, timeout=FINGERPRINT_TIMEOUT, should_continue=lambda: True):
+        """Wait for a finger and search it on the sensor
+
+        Returns (student_id or None, accuracy), or None if no finger was
+        placed before the timeout.
+        """
+        started = time.perf_counter()
+        deadline = time.time() + timeout
+        while should_continue() and time.time() < deadline:
+            # load_roster holds the lock for a whole upload; keep checking
+            # the deadline and should_continue while it does
+            if not self.lock.acquire(timeout=0.05):
+                continue
+            try:
+                if self.device.readImage():
+                    metrics.record(FINGERPRINT_CAPTURE, (time.perf_counter() - started) * 1000)
+                    with metrics.span(FINGERPRINT_MATCH):
+                        self.device.convertImage(CHAR_BUFFER)
+                        position, accuracy = self.device.searchTemplate()
+                    return self.slots.get(position), max(accuracy, 0)
+            finally:
+                self.lock.release()
+            time.sleep(0.05)
+        return None
+
+
+class FingerprintLoadThread(QThread):
+    """Connect to the sensor and upload the roster without blocking the UI"""
+    templates_loaded = pyqtSignal(int)  # number of templates in sensor slots
+    load_failed = pyqtSignal(str)
+
+    def __init__(self, sensor, roster):
+        super().__init__()
+        self.sensor = sensor
+        self.roster = roster
+
+    def run(self):
+        try:
+            self.templates_loaded.emit(self.sensor.load_roster(self.roster))
+        except Exception as e:
+            self.load_failed.emit(f"Fingerprint sensor error: {str(e)}")
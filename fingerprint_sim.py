@@ -0,0 +1,212 @@
+"""
+Serial-port simulator for ZhianTec (ZFM/R30x) fingerprint sensors
+
+Opens a pseudo-terminal and answers the sensor's packet protocol on it,
+so the real PyFingerprint driver can be pointed at `simulator.port` and
+exercised without hardware. Only the commands used by SVA Terminal are
+implemented. A "finger" is a list of characteristic bytes placed on the
+simulated glass with place_finger(); searches match exact
+characteristics.
+"""
+
+import os
+import select
+import threading
+import tty
+
+STARTCODE = b"\xef\x01"
+COMMANDPACKET = 0x01
+DATAPACKET = 0x02
+ACKPACKET = 0x07
+ENDDATAPACKET = 0x08
+
+OK = 0x00
+ERROR_NOFINGER = 0x02
+ERROR_NOTEMPLATEFOUND = 0x09
+ERROR_INVALIDPOSITION = 0x0B
+ERROR_DOWNLOADCHARACTERISTICS = 0x0D
+ERROR_INVALIDIMAGE = 0x15
+ERROR_UNKNOWN_COMMAND = 0x01
+
+PACKET_SIZES = [32, 64, 128, 256]
+
+
+class FingerprintSimulator(threading.Thread):
+    """Emulated fingerprint sensor listening on a pseudo-terminal"""
+
+    def __init__(self, capacity=1000, packet_size=128, read_delay=0.0):
+        super().__init__(daemon=True)
+        self.capacity = capacity
+        self.packet_size = packet_size
+        self.read_delay = read_delay  # seconds a readImage takes, to mimic the sensor
+        self.library = {}  # position -> characteristics
+        self.buffers = {1: [], 2: []}
+        self.image = None
+        self.finger = None
+        self.commands = 0
+        self.running = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def place_finger(self, characteristics):
+        """Put a finger on the glass until remove_finger() is called"""
+        with self._lock:
+            self.finger = list(characteristics)
+
+    def remove_finger(self):
+        with self._lock:
+            self.finger = None
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+
+    def run(self):
+        self.running = True
+        try:
+            while self.running:
+                packet = self._read_packet()
+                if packet is None:
+                    continue
+                packet_type, payload = packet
+                if packet_type == COMMANDPACKET and payload:
+                    self.commands += 1
+                    self._dispatch(payload[0], payload[1:])
+        except OSError:
+            pass
+        finally:
+            os.close(self.master)
+            os.close(self.slave)
+
+    def _read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            if not self.running:
+                return None
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if ready:
+                data += os.read(self.master, size - len(data))
+        return data
+
+    def _read_packet(self):
+        header = self._read_exact(9)
+        if header is None:
+            return None
+        if header[:2] != STARTCODE:
+            return None
+        length = (header[7] << 8) | header[8]
+        body = self._read_exact(length)
+        if body is None:
+            return None
+        return header[6], list(body[:-2])
+
+    def _write_packet(self, packet_type, payload):
+        length = len(payload) + 2
+        checksum = packet_type + (length >> 8) + (length & 0xFF) + sum(payload)
+        packet = (STARTCODE + b"\xff\xff\xff\xff" + bytes([packet_type, length >> 8, length & 0xFF])
+                  + bytes(payload) + bytes([(checksum >> 8) & 0xFF, checksum & 0xFF]))
+        os.write(self.master, packet)
+
+    def _ack(self, code, *data):
+        self._write_packet(ACKPACKET, [code] + list(data))
+
+    def _dispatch(self, command, args):
+        handler = {
+            0x13: self._verify_password,
+            0x0F: self._system_parameters,
+            0x1D: self._template_count,
+            0x01: self._read_image,
+            0x02: self._convert_image,
+            0x04: self._search,
+            0x06: self._store,
+            0x0C: self._delete_char,
+            0x0D: self._clear,
+            0x09: self._upload,
+            0x08: self._download,
+        }.get(command)
+        if handler is None:
+            self._ack(ERROR_UNKNOWN_COMMAND)
+        else:
+            handler(args)
+
+    def _verify_password(self, args):
+        self._ack(OK)
+
+    def _system_parameters(self, args):
+        size_code = PACKET_SIZES.index(self.packet_size)
+        self._ack(OK, 0, 0, 0, 0, self.capacity >> 8, self.capacity & 0xFF, 0, 3,
+                  0xFF, 0xFF, 0xFF, 0xFF, 0, size_code, 0, 6)
+
+    def _template_count(self, args):
+        count = len(self.library)
+        self._ack(OK, count >> 8, count & 0xFF)
+
+    def _read_image(self, args):
+        if self.read_delay:
+            self._stop_event.wait(self.read_delay)
+        with self._lock:
+            self.image = self.finger
+        self._ack(OK if self.image is not None else ERROR_NOFINGER)
+
+    def _convert_image(self, args):
+        if self.image is None:
+            self._ack(ERROR_INVALIDIMAGE)
+            return
+        self.buffers[args[0]] = list(self.image)
+        self._ack(OK)
+
+    def _search(self, args):
+        wanted = self.buffers[args[0]]
+        for position, characteristics in sorted(self.library.items()):
+            if characteristics == wanted:
+                self._ack(OK, position >> 8, position & 0xFF, 0, 200)
+                return
+        self._ack(ERROR_NOTEMPLATEFOUND, 0, 0, 0, 0)
+
+    def _store(self, args):
+        position = (args[1] << 8) | args[2]
+        if position >= self.capacity:
+            self._ack(ERROR_INVALIDPOSITION)
+            return
+        self.library[position] = list(self.buffers[args[0]])
+        self._ack(OK)
+
+    def _delete_char(self, args):
+        position, count = (args[0] << 8) | args[1], (args[2] << 8) | args[3]
+        if position + count > self.capacity:
+            self._ack(ERROR_INVALIDPOSITION)
+            return
+        for slot in range(position, position + count):
+            self.library.pop(slot, None)
+        self._ack(OK)
+
+    def _clear(self, args):
+        self.library.clear()
+        self._ack(OK)
+
+    def _upload(self, args):
+        self._ack(OK)
+        data = []
+        while self.running:
+            packet = self._read_packet()
+            if packet is None:
+                continue
+            packet_type, payload = packet
+            data.extend(payload)
+            if packet_type == ENDDATAPACKET:
+                break
+        self.buffers[args[0]] = data
+
+    def _download(self, args):
+        data = self.buffers.get(args[0])
+        if not data:
+            self._ack(ERROR_DOWNLOADCHARACTERISTICS)
+            return
+        self._ack(OK)
+        chunks = [data[i:i + self.packet_size] for i in range(0, len(data), self.packet_size)]
+        for index, chunk in enumerate(chunks):
+            self._write_packet(ENDDATAPACKET if index == len(chunks) - 1 else DATAPACKET, chunk)
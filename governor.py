@@ -0,0 +1,201 @@
+"""
+Activity-aware power governor for SVA Terminal
+
+Between students the kiosk only has to notice that someone is coming.
+While idle, the governor turns the camera down to IDLE_FRAME_RATE
+(IDLE_FRAME_RATE_HOT while the CPU is hot or throttled) and looks for
+motion in a MOTION_FRAME_WIDTH-wide grayscale copy of each frame,
+compared with a running average of the empty scene. Motion puts the
+camera back to its full rate and runs a face presence check a few times
+a second; a face close enough to the camera emits person_approached,
+and the engine starts an attempt on its own when AUTO_START is set.
+
+After an attempt the governor waits AUTO_START_COOLDOWN seconds, and
+for the student to step away (no face in view), before it re-arms, so a
+student lingering at the kiosk does not start a second attempt.
+
+The governor also reads the CPU temperature and throttle state every
+THERMAL_INTERVAL seconds and publishes them, and its own state, as
+metrics gauges.
+"""
+
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import (IDLE_FRAME_RATE, IDLE_FRAME_RATE_HOT, MOTION_FRAME_WIDTH, MOTION_THRESHOLD,
+                    APPROACH_TIMEOUT, APPROACH_CHECK_RATE, AUTO_START_COOLDOWN, THERMAL_INTERVAL,
+                    THERMAL_HOT_C, FACE_DETECT_WIDTH, FACE_MIN_SIZE_RATIO)
+from instrumentation import metrics, read_thermal, MOTION_CHECK
+
+logger = logging.getLogger(__name__)
+
+# Governor states
+IDLE = 'idle'  # low frame rate, motion detection on a tiny frame
+APPROACH = 'approach'  # full frame rate, looking for a face after motion
+ACTIVE = 'active'  # an attempt is starting or running
+COOLDOWN = 'cooldown'  # attempt over, waiting for the student to step away
+
+PIXEL_CHANGE = 25  # grey levels a tiny-frame pixel must change by to count as motion
+BACKGROUND_RATE = 0.05  # weight of each idle frame in the running average of the scene
+
+
+def tiny_gray(frame, width=MOTION_FRAME_WIDTH):
+    """A small, blurred grayscale copy of a frame for motion detection"""
+    height = max(1, frame.shape[0] * width // frame.shape[1])
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(small, (3, 3), 0)
+
+
+class MotionDetector:
+    """Frame differencing against a running average of the scene"""
+
+    def __init__(self, threshold=MOTION_THRESHOLD, width=MOTION_FRAME_WIDTH):
+        self.threshold = threshold
+        self.width = width
+        self.background = None
+
+    def reset(self):
+        """Learn the scene again from the next frame"""
+        self.background = None
+
+    def changed(self, frame):
+        """Fraction of the scene that differs from the background; updates the background"""
+        gray = tiny_gray(frame, self.width)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            return 0.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, BACKGROUND_RATE)
+        return np.count_nonzero(diff > PIXEL_CHANGE) / diff.size
+
+    def moved(self, frame):
+        return self.changed(frame) >= self.threshold
+
+
+class PowerGovernor(QThread):
+    """Idle, approach, active and cooldown states for one camera"""
+    person_approached = pyqtSignal()
+    state_changed = pyqtSignal(str)
+
+    def __init__(self, capture, face_cascade):
+        super().__init__()
+        self.capture = capture
+        self.face_cascade = face_cascade  # private instance; runs beside the face thread
+        self.motion = MotionDetector()
+        self.state = IDLE
+        self.held = False
+        self.hot = False
+        self.running = True
+        self._since = time.monotonic()
+        self._next_thermal = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def run(self):
+        self.enter(IDLE)
+        last_seq = 0
+        while self.running:
+            self.check_thermal()
+            with self._lock:
+                state, since = self.state, self._since
+            if state == ACTIVE:
+                # Frames belong to the attempt; wait for it to end
+                self._wake.wait(0.5)
+                self._wake.clear()
+                continue
+
+            latest = self.capture.wait_for_frame(last_seq, timeout=0.5)
+            if latest is None:
+                continue
+            last_seq, _, frame = latest
+
+            if state == IDLE:
+                with metrics.span(MOTION_CHECK):
+                    moved = self.motion.moved(frame)
+                if moved and not self.held:
+                    self.enter(APPROACH, expected=IDLE)
+            elif state == APPROACH:
+                if self.face_in_view(frame):
+                    if self.enter(ACTIVE, expected=APPROACH):
+                        self.person_approached.emit()
+                elif time.monotonic() - since >= APPROACH_TIMEOUT:
+                    self.enter(IDLE, expected=APPROACH)
+                else:
+                    time.sleep(1.0 / APPROACH_CHECK_RATE)
+            elif state == COOLDOWN:
+                if time.monotonic() - since >= AUTO_START_COOLDOWN and not self.face_in_view(frame):
+                    self.enter(IDLE, expected=COOLDOWN)
+
+    def enter(self, state, expected=None):
+        """Switch state and camera rate; returns False if the state moved on meanwhile"""
+        with self._lock:
+            if expected is not None and self.state != expected:
+                return False
+            self.state = state
+            self._since = time.monotonic()
+        if state == IDLE:
+            self.motion.reset()
+        self.apply_frame_rate()
+        self._wake.set()
+        metrics.set_gauge('governor_state', state)
+        self.state_changed.emit(state)
+        return True
+
+    def apply_frame_rate(self):
+        if self.state in (APPROACH, ACTIVE):
+            self.capture.set_frame_rate(None)
+        else:
+            self.capture.set_frame_rate(IDLE_FRAME_RATE_HOT if self.hot else IDLE_FRAME_RATE)
+
+    def face_in_view(self, frame):
+        """Whether a face close enough to be at the kiosk is in the frame"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        scale = min(1.0, FACE_DETECT_WIDTH / gray.shape[1])
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) \
+            if scale < 1.0 else gray
+        min_side = max(int(small.shape[1] * FACE_MIN_SIZE_RATIO), 20)
+        return len(self.face_cascade.detectMultiScale(small, 1.2, 4, minSize=(min_side, min_side))) > 0
+
+    def check_thermal(self):
+        """Publish temperature and throttle gauges, and slow the idle rate down when hot"""
+        now = time.monotonic()
+        if now < self._next_thermal:
+            return
+        self._next_thermal = now + THERMAL_INTERVAL
+        gauges = read_thermal()
+        for name, value in gauges.items():
+            metrics.set_gauge(name, value)
+        hot = gauges.get('cpu_temp_c', 0.0) >= THERMAL_HOT_C or gauges.get('throttled', False)
+        if hot != self.hot:
+            self.hot = hot
+            if hot:
+                logger.warning(f"CPU hot or throttled ({gauges}); idle frame rate lowered")
+            else:
+                logger.info("CPU back to normal; idle frame rate restored")
+            self.apply_frame_rate()
+
+    def attempt_started(self):
+        """An attempt began, whether started by the governor or by hand"""
+        if self.state != ACTIVE:
+            self.enter(ACTIVE)
+
+    def attempt_finished(self):
+        """The attempt ended, or the engine declined to start one"""
+        self.enter(COOLDOWN)
+
+    def hold(self, held):
+        """Stop (or resume) reporting approaches, e.g. while the matric keypad is open"""
+        self.held = held
+        if held:
+            self.enter(IDLE, expected=APPROACH)
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
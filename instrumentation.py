@@ -0,0 +1,320 @@
+"""
+Instrumentation for SVA Terminal
+
+Records per-stage latencies (camera open, detection, identification,
+fingerprint capture and match, attendance write, UI reset, preview paint) into rolling
+windows, and counts verified students per exam session. While a session
+is open its samples also go into windows of its own, so an exam's
+summary only reflects the students verified for that exam. A background
+reporter writes p50/p95/p99 and students-per-minute to METRICS_FILE and
+a summary line to the rotating log. Gauges hold point-in-time readings,
+such as the CPU temperature and throttle state from read_thermal().
+
+Recording a sample is a perf_counter() call and a deque append under a
+lock, so it is cheap enough to leave on in production.
+"""
+
+import glob
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from config import (LOG_LEVEL, LOG_FILE, MAX_LOG_SIZE, LOG_BACKUP_COUNT,
+                    METRICS_FILE, METRICS_INTERVAL, METRICS_WINDOW)
+
+logger = logging.getLogger(__name__)
+
+# Stage names used across the application
+CAMERA_OPEN = 'camera_open'
+FACE_DETECT = 'face_detect'
+FACE_TRACK = 'face_track'
+FACE_IDENTIFY = 'face_identify'
+FINGERPRINT_CAPTURE = 'fingerprint_capture'
+FINGERPRINT_MATCH = 'fingerprint_match'
+ATTENDANCE_ENQUEUE = 'attendance_enqueue'
+ATTENDANCE_UPLOAD = 'attendance_upload'
+UI_RESET = 'ui_reset'
+PREVIEW_PAINT = 'preview_paint'
+VERIFICATION_TOTAL = 'verification_total'
+STARTUP_SPLASH = 'startup_splash'
+TIME_TO_INTERACTIVE = 'time_to_interactive'
+MOTION_CHECK = 'motion_check'
+
+# vcgencmd get_throttled bits (Raspberry Pi firmware); the same bits shifted
+# left by 16 record that the condition has occurred since boot
+UNDER_VOLTAGE = 0x1
+FREQUENCY_CAPPED = 0x2
+THROTTLED = 0x4
+SOFT_TEMP_LIMIT = 0x8
+
+
+def setup_logging():
+    """Send application logs to the console and a size-rotated log file"""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    root.addHandler(console)
+
+    try:
+        if os.path.dirname(LOG_FILE):
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=MAX_LOG_SIZE,
+                                           backupCount=LOG_BACKUP_COUNT)
+        file_handler.setFormatter(formatter)
+        root.addHandler(file_handler)
+    except OSError as e:
+        logger.warning(f"File logging disabled: {e}")
+
+
+def process_age():
+    """Seconds since this process was started by the OS, or None if unknown
+
+    Counts interpreter start-up and imports, which a timer started in
+    main() would miss. Linux only; resolution is one clock tick.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_thermal():
+    """CPU temperature, clock and firmware throttle state as a dict of gauges
+
+    Reads the hottest /sys/class/thermal zone and cpu0's current clock,
+    plus `vcgencmd get_throttled` where the Raspberry Pi firmware tools
+    are installed. Readings that are unavailable are left out.
+    """
+    gauges = {}
+    temperatures = []
+    for path in glob.glob('/sys/class/thermal/thermal_zone*/temp'):
+        try:
+            with open(path) as f:
+                temperatures.append(int(f.read()) / 1000.0)
+        except (OSError, ValueError):
+            pass
+    if temperatures:
+        gauges['cpu_temp_c'] = max(temperatures)
+    try:
+        with open('/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq') as f:
+            gauges['cpu_freq_mhz'] = int(f.read()) / 1000.0
+    except (OSError, ValueError):
+        pass
+
+    if shutil.which('vcgencmd'):
+        try:
+            output = subprocess.run(['vcgencmd', 'get_throttled'], capture_output=True,
+                                    text=True, timeout=2).stdout
+            flags = int(output.strip().split('=')[1], 16)  # throttled=0x50005
+        except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+            flags = None
+        if flags is not None:
+            gauges['throttle_flags'] = flags
+            gauges['under_voltage'] = bool(flags & UNDER_VOLTAGE)
+            gauges['throttled'] = bool(flags & (FREQUENCY_CAPPED | THROTTLED | SOFT_TEMP_LIMIT))
+            gauges['throttled_since_boot'] = bool((flags >> 16) & (FREQUENCY_CAPPED | THROTTLED | SOFT_TEMP_LIMIT))
+    return gauges
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def stage_stats(windows, counts):
+    """{stage: count and p50/p95/p99/max} from stage -> samples and stage -> total"""
+    stats = {}
+    for stage, samples in windows.items():
+        values = sorted(samples)
+        stats[stage] = {
+            'count': counts[stage],
+            'p50_ms': percentile(values, 50),
+            'p95_ms': percentile(values, 95),
+            'p99_ms': percentile(values, 99),
+            'max_ms': values[-1] if values else None,
+        }
+    return stats
+
+
+class Metrics:
+    """Rolling per-stage latency windows and per-exam throughput counters"""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.stages = {}  # stage -> deque of milliseconds
+        self.counts = {}  # stage -> total samples since start
+        self.sessions = {}  # exam id -> session counters
+        self.current_exam = None
+        self.gauges = {}  # name -> latest value
+        self.samplers = []  # fn() -> {gauge name: value}, read before each report
+        self._lock = threading.Lock()
+        self._reporter = None
+        self._stop = threading.Event()
+
+    def record(self, stage, milliseconds):
+        """Add one latency sample for a stage, and to the open exam session's windows"""
+        with self._lock:
+            windows = [(self.stages, self.counts)]
+            session = self.sessions.get(self.current_exam)
+            if session is not None:
+                windows.append((session['stages'], session['stage_counts']))
+            for stages, counts in windows:
+                samples = stages.get(stage)
+                if samples is None:
+                    samples = stages[stage] = deque(maxlen=self.window)
+                samples.append(milliseconds)
+                counts[stage] = counts.get(stage, 0) + 1
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as one sample of a stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def drain(self):
+        """Remove and return buffered samples as {stage: [milliseconds, ...]}
+
+        Worker processes use this to hand their samples to the main process.
+        """
+        with self._lock:
+            stages = {stage: list(samples) for stage, samples in self.stages.items()}
+            self.stages = {}
+        return stages
+
+    def merge(self, stages):
+        """Record samples drained from another process"""
+        for stage, values in stages.items():
+            for milliseconds in values:
+                self.record(stage, milliseconds)
+
+    def set_gauge(self, name, value):
+        """Store the latest value of a point-in-time reading"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def add_sampler(self, sampler):
+        """Refresh gauges from sampler() each time a report is written"""
+        if sampler not in self.samplers:
+            self.samplers.append(sampler)
+
+    def begin_session(self, exam_id):
+        """Start (or resume) throughput counters and stage windows for an exam session"""
+        with self._lock:
+            self.current_exam = exam_id
+            self.sessions.setdefault(exam_id, {
+                'started_at': time.time(),
+                'verified': 0,
+                'failed': 0,
+                'completions': deque(maxlen=self.window),
+                'stages': {},  # stage -> deque of milliseconds, this exam only
+                'stage_counts': {},
+            })
+
+    def end_session(self, exam_id):
+        """Stop adding samples to an exam session's windows; its counters are kept"""
+        with self._lock:
+            if self.current_exam == exam_id:
+                self.current_exam = None
+
+    def record_outcome(self, success, exam_id=None):
+        """Count one finished verification for the current exam session"""
+        with self._lock:
+            session = self.sessions.get(exam_id if exam_id is not None else self.current_exam)
+            if session is None:
+                return
+            session['verified' if success else 'failed'] += 1
+            session['completions'].append(time.time())
+
+    def snapshot(self):
+        """Percentiles per stage, and throughput and percentiles per exam session"""
+        now = time.time()
+        with self._lock:
+            stages = {stage: list(samples) for stage, samples in self.stages.items()}
+            counts = dict(self.counts)
+            sessions = {exam_id: dict(s, completions=list(s['completions']),
+                                      stages={stage: list(samples) for stage, samples in s['stages'].items()},
+                                      stage_counts=dict(s['stage_counts']))
+                        for exam_id, s in self.sessions.items()}
+            gauges = dict(self.gauges)
+
+        report = {'timestamp': now, 'stages': stage_stats(stages, counts), 'sessions': {},
+                  'gauges': gauges}
+        for exam_id, session in sessions.items():
+            last_minute = [t for t in session['completions'] if now - t <= 60]
+            elapsed_min = max((now - session['started_at']) / 60.0, 1e-6)
+            total = session['verified'] + session['failed']
+            report['sessions'][str(exam_id)] = {
+                'verified': session['verified'],
+                'failed': session['failed'],
+                'students_per_minute': len(last_minute),
+                'session_rate_per_minute': total / elapsed_min,
+                'stages': stage_stats(session['stages'], session['stage_counts']),
+            }
+        return report
+
+    def write_snapshot(self, path=METRICS_FILE):
+        for sampler in self.samplers:
+            try:
+                for name, value in sampler().items():
+                    self.set_gauge(name, value)
+            except Exception as e:
+                logger.warning(f"Gauge sampler failed: {e}")
+        report = self.snapshot()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, path)
+        return report
+
+    def start_reporting(self, interval=METRICS_INTERVAL, path=METRICS_FILE):
+        """Periodically write snapshots and log a summary in the background"""
+        if self._reporter is not None:
+            return
+
+        def report_loop():
+            while not self._stop.wait(interval):
+                try:
+                    report = self.write_snapshot(path)
+                    logger.info("metrics " + " ".join(
+                        f"{stage}:p50={s['p50_ms']:.1f}/p95={s['p95_ms']:.1f}ms"
+                        for stage, s in sorted(report['stages'].items())))
+                except Exception as e:
+                    logger.warning(f"Could not write metrics: {e}")
+
+        self._stop.clear()
+        self._reporter = threading.Thread(target=report_loop, name="metrics-reporter", daemon=True)
+        self._reporter.start()
+
+    def stop_reporting(self):
+        self._stop.set()
+        if self._reporter is not None:
+            self._reporter.join(timeout=2)
+            self._reporter = None
+
+
+metrics = Metrics()
@@ -0,0 +1,240 @@
+"""
+Multi-lane kiosk support for SVA Terminal
+
+One terminal can drive several camera/scanner pairs ("lanes"). Every
+lane gets its own worker process which keeps the lane camera open and
+runs detection, quality scoring, embedding and the gallery search, so
+lanes run on separate CPU cores instead of sharing one interpreter
+lock. Workers map the exam's embedding store read-only, sharing the
+pages the main process wrote; the roster, the fingerprint sensors and
+the attendance queue stay in the main process and are shared by all
+lanes. Between attempts a worker waits on its command pipe and only
+grabs a frame at IDLE_FRAME_RATE.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import cv2
+
+from camera import CameraUnavailable, load_face_cascade
+from config import IDLE_FRAME_RATE
+from embedding_store import EmbeddingStore, EmbeddingStoreError
+from face_detection import AdaptiveFaceDetector
+from face_engine import FaceEmbedder, FaceGallery
+from face_quality import run_face_attempt
+from instrumentation import metrics, CAMERA_OPEN
+
+logger = logging.getLogger(__name__)
+
+# Messages from a lane worker to the main process
+LANE_READY = 'ready'
+LANE_ERROR = 'error'
+LANE_RESULT = 'result'
+
+
+class LaneWorker:
+    """Runs inside a lane process: one camera, one detector, one gallery"""
+
+    def __init__(self, lane_id, camera_index, conn):
+        self.lane_id = lane_id
+        self.camera_index = camera_index
+        self.conn = conn
+        self.cap = None
+        self.gallery = None
+        self.stopping = False
+        self.cancelled = set()
+
+    def run(self):
+        started = time.perf_counter()
+        self.cap = cv2.VideoCapture(self.camera_index)
+        # A one-frame driver queue, so grabbing slowly between attempts never leaves stale frames
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if self.cap.isOpened() and self.cap.grab():
+            elapsed = time.perf_counter() - started
+            metrics.record(CAMERA_OPEN, elapsed * 1000)
+            self.conn.send((LANE_READY, elapsed))
+        else:
+            self.cap.release()
+            self.cap = None
+            self.conn.send((LANE_ERROR, "Camera not available"))
+
+        self.detector = AdaptiveFaceDetector(load_face_cascade())
+        self.embedder = FaceEmbedder()
+        try:
+            while not self.stopping:
+                # Between attempts, wait for commands and only grab at IDLE_FRAME_RATE
+                # to keep the camera streaming; identify() drops the frame held meanwhile
+                if self.conn.poll(1.0 / IDLE_FRAME_RATE):
+                    self.handle(self.conn.recv())
+                elif self.cap is not None:
+                    self.cap.grab()
+        finally:
+            if self.cap is not None:
+                self.cap.release()
+
+    def handle(self, command):
+        kind = command[0]
+        if kind == 'stop':
+            self.stopping = True
+        elif kind == 'cancel':
+            self.cancelled.add(command[1])
+        elif kind == 'gallery':
+            _, path, model_name = command
+            try:
+                # The main process verified the store when it built it
+                store = EmbeddingStore.open(path, model_name, verify=False, readonly=True)
+            except (OSError, ValueError, EmbeddingStoreError) as e:
+                # Keep serving the previous gallery, if any, rather than losing the lane
+                self.conn.send((LANE_ERROR, f"Face gallery unavailable: {e}"))
+                return
+            self.gallery = FaceGallery.from_store(store)
+        elif kind == 'identify':
+            self.identify(*command[1:])
+
+    def should_continue(self, attempt_id):
+        while self.conn.poll():
+            self.handle(self.conn.recv())
+        return not self.stopping and attempt_id not in self.cancelled
+
+    def next_frame(self):
+        ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def identify(self, attempt_id, timeout):
+        reply = {'decision': None, 'frames': 0, 'error': None, 'camera_error': None}
+        self.detector.reset()
+        self.detector.timings.clear()
+        try:
+            if self.cap is None:
+                raise CameraUnavailable("Camera not available")
+            self.cap.grab()  # the frame buffered while idle may be up to an idle interval old
+            result = run_face_attempt(self.next_frame, self.detector, self.embedder, self.gallery,
+                                      timeout, lambda: self.should_continue(attempt_id))
+            if result is None:
+                reply['cancelled'] = True
+            else:
+                reply['decision'], reply['frames'] = result
+        except CameraUnavailable as e:
+            reply['camera_error'] = str(e)
+        except Exception as e:
+            reply['error'] = str(e)
+        self.cancelled.discard(attempt_id)
+        reply['timings'] = self.detector.timing_summary()
+        reply['samples'] = metrics.drain()
+        self.conn.send((LANE_RESULT, attempt_id, reply))
+
+
+def lane_main(lane_id, camera_index, conn, cv_threads):
+    """Entry point of a lane worker process"""
+    # Each lane has its own core budget; OpenCV's pool would oversubscribe them
+    cv2.setNumThreads(cv_threads)
+    LaneWorker(lane_id, camera_index, conn).run()
+
+
+class Lane:
+    """Main-process handle for one lane worker process"""
+
+    def __init__(self, lane_id, camera_index, fingerprint_port, cv_threads=1):
+        context = multiprocessing.get_context('spawn')  # never fork a running Qt app
+        self.lane_id = lane_id
+        self.camera_index = camera_index
+        self.fingerprint_port = fingerprint_port
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=lane_main, name=f"lane-{lane_id}", daemon=True,
+                                       args=(lane_id, camera_index, child_conn, cv_threads))
+        self.time_to_first_frame = None
+        self.error = None  # last camera or gallery failure reported by the worker
+        self._attempts = itertools.count(1)
+        self._lock = threading.Lock()  # one reader of worker replies at a time
+        self._send_lock = threading.Lock()
+
+    def _send(self, command):
+        with self._send_lock:
+            self.conn.send(command)
+
+    def start(self):
+        self.process.start()
+
+    def set_gallery(self, store_path, model_name):
+        """Point the worker at a (re)built embedding store"""
+        self._send(('gallery', store_path, model_name))
+
+    def identify(self, timeout, should_continue=lambda: True):
+        """Run one face attempt in the worker
+
+        Returns ((decision, frames_kept) or None if cancelled, timing summary).
+        """
+        with self._lock:
+            attempt_id = next(self._attempts)
+            self._send(('identify', attempt_id, timeout))
+            cancelled = False
+            while True:
+                if not cancelled and not should_continue():
+                    self._send(('cancel', attempt_id))
+                    cancelled = True
+                if not self.conn.poll(0.1):
+                    if not self.process.is_alive():
+                        raise CameraUnavailable(f"Lane {self.lane_id} worker stopped")
+                    continue
+
+                message = self.conn.recv()
+                if message[0] != LANE_RESULT:
+                    self._status(message)
+                    continue
+                _, reply_id, reply = message
+                metrics.merge(reply['samples'])
+                if reply_id != attempt_id:
+                    continue
+                if reply['camera_error']:
+                    raise CameraUnavailable(reply['camera_error'])
+                if reply['error']:
+                    raise RuntimeError(reply['error'])
+                if cancelled or reply.get('cancelled'):
+                    return None, reply['timings']
+                return (reply['decision'], reply['frames']), reply['timings']
+
+    def poll_status(self):
+        """Consume status messages sent while the lane was idle; returns the last error"""
+        # Never wait behind a running attempt; it handles status messages itself
+        if self._lock.acquire(blocking=False):
+            try:
+                while self.conn.poll():
+                    self._status(self.conn.recv())
+            finally:
+                self._lock.release()
+        return self.error
+
+    def _status(self, message):
+        if message[0] == LANE_READY:
+            self.time_to_first_frame = message[1]
+        elif message[0] == LANE_ERROR:
+            self.error = message[1]
+            logger.warning(f"Lane {self.lane_id}: {message[1]}")
+
+    def stop(self, timeout=3.0):
+        if self.process.is_alive():
+            try:
+                self._send(('stop',))
+            except OSError:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.conn.close()
+
+
+def start_lanes(lane_config):
+    """Start one worker process per (camera index, fingerprint port) pair"""
+    cv_threads = max(1, (os.cpu_count() or 1) // max(len(lane_config), 1))
+    lanes = []
+    for lane_id, (camera_index, fingerprint_port) in enumerate(lane_config, start=1):
+        lane = Lane(lane_id, camera_index, fingerprint_port, cv_threads)
+        lane.start()
+        lanes.append(lane)
+    return lanes
@@ -0,0 +1,138 @@
+"""
+Matric number fallback for SVA Terminal
+
+When face and fingerprint both fail, the invigilator can find the
+student on an on-screen keypad instead. Every keystroke searches the
+exam's cached roster through its prefix index (RosterCache.search, via
+the verification engine), so matches appear as the number or name is
+typed, with no network call to Supabase. Picking a match does not
+verify the student by itself: the engine runs a fingerprint-only
+attempt, which passes only if the sensor finds the picked student's
+template (fingerprint_only). The face is not checked, since a 1:1
+face match is too weak to confirm a typed identity.
+"""
+
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QFrame, QGridLayout, QHBoxLayout, QLabel, QPushButton, QVBoxLayout
+
+from config import MATRIC_LOOKUP_RESULTS
+
+KEY_ROWS = ("1234567890", "QWERTYUIOP", "ASDFGHJKL/", "ZXCVBNM")
+
+KEY_STYLE = """
+    QPushButton {
+        background-color: white;
+        border: 1px solid #cbd5e1;
+        border-radius: 6px;
+    }
+    QPushButton:pressed {
+        background-color: #e2e8f0;
+    }
+"""
+
+MATCH_STYLE = """
+    QPushButton {
+        background-color: #eff6ff;
+        border: 1px solid #bfdbfe;
+        border-radius: 6px;
+        padding: 6px;
+        text-align: left;
+    }
+    QPushButton:pressed {
+        background-color: #dbeafe;
+    }
+"""
+
+
+class MatricLookupPanel(QFrame):
+    """On-screen keypad with type-ahead over an exam roster"""
+    student_picked = pyqtSignal(int)  # student id
+    cancelled = pyqtSignal()
+
+    def __init__(self, search, limit=MATRIC_LOOKUP_RESULTS, parent=None):
+        """search(query, limit) returns matching students, best first"""
+        super().__init__(parent)
+        self.search = search
+        self.limit = limit
+        self.query = ""
+        self.matches = []
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        layout.setSpacing(6)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.query_label = QLabel()
+        self.query_label.setFont(QFont("Arial", 18, QFont.Bold))
+        self.query_label.setStyleSheet("color: #1e293b; border-bottom: 2px solid #2563eb; padding: 4px;")
+        layout.addWidget(self.query_label)
+
+        # Fixed buttons reused for every query; unused ones are hidden
+        self.match_buttons = []
+        for i in range(self.limit):
+            button = QPushButton()
+            button.setFont(QFont("Arial", 13))
+            button.setMinimumHeight(36)
+            button.setStyleSheet(MATCH_STYLE)
+            button.clicked.connect(lambda _, i=i: self.pick(i))
+            layout.addWidget(button)
+            self.match_buttons.append(button)
+
+        keypad = QGridLayout()
+        keypad.setSpacing(4)
+        for row, keys in enumerate(KEY_ROWS):
+            for column, key in enumerate(keys):
+                keypad.addWidget(self.key_button(key, lambda _, key=key: self.type_text(key)), row, column)
+        keypad.addWidget(self.key_button("Space", lambda: self.type_text(" ")), 3, 7, 1, 3)
+        layout.addLayout(keypad)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.key_button("⌫", self.backspace))
+        controls.addWidget(self.key_button("Clear", self.clear))
+        controls.addWidget(self.key_button("Cancel", self.cancelled.emit))
+        layout.addLayout(controls)
+
+        self.setLayout(layout)
+        self.show_matches()
+
+    def key_button(self, text, slot):
+        button = QPushButton(text)
+        button.setFont(QFont("Arial", 14, QFont.Bold))
+        button.setMinimumHeight(40)
+        button.setFocusPolicy(Qt.NoFocus)
+        button.setStyleSheet(KEY_STYLE)
+        button.clicked.connect(slot)
+        return button
+
+    def type_text(self, text):
+        if text == " " and (not self.query or self.query.endswith(" ")):
+            return
+        self.query += text
+        self.show_matches()
+
+    def backspace(self):
+        self.query = self.query[:-1]
+        self.show_matches()
+
+    def clear(self):
+        self.query = ""
+        self.show_matches()
+
+    def show_matches(self):
+        """Search the roster for the typed text and list the best matches"""
+        self.matches = self.search(self.query, self.limit) if self.query.strip() else []
+        self.query_label.setText(self.query or "Type a matric number or name")
+        for button, student in zip(self.match_buttons, self.matches):
+            button.setText(f"{student['matric_number']}  -  {student['name']}")
+            button.setVisible(True)
+        for button in self.match_buttons[len(self.matches):]:
+            button.setVisible(False)
+        if self.query.strip() and not self.matches:
+            self.match_buttons[0].setText("No match on this exam's roster")
+            self.match_buttons[0].setVisible(True)
+
+    def pick(self, index):
+        if index < len(self.matches):
+            self.student_picked.emit(self.matches[index]['id'])
@@ -0,0 +1,141 @@
+"""
+Verification orchestrator for SVA Terminal
+
+Runs face recognition and fingerprint matching at the same time instead
+of one after the other, combines their results with a configurable
+fusion policy and cancels whichever modality is still running once the
+outcome is known.
+
+Policies:
+    both    face and fingerprint must both match the same student
+    either  the first modality to match decides
+    score   weighted sum of the face similarity and the normalised
+            sensor accuracy must reach FUSION_SCORE_THRESHOLD
+"""
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from config import (FUSION_POLICY, FUSION_FACE_WEIGHT, FUSION_SCORE_THRESHOLD,
+                    FINGERPRINT_FULL_ACCURACY)
+
+FACE = 'face'
+FINGERPRINT = 'fingerprint'
+POLICIES = ('both', 'either', 'score')
+
+# attendance.verification_method values
+METHOD_BOTH = 'face+fingerprint'
+METHOD_FACE = 'face_only'
+METHOD_FINGERPRINT = 'fingerprint_only'
+
+
+class VerificationOrchestrator(QObject):
+    """Runs both modalities concurrently and fuses their results"""
+    stage_result = pyqtSignal(str, bool, int, str)  # modality, success, student id (-1), message
+    decided = pyqtSignal(bool, int, str, str)  # success, student id (-1), method, message
+
+    def __init__(self, policy=FUSION_POLICY, face_weight=FUSION_FACE_WEIGHT,
+                 score_threshold=FUSION_SCORE_THRESHOLD):
+        super().__init__()
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown fusion policy: {policy}")
+        self.policy = policy
+        self.face_weight = face_weight
+        self.score_threshold = score_threshold
+        self.threads = {}
+        self.results = {}
+        self.pending = {}  # modality -> (student id, score) reported before it finished
+        self.active = False
+
+    def start(self, face_thread, fingerprint_thread):
+        """Start both modality threads; either may be None if unavailable"""
+        self.threads = {FACE: face_thread, FINGERPRINT: fingerprint_thread}
+        self.results = {}
+        self.pending = {}
+        self.active = True
+
+        if face_thread is not None:
+            face_thread.face_identified.connect(lambda sid, score: self._identified(FACE, sid, score))
+            face_thread.face_detected.connect(lambda ok, msg: self._finished(FACE, ok, msg))
+        else:
+            self.results[FACE] = (False, None, 0.0, "Face recognition not available")
+        if fingerprint_thread is not None:
+            fingerprint_thread.fingerprint_identified.connect(
+                lambda sid, accuracy: self._identified(
+                    FINGERPRINT, sid, min(accuracy / FINGERPRINT_FULL_ACCURACY, 1.0)))
+            fingerprint_thread.fingerprint_verified.connect(
+                lambda ok, msg: self._finished(FINGERPRINT, ok, msg))
+        else:
+            self.results[FINGERPRINT] = (False, None, 0.0, "Fingerprint scanner not available")
+
+        for thread in self.threads.values():
+            if thread is not None:
+                thread.start()
+        self._evaluate()
+
+    def cancel(self):
+        """Stop any modality that is still running"""
+        self.active = False
+        for thread in self.threads.values():
+            if thread is not None and thread.isRunning():
+                thread.stop()
+
+    def _identified(self, modality, student_id, score):
+        self.pending[modality] = (student_id, score)
+
+    def _finished(self, modality, success, message):
+        if not self.active or modality in self.results:
+            return
+        student_id, score = self.pending.pop(modality, (None, 0.0))
+        success = success and student_id is not None
+        self.results[modality] = (success, student_id, score, message)
+        self.stage_result.emit(modality, success, student_id if student_id is not None else -1, message)
+        self._evaluate()
+
+    def _evaluate(self):
+        if not self.active:
+            return
+        decision = getattr(self, f"_decide_{self.policy}")()
+        if decision is not None:
+            self.cancel()
+            success, student_id, method, message = decision
+            self.decided.emit(success, student_id if student_id is not None else -1, method, message)
+
+    def _decide_both(self):
+        face, finger = self.results.get(FACE), self.results.get(FINGERPRINT)
+        for result in (face, finger):
+            if result is not None and not result[0]:
+                return False, (face or finger)[1], METHOD_BOTH, result[3]
+        if face is None or finger is None:
+            return None
+        if face[1] != finger[1]:
+            return False, face[1], METHOD_BOTH, "Face and fingerprint belong to different students"
+        return True, face[1], METHOD_BOTH, "Face and fingerprint verified"
+
+    def _decide_either(self):
+        for modality, method in ((FACE, METHOD_FACE), (FINGERPRINT, METHOD_FINGERPRINT)):
+            result = self.results.get(modality)
+            if result is not None and result[0]:
+                return True, result[1], method, result[3]
+        if len(self.results) == 2:
+            return False, None, METHOD_BOTH, self.results[FINGERPRINT][3]
+        return None
+
+    def _decide_score(self):
+        weights = {FACE: self.face_weight, FINGERPRINT: 1.0 - self.face_weight}
+        matched = {m: r for m, r in self.results.items() if r[0]}
+        student_ids = {r[1] for r in matched.values()}
+        if len(student_ids) > 1:
+            return False, None, METHOD_BOTH, "Face and fingerprint belong to different students"
+
+        combined = sum(weights[m] * r[2] for m, r in matched.items())
+        pending_weight = sum(w for m, w in weights.items() if m not in self.results)
+        method = METHOD_BOTH if len(matched) != 1 else \
+            (METHOD_FACE if FACE in matched else METHOD_FINGERPRINT)
+
+        if matched and combined >= self.score_threshold:
+            return True, student_ids.pop(), method, f"Verified (combined score {combined:.2f})"
+        if combined + pending_weight < self.score_threshold:
+            # Even a perfect result from the remaining modality cannot pass
+            return False, next(iter(student_ids), None), method, \
+                f"Verification failed (combined score {combined:.2f})"
+        return None
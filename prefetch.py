@@ -0,0 +1,191 @@
+"""
+Exam-day prefetch for SVA Terminal
+
+A background thread asks the database for upcoming exams through the
+get_upcoming_exams(days_ahead) function, once per PREFETCH_INTERVAL.
+For each exam, soonest first, it refreshes the roster cache (records,
+photos and fingerprint templates) and syncs the exam's embedding store,
+exactly as a session would. An invigilator who selects a prefetched
+exam can therefore start verifying straight from disk, even with the
+network down.
+
+After each exam the roster cache is trimmed to PREFETCH_DISK_BUDGET_MB
+by evicting least recently used rosters. Rosters of upcoming exams and
+of the exam in session are never evicted. Once these alone fill the
+budget, later exams are left for a session to fetch.
+
+The upcoming exam list is also remembered on disk, so exam selection
+has something to offer when the exam list request fails.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import (ROSTER_CACHE_DIR, ENROLLMENT_DIR, PREFETCH_INTERVAL, PREFETCH_DAYS_AHEAD,
+                    PREFETCH_DISK_BUDGET_MB)
+
+logger = logging.getLogger(__name__)
+
+EXAM_LIST_FILE = "exams.json"
+
+_exam_list_lock = threading.Lock()
+
+
+def fetch_upcoming_exams(client, days_ahead=PREFETCH_DAYS_AHEAD):
+    """Exams in the next days_ahead days, soonest first, shaped like fetch_exams rows"""
+    rows = client.rpc('get_upcoming_exams', {'days_ahead': days_ahead}).execute().data
+    exams = []
+    for row in rows:
+        courses = {'course_code': row['course_code'], 'course_name': row['course_name']}
+        if 'department' in row:
+            courses['department'] = row['department']
+        exams.append({'id': row['exam_id'], 'course_id': row['course_id'],
+                      'exam_datetime': row['exam_datetime'], 'courses': courses})
+    return exams
+
+
+def exam_date(exam):
+    return datetime.fromisoformat(exam['exam_datetime'].replace('Z', '+00:00')).date()
+
+
+def merge_exam(known, exam):
+    """known with exam's fields laid over it; nested dicts such as courses are merged too
+
+    An exam from get_upcoming_exams carries fewer fields than a full
+    exams row, so it must not replace the row remembered for it.
+    """
+    merged = dict(known)
+    for key, value in exam.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_exam(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def remember_exams(exams, removed=(), cache_dir=ROSTER_CACHE_DIR):
+    """Merge exams into the list kept on disk for offline exam selection, dropping removed ids"""
+    path = os.path.join(cache_dir, EXAM_LIST_FILE)
+    with _exam_list_lock:
+        known = {exam['id']: exam for exam in remembered_exams(cache_dir)}
+        for exam in exams:
+            known[exam['id']] = merge_exam(known.get(exam['id'], {}), exam)
+        for exam_id in removed:
+            known.pop(exam_id, None)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sorted(known.values(), key=lambda exam: exam['exam_datetime']), f)
+        os.replace(tmp_path, path)
+
+
+def remembered_exams(cache_dir=ROSTER_CACHE_DIR):
+    """Exams from today onwards seen in earlier exam lists, soonest first"""
+    try:
+        with open(os.path.join(cache_dir, EXAM_LIST_FILE)) as f:
+            exams = json.load(f)
+    except (OSError, ValueError):
+        return []
+    today = datetime.now().date()
+    return [exam for exam in exams if exam_date(exam) >= today]
+
+
+class PrefetchThread(QThread):
+    """Keep the rosters and embeddings of upcoming exams cached ahead of time"""
+    prefetch_status = pyqtSignal(int, int, str)  # exams prefetched, exams upcoming, error ('' when healthy)
+
+    def __init__(self, supabase_client, interval=PREFETCH_INTERVAL,
+                 budget_mb=PREFETCH_DISK_BUDGET_MB):
+        super().__init__()
+        self.supabase = supabase_client
+        self.interval = interval
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.running = True
+        self._active = set()  # exams in session; their screen refreshes them itself
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def set_active(self, exam_id, active=True):
+        """Called from the GUI thread when a session for exam_id starts or ends"""
+        with self._lock:
+            if active:
+                self._active.add(exam_id)
+            else:
+                self._active.discard(exam_id)
+
+    def active(self):
+        with self._lock:
+            return set(self._active)
+
+    def run(self):
+        from camera import load_face_cascade
+        from enrollment import Enrollment
+        from face_engine import FaceEmbedder
+
+        try:
+            self.embedder = FaceEmbedder()
+            self.face_cascade = load_face_cascade(shared=False)
+            self.enrollment = Enrollment.open(ENROLLMENT_DIR, self.embedder.model_name)
+        except Exception as e:
+            self.prefetch_status.emit(0, 0, f"Prefetch disabled, face models unavailable: {e}")
+            return
+        while self.running:
+            try:
+                prefetched, upcoming = self.prefetch_once()
+                self.prefetch_status.emit(prefetched, upcoming, "")
+            except Exception as e:
+                self.prefetch_status.emit(0, 0, str(e))
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def prefetch_once(self):
+        """One pass over the upcoming exams; returns (exams prefetched, exams upcoming)"""
+        from roster_cache import evict_roster_caches
+
+        exams = fetch_upcoming_exams(self.supabase)
+        remember_exams(exams)
+        upcoming = {exam['id'] for exam in exams}
+        prefetched = 0
+        for index, exam in enumerate(exams):
+            if not self.running:
+                break
+            active = self.active()
+            if exam['id'] in active:
+                continue
+            self.prefetch_exam(exam)
+            prefetched += 1
+
+            evicted, used = evict_roster_caches(self.budget_bytes, keep=upcoming | active)
+            if evicted:
+                logger.info(f"Evicted cached rosters of exams {evicted}")
+            if used > self.budget_bytes and index + 1 < len(exams):
+                logger.warning(f"Roster cache is full ({used / 2**20:.0f} MB); "
+                               f"{len(exams) - index - 1} later exams not prefetched")
+                break
+        return prefetched, len(exams)
+
+    def prefetch_exam(self, exam):
+        """Bring one exam's roster cache and embedding store up to date"""
+        from embedding_store import EmbeddingStore
+        from face_engine import embedding_store_path, sync_store_with_roster
+        from roster_cache import exam_lock, open_roster
+
+        with exam_lock(exam['id']):
+            roster = open_roster(exam)
+            changed, removed = roster.refresh(self.supabase)
+            store = EmbeddingStore.open_or_create(embedding_store_path(roster),
+                                                  self.embedder.dim, self.embedder.model_name)
+            embedded = sync_store_with_roster(store, roster, self.embedder, self.face_cascade,
+                                              self.enrollment, lambda: self.running)
+        logger.info(f"Prefetched exam {exam['id']} ({exam['courses']['course_code']}): "
+                    f"{len(roster)} students, {len(changed)} updated, {len(removed)} removed, "
+                    f"{embedded} embedded")
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
@@ -0,0 +1,115 @@
+"""
+Live camera preview for SVA Terminal
+
+The capture thread hands every frame to the preview, which keeps only
+the newest one. At most one repaint request is queued to the GUI thread
+at a time; frames that arrive before it is painted replace the pending
+frame instead of queueing behind it. So a busy event loop drops preview
+frames, and neither the event loop nor the capture loop ever waits.
+
+Frames are wrapped in a QImage that points at the numpy buffer (with its
+row stride as bytesPerLine), so nothing is copied per frame. This is
+safe because cv2.VideoCapture.read() allocates a fresh array for each
+frame and nobody writes to a frame once it has been published. The
+image is scaled while painting, to fit the widget. The widget never
+grows beyond the SCREEN_WIDTH x SCREEN_HEIGHT display.
+"""
+
+import threading
+import time
+
+from PyQt5.QtCore import Qt, QRectF, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+from config import SCREEN_WIDTH, SCREEN_HEIGHT
+from instrumentation import metrics, PREVIEW_PAINT
+
+BOX_HOLD = 0.3  # seconds a detection box stays on screen without a new detection
+
+
+class CameraPreview(QWidget):
+    """Shows the newest camera frame with the latest face detection boxes"""
+    frame_posted = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMaximumSize(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self._lock = threading.Lock()
+        self._frame = None  # (seq, frame) waiting to be painted or last painted
+        self._faces = ([], 0.0)  # (boxes in frame coordinates, monotonic time)
+        self._pending = False  # a repaint request is queued
+        self._visible = False
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        # Emitted from the capture thread, so the repaint is queued to the GUI thread
+        self.frame_posted.connect(self.update)
+
+    def offer_frame(self, seq, frame):
+        """Capture thread: make this the frame to show next; never blocks"""
+        if not self._visible:
+            return
+        with self._lock:
+            if self._pending:
+                self.frames_dropped += 1
+            self._frame = (seq, frame)
+            post = not self._pending
+            self._pending = True
+        if post:
+            self.frame_posted.emit()
+
+    def show_faces(self, boxes):
+        """Any thread: draw these (x, y, w, h) boxes over the following frames"""
+        with self._lock:
+            self._faces = (list(boxes), time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._frame = None
+            self._faces = ([], 0.0)
+        self.update()
+
+    def showEvent(self, event):
+        self._visible = True
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._visible = False
+        super().hideEvent(event)
+
+    def paintEvent(self, event):
+        started = time.perf_counter()
+        with self._lock:
+            latest = self._frame
+            boxes, detected_at = self._faces
+            self._pending = False
+
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        if latest is None:
+            painter.end()
+            return
+
+        frame = latest[1]
+        if not frame.flags['C_CONTIGUOUS']:
+            frame = frame.copy()
+        height, width = frame.shape[:2]
+        image_format = QImage.Format_Grayscale8 if frame.ndim == 2 else QImage.Format_BGR888
+        # The QImage borrows frame's buffer; frame stays referenced until painting ends
+        image = QImage(frame.data, width, height, frame.strides[0], image_format)
+
+        scale = min(self.width() / width, self.height() / height)
+        target = QRectF((self.width() - width * scale) / 2, (self.height() - height * scale) / 2,
+                        width * scale, height * scale)
+        painter.drawImage(target, image)
+
+        if boxes and time.monotonic() - detected_at <= BOX_HOLD:
+            painter.setPen(QPen(QColor("#16a34a"), 3))
+            for x, y, w, h in boxes:
+                painter.drawRect(QRectF(target.x() + x * scale, target.y() + y * scale,
+                                        w * scale, h * scale))
+        painter.end()
+        self.frames_shown += 1
+        metrics.record(PREVIEW_PAINT, (time.perf_counter() - started) * 1000)
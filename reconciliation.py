@@ -0,0 +1,142 @@
+"""
+End-of-exam attendance reconciliation for SVA Terminal
+
+When the invigilator closes an exam, the terminal works out who never
+turned up instead of leaving that to the admin dashboard:
+
+1. The cached roster is diffed against the students verified for the
+   exam: those verified here, plus those the server has from other
+   terminals. If the server's list cannot be fetched, nothing is
+   written: the close is kept in the attendance queue and the sync
+   thread runs it again later, so a student verified on another
+   terminal is never marked absent.
+2. Every student left over gets an Absent row. The rows are queued in a
+   single transaction and use client_refs derived from the exam and the
+   student, so closing the exam twice adds nothing.
+3. Everything still queued, absentees included, is uploaded in one
+   multi-row upsert. If that fails, the attendance sync thread keeps
+   retrying as usual.
+4. A summary is written under SESSION_SUMMARY_DIR and upserted into
+   exam_summaries. It holds roster, verified and absent counts, this
+   terminal's attempts and success rate, and per-stage latency
+   percentiles for this exam's session. Dashboards read that one row instead of aggregating the
+   attendance table. The close stays in the queue until this upsert
+   succeeds, so a summary the server missed is published on a retry.
+
+The work runs as a DataService request, so the UI returns to exam
+selection straight away.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from config import SESSION_SUMMARY_DIR
+from attendance_queue import absent_record, upload_pending
+from data_access import fetch_verified_students
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def rate(part, whole):
+    """part as a percentage of whole, to two decimals; None when whole is 0"""
+    return round(part * 100.0 / whole, 2) if whole else None
+
+
+def exam_summary(exam_data, roster_ids, verified_ids, absent_ids, report):
+    """Counts, rates and stage latencies for a closed exam, from a metrics snapshot"""
+    session = report.get('sessions', {}).get(str(exam_data['id']), {})
+    # Only the samples recorded during this exam's session, not the process-wide windows
+    attempts_verified, attempts_failed = session.get('verified', 0), session.get('failed', 0)
+    verified = len(verified_ids & roster_ids)
+    return {
+        'exam_id': exam_data['id'],
+        'course_code': (exam_data.get('courses') or {}).get('course_code'),
+        'closed_at': datetime.now(timezone.utc).isoformat(),
+        'roster_size': len(roster_ids),
+        'verified_count': verified,
+        'absent_count': len(absent_ids),
+        'verified_attempts': attempts_verified,
+        'failed_attempts': attempts_failed,
+        'success_rate': rate(attempts_verified, attempts_verified + attempts_failed),
+        'attendance_rate': rate(verified, len(roster_ids)),
+        'stage_latency': {
+            stage: {key: round(value, 1) if isinstance(value, float) else value
+                    for key, value in stats.items()}
+            for stage, stats in sorted(session.get('stages', {}).items())
+        },
+    }
+
+
+def write_summary(summary, directory=SESSION_SUMMARY_DIR):
+    """Write a summary as JSON next to the logs; returns its path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"exam_{summary['exam_id']}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def close_exam(client, queue, exam_data, roster_ids, report):
+    """Queue absentees, upload the queue in one request and publish the summary
+
+    Runs on a DataService worker (client is the Supabase client), or on
+    the attendance sync thread for a deferred close. report is a metrics
+    snapshot taken when the exam was closed. Returns the summary, with
+    'uploaded' and 'pending' added, or {'exam_id', 'deferred': True} when
+    the server's verified students could not be fetched and the close
+    was put back in the queue. A summary whose upsert failed is returned
+    with 'deferred': True too; the close stays queued until it is stored.
+    """
+    exam_id = exam_data['id']
+    roster_ids = set(roster_ids)
+    verified = queue.verified_students(exam_id)
+    try:
+        verified |= fetch_verified_students(client, exam_id)
+    except Exception as e:
+        queue.defer_close(exam_data, roster_ids, report)
+        logger.warning(f"Could not load verified students for exam {exam_id} ({e}); "
+                       f"closing it is deferred until the server can be reached")
+        return {'exam_id': exam_id, 'deferred': True}
+
+    absent = sorted(roster_ids - verified)
+    # A retried close finds its absentees still queued if they were not uploaded yet
+    queued = {record['client_ref'] for _, record in queue.peek_batch(queue.pending_count())}
+    records = [absent_record(exam_id, student_id) for student_id in absent]
+    queue.enqueue_many([record for record in records if record['client_ref'] not in queued])
+    try:
+        uploaded = upload_pending(client, queue)
+    except Exception as e:
+        uploaded = 0
+        logger.warning(f"Bulk attendance upload failed ({e}); the sync thread will retry")
+
+    summary = exam_summary(exam_data, roster_ids, verified, absent, report)
+    path = write_summary(summary)
+    try:
+        row = {key: value for key, value in summary.items() if key != 'course_code'}
+        client.table('exam_summaries').upsert(row, on_conflict='exam_id').execute()
+    except Exception as e:
+        queue.defer_close(exam_data, roster_ids, report)
+        summary['deferred'] = True
+        logger.warning(f"Could not publish the summary of exam {exam_id} ({e}); kept in {path} "
+                       f"and the close is retried")
+    else:
+        queue.drop_close(exam_id)
+
+    summary.update(uploaded=uploaded, pending=queue.pending_count())
+    logger.info(f"Closed exam {exam_id}: {summary['verified_count']} of {summary['roster_size']} "
+                f"verified, {summary['absent_count']} absent, success rate "
+                f"{summary['success_rate'] if summary['success_rate'] is not None else '-'}%, "
+                f"{uploaded} rows uploaded, {summary['pending']} still queued")
+    return summary
+
+
+def submit_close(data_service, queue, exam_data, roster_ids):
+    """Run close_exam on a DataService worker, under the request key close:<exam id>"""
+    return data_service.submit(f"close:{exam_data['id']}", close_exam, queue, exam_data,
+                               list(roster_ids), metrics.snapshot())
@@ -0,0 +1,579 @@
+"""
+Per-exam student roster cache for SVA Terminal
+
+At session start the roster for the exam's course (student_courses
+joined to students) is fetched in pages and stored on disk together
+with student photos and fingerprint templates. After that, verifying a
+student does not touch the network. Later refreshes only ask for
+students whose record or enrollment changed, or who were removed, after
+the cached high-water mark (see delta_sync.py). A session keeps polling
+for these deltas, so a late registration reaches the kiosk in seconds.
+
+A sorted prefix index over matric numbers and names backs the matric
+number fallback, so type-ahead never touches the network.
+
+Records are StudentRecord objects with fixed slots, with fingerprint
+templates kept as raw bytes. The roster file and the photos are sealed
+(secure_store.py): compressed where it helps, and encrypted with the
+kiosk's cache key. Rosters stay in memory after use, so the next
+session or a prefetched exam starts without reading the disk. Least
+recently used rosters are dropped from memory beyond
+CACHE_MEMORY_BUDGET_MB. footprint() reports the bytes each student
+costs in memory and on disk.
+
+Rosters of upcoming exams are also fetched ahead of time (prefetch.py).
+The cache directory is kept under a disk budget by evicting the least
+recently used exam rosters. A per-exam lock keeps the prefetcher and a
+running session from writing the same exam's files at once.
+"""
+
+import base64
+import bisect
+import heapq
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import (ROSTER_CACHE_DIR, ROSTER_PAGE_SIZE, PHOTO_DOWNLOAD_WORKERS,
+                    CONNECTION_TIMEOUT, CACHE_MEMORY_BUDGET_MB)
+from delta_sync import newest_stamp, overlap_since, fetch_deleted_rows, stamp_moment
+from fingerprint import decode_template
+from secure_store import SealError, read_sealed, write_sealed
+
+logger = logging.getLogger(__name__)
+
+STUDENT_FIELDS = ("id, matric_number, name, class, department, faculty, "
+                  "photo_url, fingerprint_template, updated_at")
+EXAM_DIR_PREFIX = "exam_"
+LAST_USED_FILE = "last_used"
+ROSTER_FILE = "roster.bin"
+LEGACY_ROSTER_FILE = "roster.json"  # unsealed roster written by earlier versions
+
+_exam_locks = {}
+_exam_locks_guard = threading.Lock()
+_open_rosters = OrderedDict()  # (cache dir, exam id) -> RosterCache, least recently used first
+_open_rosters_lock = threading.Lock()
+
+
+def exam_lock(exam_id):
+    """The lock held while an exam's roster cache is being written"""
+    with _exam_locks_guard:
+        return _exam_locks.setdefault(exam_id, threading.Lock())
+
+
+class StudentRecord:
+    """One roster student in fixed slots rather than a Supabase row dict
+
+    Reads like the row it was built from (record['name'],
+    record.get('photo_path')). The fingerprint template is held as the
+    sensor's characteristic bytes instead of base64 text, and strings
+    that repeat across a roster (class, department, faculty, stamps)
+    are interned so students share them.
+    """
+    FIELDS = ('id', 'matric_number', 'name', 'class', 'department', 'faculty', 'photo_url',
+              'fingerprint_template', 'updated_at', 'synced_at', 'photo_path')
+    SOURCE_FIELDS = FIELDS[:-1]  # photo_path is set by this kiosk, not fetched
+    INTERNED = ('class', 'department', 'faculty', 'updated_at', 'synced_at')
+    ATTRIBUTES = {field: 'class_' if field == 'class' else field for field in FIELDS}
+    __slots__ = tuple(ATTRIBUTES.values())
+
+    def __init__(self, **fields):
+        for field, attribute in self.ATTRIBUTES.items():
+            value = fields.get(field)
+            if field in self.INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, attribute, value)
+
+    @classmethod
+    def from_row(cls, row, synced_at=None):
+        """A record from a students row; an invalid template is dropped"""
+        fields = {field: row.get(field) for field in cls.SOURCE_FIELDS}
+        template = row.get('fingerprint_template')
+        if isinstance(template, str):
+            characteristics = decode_template(template)
+            fields['fingerprint_template'] = bytes(characteristics) if characteristics else None
+        fields['synced_at'] = synced_at or row.get('synced_at')
+        fields['photo_path'] = row.get('photo_path')
+        return cls(**fields)
+
+    @classmethod
+    def from_saved(cls, values, field_names=FIELDS):
+        """A record from a row of values, in FIELDS order unless given, as save() writes them"""
+        fields = dict(zip(field_names, values))
+        if fields['fingerprint_template']:
+            fields['fingerprint_template'] = base64.b64decode(fields['fingerprint_template'])
+        return cls(**fields)
+
+    def saved(self):
+        """Values in FIELDS order, for JSON"""
+        values = [getattr(self, attribute) for attribute in self.ATTRIBUTES.values()]
+        template = self.fingerprint_template
+        values[self.FIELDS.index('fingerprint_template')] = \
+            base64.b64encode(template).decode() if template else None
+        return values
+
+    def source_values(self):
+        return tuple(getattr(self, self.ATTRIBUTES[field]) for field in self.SOURCE_FIELDS)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, self.ATTRIBUTES[field])
+        except KeyError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field, value):
+        try:
+            setattr(self, self.ATTRIBUTES[field], value)
+        except KeyError:
+            raise KeyError(field) from None
+
+    def __contains__(self, field):
+        return field in self.ATTRIBUTES
+
+    def get(self, field, default=None):
+        attribute = self.ATTRIBUTES.get(field)
+        return getattr(self, attribute) if attribute else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def items(self):
+        return [(field, getattr(self, attribute)) for field, attribute in self.ATTRIBUTES.items()]
+
+    def __repr__(self):
+        return f"StudentRecord(id={self.id!r}, matric_number={self.matric_number!r})"
+
+
+def normalise(text):
+    """Case- and spacing-insensitive form of a search key or query"""
+    return " ".join(str(text).casefold().split())
+
+
+class RosterIndex:
+    """Sorted (key, student id) pairs answering prefix queries with bisect
+
+    Every student is indexed under their matric number, each tail of it
+    after a '/' (so "0042" finds CSC/2021/0042) and each word of their
+    name. A query matches a student when each of its words is a prefix
+    of one of their keys.
+    """
+
+    def __init__(self, students):
+        self.students = {student['id']: student for student in students}
+        keys, ids = [], []
+        for student in self.students.values():
+            parts = normalise(student['matric_number']).split('/')
+            words = ['/'.join(parts[i:]) for i in range(len(parts))]
+            words.extend((student.get('name') or "").casefold().split())
+            keys.extend(words)
+            ids.extend([student['id']] * len(words))
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.ids = [ids[i] for i in order]
+
+    def prefix_ids(self, prefix):
+        """Ids of students with a key starting with prefix"""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\U0010ffff", start)
+        return set(self.ids[start:end])
+
+    def search(self, query, limit=None):
+        """Students matching every word of query, whole matric prefixes first"""
+        query = normalise(query)
+        if not query:
+            return []
+        words = query.split()
+        ids = self.prefix_ids(words[0])
+        for word in words[1:]:
+            if not ids:
+                break
+            ids &= self.prefix_ids(word)
+        def rank(student_id):
+            matric = self.students[student_id]['matric_number']
+            return not normalise(matric).startswith(query), matric
+
+        ordered = heapq.nsmallest(limit, ids, key=rank) if limit else sorted(ids, key=rank)
+        return [self.students[student_id] for student_id in ordered]
+
+
+class RosterCache:
+    """On-disk roster for one exam with in-memory indexes"""
+
+    def __init__(self, exam_data, cache_dir=ROSTER_CACHE_DIR):
+        self.exam_id = exam_data['id']
+        self.course_id = exam_data['course_id']
+        self.dir = os.path.join(cache_dir, f"{EXAM_DIR_PREFIX}{self.exam_id}")
+        self.photos_dir = os.path.join(self.dir, "photos")
+        self.students = {}  # student id -> record
+        self.by_matric = {}  # matric number -> record
+        self.high_water = None  # newest change (updated_at or deleted_at) seen
+        self._search_index = None  # RosterIndex, rebuilt on the first search after a change
+        self._memory_bytes = None  # memory_bytes(), recomputed after a change
+        self.lock = exam_lock(self.exam_id)
+        self.load()
+
+    @property
+    def roster_path(self):
+        return os.path.join(self.dir, ROSTER_FILE)
+
+    def load(self):
+        """Load the cached roster from disk, if present"""
+        legacy_path = os.path.join(self.dir, LEGACY_ROSTER_FILE)
+        try:
+            if os.path.exists(self.roster_path):
+                data = json.loads(read_sealed(self.roster_path))
+                field_names = data.get('fields', StudentRecord.FIELDS)
+                students = [StudentRecord.from_saved(values, field_names)
+                            for values in data.get('students', [])]
+            elif os.path.exists(legacy_path):
+                with open(legacy_path) as f:
+                    data = json.load(f)
+                students = [StudentRecord.from_row(row) for row in data.get('students', [])]
+            else:
+                return False
+        except (OSError, ValueError, TypeError, SealError) as e:
+            logger.warning(f"Ignoring unreadable roster cache in {self.dir}: {e}")
+            return False
+        self.high_water = data.get('high_water')
+        self.students = {}
+        self.by_matric = {}
+        self._search_index = None
+        for student in students:
+            self._index(student)
+        return True
+
+    def save(self):
+        """Atomically write the roster to disk, sealed"""
+        write_sealed(self.roster_path, json.dumps({
+            'exam_id': self.exam_id,
+            'course_id': self.course_id,
+            'high_water': self.high_water,
+            'fields': StudentRecord.FIELDS,
+            'students': [student.saved() for student in list(self.students.values())],
+        }).encode())
+        legacy_path = os.path.join(self.dir, LEGACY_ROSTER_FILE)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def mark_used(self):
+        """Record that this roster was just used, for least-recently-used eviction"""
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, LAST_USED_FILE), 'w') as f:
+            f.write(str(time.time()))
+
+    def _index(self, student):
+        self._search_index = self._memory_bytes = None
+        old = self.students.get(student['id'])
+        if old and old['matric_number'] != student['matric_number']:
+            self.by_matric.pop(old['matric_number'], None)
+        self.students[student['id']] = student
+        self.by_matric[student['matric_number']] = student
+        
+    def _remove(self, student_id):
+        student = self.students.pop(student_id, None)
+        if student is None:
+            return False
+        self._search_index = self._memory_bytes = None
+        if self.by_matric.get(student['matric_number']) is student:
+            del self.by_matric[student['matric_number']]
+        if student.get('photo_path') and os.path.exists(student['photo_path']):
+            os.remove(student['photo_path'])
+        return True
+        
+    def _differs(self, student):
+        """Whether a fetched record changes the cached one (overlap re-reads do not)"""
+        old = self.students.get(student['id'])
+        return old is None or old.source_values() != student.source_values()
+
+    def get(self, student_id):
+        return self.students.get(student_id)
+
+    def find_by_matric(self, matric_number):
+        return self.by_matric.get(matric_number)
+        
+    def search(self, query, limit=None):
+        """Students whose matric number or name words start with the query's words"""
+        index = self._search_index
+        if index is None:
+            # list() copies in one step while a refresh may be changing the dict
+            index = self._search_index = RosterIndex(list(self.students.values()))
+        return index.search(query, limit)
+
+    def __len__(self):
+        return len(self.students)
+
+    def memory_bytes(self):
+        """Approximate bytes the records and indexes hold; strings shared by students count once"""
+        if self._memory_bytes is None:
+            seen = set()
+
+            def size(value):
+                if value is None or id(value) in seen:
+                    return 0
+                seen.add(id(value))
+                return sys.getsizeof(value)
+
+            students = list(self.students.values())
+            total = sys.getsizeof(self.students) + sys.getsizeof(self.by_matric)
+            for student in students:
+                total += sys.getsizeof(student) + size(student.id)
+                total += sum(size(value) for _, value in student.items()[1:])
+            index = self._search_index
+            if index is not None:
+                total += sys.getsizeof(index.keys) + sys.getsizeof(index.ids) + sys.getsizeof(index.students)
+                total += sum(size(key) for key in index.keys)
+            self._memory_bytes = total
+        return self._memory_bytes
+
+    def footprint(self):
+        """Roster size in memory and on disk, in total and per student"""
+        students = max(len(self), 1)
+        memory, disk = self.memory_bytes(), directory_size(self.dir)
+        return {'students': len(self), 'memory_bytes': memory, 'disk_bytes': disk,
+                'memory_bytes_per_student': memory / students, 'disk_bytes_per_student': disk / students}
+
+    def fetch_pages(self, supabase_client, column=None, since=None):
+        """Yield roster rows page by page, optionally only those with column after since
+        
+        Rows become StudentRecords, each with a synced_at: the newer of
+        the student's and the enrollment's updated_at.
+        """
+        start = 0
+        while True:
+            # students!inner lets a students.updated_at filter restrict the parent rows
+            query = supabase_client.table('student_courses').select(
+                f"student_id, updated_at, students!inner({STUDENT_FIELDS})"
+            ).eq('course_id', self.course_id)
+            if since:
+                query = query.gt(column, since)
+            response = query.order('student_id').range(start, start + ROSTER_PAGE_SIZE - 1).execute()
+
+            rows = response.data
+            for row in rows:
+                student = row['students']
+                yield StudentRecord.from_row(
+                    student, newest_stamp(student.get('updated_at'), row.get('updated_at')))
+            if len(rows) < ROSTER_PAGE_SIZE:
+                break
+            start += ROSTER_PAGE_SIZE
+
+    def fetch_changes(self, supabase_client, since=None):
+        """Students changed and removed after since; returns (records by id, removed ids, high-water)
+
+        Without since, every enrolled student is returned.
+        """
+        if not since:
+            changed = {student['id']: student for student in self.fetch_pages(supabase_client)}
+            return changed, set(), newest_stamp(*(s['synced_at'] for s in changed.values()))
+
+        reread_from = overlap_since(since)
+        changed = {}
+        # A changed student record, or a new or changed enrollment
+        for column in ('students.updated_at', 'updated_at'):
+            for student in self.fetch_pages(supabase_client, column, reread_from):
+                changed[student['id']] = student
+
+        deleted = {}  # student id -> deleted_at
+        for row in fetch_deleted_rows(supabase_client, 'student_courses', reread_from):
+            if row['old_row'].get('course_id') == self.course_id:
+                deleted[row['old_row']['student_id']] = row['deleted_at']
+        for row in fetch_deleted_rows(supabase_client, 'students', reread_from):
+            deleted[row['row_id']] = row['deleted_at']
+
+        # Whichever happened last wins, e.g. a student dropped and enrolled again
+        removed = set()
+        for student_id, deleted_at in deleted.items():
+            if (student_id not in changed
+                    or stamp_moment(deleted_at) >= stamp_moment(changed[student_id]['synced_at'])):
+                changed.pop(student_id, None)
+                removed.add(student_id)
+        high_water = newest_stamp(since, *(s['synced_at'] for s in changed.values()), *deleted.values())
+        return changed, removed, high_water
+
+    def refresh(self, supabase_client, full=False):
+        """Apply changes since the high-water mark; returns (changed records, removed ids)"""
+        since = None if full or not self.students else self.high_water
+        changed, removed, high_water = self.fetch_changes(supabase_client, since)
+
+        if full:
+            self.students = {}
+            self.by_matric = {}
+            self._search_index = None
+
+        changed = [student for student in changed.values() if self._differs(student)]
+        removed = {student_id for student_id in removed if student_id in self.students}
+        self.download_photos(changed)
+        for student in changed:
+            self._index(student)
+        for student_id in removed:
+            self._remove(student_id)
+        self.high_water = newest_stamp(self.high_water, high_water)
+
+        if changed or removed or full:
+            self.save()
+        return changed, removed
+
+    def download_photos(self, students):
+        """Download photos concurrently over one pooled HTTP client; they are stored sealed"""
+        todo = [s for s in students if s.get('photo_url')]
+        if not todo:
+            return
+        os.makedirs(self.photos_dir, exist_ok=True)
+
+        with httpx.Client(timeout=CONNECTION_TIMEOUT, follow_redirects=True) as client:
+            def fetch(student):
+                path = os.path.join(self.photos_dir, f"{student['id']}.jpg")
+                try:
+                    response = client.get(student['photo_url'])
+                    response.raise_for_status()
+                    # Already compressed; sealing only encrypts
+                    write_sealed(path, response.content, compress=False)
+                    student['photo_path'] = path
+                except Exception as e:
+                    logger.warning(f"Error downloading photo for {student['matric_number']}: {e}")
+                    # Keep a previously cached photo if the download failed
+                    if os.path.exists(path):
+                        student['photo_path'] = path
+
+            with ThreadPoolExecutor(max_workers=PHOTO_DOWNLOAD_WORKERS) as pool:
+                list(pool.map(fetch, todo))
+
+
+def open_roster(exam_data, cache_dir=ROSTER_CACHE_DIR, budget_bytes=CACHE_MEMORY_BUDGET_MB * 2**20):
+    """An exam's RosterCache, reusing the one already in memory
+
+    Rosters opened by an earlier session or by the prefetcher are kept,
+    so starting their exam does not read and decrypt the roster again.
+    Once the kept rosters take more than budget_bytes, the least
+    recently used are dropped; the one just opened is always kept.
+    """
+    key = (cache_dir, exam_data['id'])
+    with _open_rosters_lock:
+        roster = _open_rosters.pop(key, None)
+        if roster is None or roster.course_id != exam_data['course_id']:
+            roster = RosterCache(exam_data, cache_dir)
+        _open_rosters[key] = roster
+        used = sum(kept.memory_bytes() for kept in _open_rosters.values())
+        while used > budget_bytes and len(_open_rosters) > 1:
+            (_, exam_id), dropped = _open_rosters.popitem(last=False)
+            used -= dropped.memory_bytes()
+            logger.info(f"Dropped the roster of exam {exam_id} from memory ({used / 2**20:.1f} MB kept)")
+    return roster
+
+
+def forget_roster(exam_id, cache_dir=ROSTER_CACHE_DIR):
+    """Drop an exam's roster from memory, e.g. once its cache is evicted from disk"""
+    with _open_rosters_lock:
+        _open_rosters.pop((cache_dir, exam_id), None)
+
+
+def directory_size(path):
+    """Total size in bytes of the files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def cached_exams(cache_dir=ROSTER_CACHE_DIR):
+    """{exam id: (last used time, size in bytes)} for every cached roster"""
+    exams = {}
+    try:
+        entries = list(os.scandir(cache_dir))
+    except FileNotFoundError:
+        return exams
+    for entry in entries:
+        if not entry.is_dir() or not entry.name.startswith(EXAM_DIR_PREFIX):
+            continue
+        try:
+            exam_id = int(entry.name[len(EXAM_DIR_PREFIX):])
+        except ValueError:
+            continue
+        try:
+            with open(os.path.join(entry.path, LAST_USED_FILE)) as f:
+                last_used = float(f.read())
+        except (OSError, ValueError):
+            last_used = entry.stat().st_mtime
+        exams[exam_id] = (last_used, directory_size(entry.path))
+    return exams
+
+
+def evict_roster_caches(budget_bytes, keep=(), cache_dir=ROSTER_CACHE_DIR):
+    """Delete least recently used rosters until the cache fits the budget
+
+    Rosters in keep, and rosters whose lock is held, are never evicted.
+    Returns (evicted exam ids, bytes still used).
+    """
+    exams = cached_exams(cache_dir)
+    used = sum(size for _, size in exams.values())
+    evicted = []
+    for exam_id, (_, size) in sorted(exams.items(), key=lambda item: item[1][0]):
+        if used <= budget_bytes:
+            break
+        if exam_id in keep:
+            continue
+        lock = exam_lock(exam_id)
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            shutil.rmtree(os.path.join(cache_dir, f"{EXAM_DIR_PREFIX}{exam_id}"), ignore_errors=True)
+            forget_roster(exam_id, cache_dir)
+        finally:
+            lock.release()
+        used -= size
+        evicted.append(exam_id)
+    return evicted, used
+
+
+class RosterLoadThread(QThread):
+    """Refresh an exam roster cache in the background, then poll it for changes
+
+    roster_loaded is emitted after the first refresh and after every
+    later one that changed the roster. roster_failed is emitted when the
+    first refresh fails, and again whenever a run of failures begins.
+    """
+    roster_loaded = pyqtSignal(int, int)  # total students, changed or removed students
+    roster_failed = pyqtSignal(str)
+
+    def __init__(self, supabase_client, roster, interval=None):
+        super().__init__()
+        self.supabase = supabase_client
+        self.roster = roster
+        self.interval = interval  # seconds between polls; None refreshes once
+        self.running = True
+        self._wake = threading.Event()
+
+    def run(self):
+        first, failing = True, False
+        while self.running:
+            try:
+                with self.roster.lock:
+                    changed, removed = self.roster.refresh(self.supabase)
+                if first or changed or removed:
+                    self.roster_loaded.emit(len(self.roster), len(changed) + len(removed))
+                failing = False
+            except Exception as e:
+                if not failing:
+                    self.roster_failed.emit(f"Roster refresh failed: {str(e)}")
+                failing = True
+            first = False
+            if not self.interval:
+                break
+            self._wake.wait(self.interval)
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
@@ -0,0 +1,152 @@
+"""
+Encryption at rest for SVA Terminal's local caches
+
+Cached rosters (with fingerprint templates) and student photos are
+written as sealed files: a short header, then the payload, optionally
+zlib-compressed, encrypted with AES-256-GCM under the kiosk's cache key.
+GCM also authenticates the file, so a truncated or altered cache is
+rejected instead of being parsed.
+
+The key is read from CACHE_KEY_FILE and created there (mode 0600) on
+first use. Keep it off removable media; without it the caches are
+unreadable and are simply fetched again. Encryption needs the
+cryptography package. Without it, or with CACHE_ENCRYPTION off, files
+are sealed in the clear (still compressed and checked by CRC32), and a
+warning is logged once.
+
+File layout:
+
+    magic    7 bytes   b"SVASEAL"
+    flags    1 byte    ENCRYPTED | COMPRESSED
+    nonce    12 bytes  (encrypted files only)
+    payload            AES-GCM ciphertext with its tag, or the plain
+                       payload followed by its CRC32
+"""
+
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from config import CACHE_ENCRYPTION, CACHE_KEY_FILE
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SVASEAL"
+ENCRYPTED = 0x1
+COMPRESSED = 0x2
+NONCE_SIZE = 12
+CRC = struct.Struct("<I")
+
+_key = None
+_key_lock = threading.Lock()
+_warned = False
+
+
+class SealError(Exception):
+    """A sealed file is corrupt, was altered, or needs a key this kiosk lacks"""
+
+
+def encryption_enabled():
+    """Whether new files are encrypted; warns once if encryption is unavailable"""
+    global _warned
+    if not CACHE_ENCRYPTION:
+        return False
+    if AESGCM is None:
+        if not _warned:
+            logger.warning("cryptography is not installed; biometric caches are stored unencrypted")
+            _warned = True
+        return False
+    return True
+
+
+def cache_key(path=CACHE_KEY_FILE):
+    """The AES-256 cache key, created with owner-only permissions if missing"""
+    global _key
+    with _key_lock:
+        if _key is None:
+            try:
+                with open(path, 'rb') as f:
+                    key = f.read()
+            except FileNotFoundError:
+                key = os.urandom(32)
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(key)
+            if len(key) != 32:
+                raise SealError(f"Cache key must be 32 bytes: {path}")
+            _key = key
+        return _key
+
+
+def seal(data, compress=True, aad=b""):
+    """Seal bytes for writing to disk; aad binds the file to its purpose, e.g. a file name"""
+    flags = 0
+    if compress:
+        data = zlib.compress(data, 6)
+        flags |= COMPRESSED
+    if encryption_enabled():
+        nonce = os.urandom(NONCE_SIZE)
+        data = nonce + AESGCM(cache_key()).encrypt(nonce, data, MAGIC + aad)
+        flags |= ENCRYPTED
+    else:
+        data = data + CRC.pack(zlib.crc32(data))
+    return MAGIC + bytes([flags]) + data
+
+
+def unseal(blob, aad=b""):
+    """The bytes a sealed file holds; raises SealError if it cannot be trusted"""
+    if len(blob) < len(MAGIC) + 1 or not blob.startswith(MAGIC):
+        raise SealError("Not a sealed file")
+    flags = blob[len(MAGIC)]
+    data = memoryview(blob)[len(MAGIC) + 1:]
+    if flags & ENCRYPTED:
+        if AESGCM is None:
+            raise SealError("Sealed file is encrypted but cryptography is not installed")
+        try:
+            data = AESGCM(cache_key()).decrypt(bytes(data[:NONCE_SIZE]), bytes(data[NONCE_SIZE:]),
+                                               MAGIC + aad)
+        except InvalidTag:
+            raise SealError("Sealed file failed authentication")
+    else:
+        if len(data) < CRC.size or CRC.unpack(data[-CRC.size:])[0] != zlib.crc32(data[:-CRC.size]):
+            raise SealError("Sealed file checksum mismatch")
+        data = data[:-CRC.size]
+    if flags & COMPRESSED:
+        try:
+            data = zlib.decompress(data)
+        except zlib.error as e:
+            raise SealError(f"Sealed file does not decompress: {e}")
+    return bytes(data)
+
+
+def write_sealed(path, data, compress=True):
+    """Atomically write data to path as a sealed file"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(seal(data, compress, os.path.basename(path).encode()))
+    os.replace(tmp_path, path)
+
+
+def read_sealed(path, allow_plain=False):
+    """Read and unseal a file written by write_sealed
+
+    With allow_plain, a file that was never sealed (e.g. a photo cached
+    before encryption was added) is returned as it is.
+    """
+    with open(path, 'rb') as f:
+        blob = f.read()
+    if allow_plain and not blob.startswith(MAGIC):
+        return blob
+    return unseal(blob, os.path.basename(path).encode())
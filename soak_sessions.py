@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Soak test: run thousands of verification sessions and check memory stays flat
+
+Drives the real SVATerminal offscreen against an in-process fake
+Supabase. Each session uses a synthetic camera clip and the built-in
+fingerprint simulator. Every session selects an exam, waits for the
+roster, gallery and sensor to load, optionally starts and abandons a
+verification, and then leaves through the Back button. RSS, thread
+count and open file descriptors are sampled as sessions run. The run
+fails if RSS grows by more than --max-growth-mb after warm-up, or if
+threads or descriptors are left behind.
+
+Usage: python soak_sessions.py [--sessions 2000] [--students 10] [--max-growth-mb 10]
+"""
+
+import argparse
+import base64
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def write_clip(path, frames=60, size=(640, 480)):
+    """A short synthetic camera clip; CaptureService reads it like a device"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, size)
+    rng = np.random.default_rng(0)
+    for _ in range(frames):
+        writer.write(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8))
+    writer.release()
+
+
+def fake_tables(students):
+    rng = random.Random(0)
+    rows = []
+    for student_id in range(1, students + 1):
+        template = base64.b64encode(bytes(rng.randrange(256) for _ in range(512))).decode()
+        rows.append({'student_id': student_id, 'course_id': 1, 'students': {
+            'id': student_id, 'matric_number': f"SOAK/{student_id:05d}", 'name': f"Student {student_id}",
+            'class': "100L", 'department': "Soak", 'faculty': "Testing", 'photo_url': None,
+            'fingerprint_template': template, 'updated_at': "2026-01-01T00:00:00+00:00"}})
+    exam = {'id': 1, 'course_id': 1, 'exam_datetime': "2030-01-01T09:00:00+00:00",
+            'courses': {'course_code': "SOAK101", 'course_name': "Soak Testing"}}
+    return {'student_courses': rows, 'exams': [exam]}, exam
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--students', type=int, default=10,
+                        help="roster size; each template upload to the simulator takes ~10 ms")
+    parser.add_argument('--sample-every', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=100, help="sessions before the baseline sample")
+    parser.add_argument('--max-growth-mb', type=float, default=10.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sva_soak_")
+    clip = os.path.join(workdir, "camera.avi")
+    write_clip(clip)
+
+    # Point the terminal at the synthetic devices and a scratch data dir
+    # before it imports modules that read these settings
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import config
+    config.CAMERA_INDEX = clip
+    config.FINGERPRINT_PORT = 'sim'
+    config.ROSTER_CACHE_DIR = os.path.join(workdir, "roster_cache")
+    config.ATTENDANCE_QUEUE_DB = os.path.join(workdir, "attendance_queue.db")
+    config.METRICS_FILE = os.path.join(workdir, "metrics.json")
+    config.LANES = []
+
+    from PyQt5.QtCore import QCoreApplication, QEvent
+    from PyQt5.QtWidgets import QApplication
+    from data_access import DataService
+    from fake_supabase import FakeSupabase
+    import main as terminal_main
+
+    app = QApplication(sys.argv)
+    tables, exam = fake_tables(args.students)
+    fake = FakeSupabase(tables)
+    terminal = terminal_main.SVATerminal(DataService(client_factory=lambda url, key: fake))
+
+    def pump(condition, timeout=10.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            app.processEvents()
+            if condition():
+                return True
+            time.sleep(0.002)
+        return False
+
+    def drain_deletes():
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+        app.processEvents()
+
+    pump(lambda: terminal.stacked_widget.currentWidget() is terminal.exam_selection_screen, 30)
+    samples = []
+    baseline = None
+    started = time.time()
+    for session in range(1, args.sessions + 1):
+        terminal.start_verification_session(exam)
+        engine = terminal.verification_screen.engine
+        loaded = pump(lambda: engine.gallery_thread is not None and engine.gallery_thread.isFinished()
+                      and engine.fingerprint_load_thread is not None
+                      and engine.fingerprint_load_thread.isFinished())
+        if not loaded:
+            print(f"session {session}: roster, gallery or sensor did not load in time")
+        if session % 2 == 0:
+            # Start and abandon a verification so worker threads must be joined
+            terminal.verification_screen.start_btn.click()
+            pump(lambda: False, 0.02)
+        terminal.verification_screen.back_btn.click()
+        if not pump(lambda: engine.is_torn_down):
+            print(f"session {session}: engine threads did not stop in time")
+        drain_deletes()
+
+        if session % args.sample_every == 0 or session == args.warmup:
+            gc.collect()
+            drain_deletes()
+            sample = {'session': session, 'rss_mb': rss_mb(), 'threads': threading.active_count(),
+                      'fds': open_fds(), 'screens': terminal.stacked_widget.count()}
+            samples.append(sample)
+            if session == args.warmup:
+                baseline = sample
+            rate = session / (time.time() - started)
+            print(f"session {session:>6}: rss {sample['rss_mb']:7.1f} MB  threads {sample['threads']:>3}  "
+                  f"fds {sample['fds']:>4}  screens {sample['screens']}  ({rate:.1f} sessions/s)",
+                  flush=True)
+
+    terminal.close()
+    if baseline is None:
+        print("not enough sessions to take a baseline after warm-up")
+        return 1
+
+    tail = [s for s in samples if s['session'] > baseline['session']][-3:] or [baseline]
+    growth = statistics.median(s['rss_mb'] for s in tail) - baseline['rss_mb']
+    last = samples[-1]
+    failures = []
+    if growth > args.max_growth_mb:
+        failures.append(f"RSS grew {growth:.1f} MB after warm-up (limit {args.max_growth_mb} MB)")
+    if last['threads'] > baseline['threads']:
+        failures.append(f"threads grew from {baseline['threads']} to {last['threads']}")
+    if last['fds'] > baseline['fds']:
+        failures.append(f"open descriptors grew from {baseline['fds']} to {last['fds']}")
+    if last['screens'] != 2:
+        failures.append(f"{last['screens']} screens on the stack, expected 2")
+
+    print(f"\n{args.sessions} sessions, RSS growth after warm-up {growth:+.1f} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("PASS: memory, threads and descriptors stayed flat")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
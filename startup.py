@@ -0,0 +1,75 @@
+"""
+Startup warmup for SVA Terminal
+
+The splash screen is shown before OpenCV or the Supabase client are
+imported. While it is up, independent warmup tasks run in parallel:
+importing the OpenCV face stack and loading the cascade, creating the
+Supabase client, and paging in the most recently used embedding store.
+The main window opens the camera as soon as OpenCV is loaded and fetches
+the exam list at the same time, and leaves the splash once everything
+has finished instead of after a fixed delay.
+"""
+
+import glob
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from config import ROSTER_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Warmup task names
+VISION = 'vision'
+SUPABASE = 'supabase'
+EMBEDDINGS = 'embeddings'
+CAMERA = 'camera'
+EXAMS = 'exams'
+
+
+def warm_vision():
+    """Import the OpenCV face stack and load the shared face cascade"""
+    from camera import load_face_cascade
+    from face_engine import FaceEmbedder
+    import face_detection  # noqa: F401
+    import face_quality  # noqa: F401
+    load_face_cascade()
+    FaceEmbedder()
+
+
+def warm_embedding_store(cache_dir=ROSTER_CACHE_DIR):
+    """Verify the most recently used embedding store; returns its path or None
+
+    Verifying reads every row, which leaves the file in the page cache
+    for the first session.
+    """
+    paths = glob.glob(os.path.join(cache_dir, "exam_*", "embeddings.bin"))
+    if not paths:
+        return None
+    from embedding_store import EmbeddingStore
+    path = max(paths, key=os.path.getmtime)
+    EmbeddingStore.open(path)
+    return path
+
+
+class WarmupThread(QThread):
+    """Run warmup tasks concurrently and report each one as it finishes"""
+    task_done = pyqtSignal(str, float, str)  # task name, milliseconds, error ('' on success)
+
+    def __init__(self, tasks):
+        super().__init__()
+        self.tasks = tasks  # name -> callable
+
+    def run(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.tasks), thread_name_prefix="warmup") as pool:
+            futures = {pool.submit(fn): name for name, fn in self.tasks.items()}
+            for future in as_completed(futures):
+                elapsed = (time.perf_counter() - started) * 1000
+                error = future.exception()
+                if error is not None:
+                    logger.warning(f"Warmup task {futures[future]} failed: {error}")
+                self.task_done.emit(futures[future], elapsed, str(error) if error else "")
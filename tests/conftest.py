@@ -0,0 +1,12 @@
+"""
+Shared setup for the SVA Terminal tests
+
+The modules live at the repository root, so it is put on sys.path here.
+Qt runs offscreen, since the tests only need QtCore signals.
+"""
+
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
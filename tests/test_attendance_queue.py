@@ -0,0 +1,137 @@
+"""AttendanceQueue: durable local rows, the batched sync worker, client_ref idempotency and repeat scans"""
+
+import time
+import uuid
+
+import pytest
+
+import attendance_queue
+from attendance_queue import AttendanceQueue, AttendanceSyncThread, attendance_record
+from fake_supabase import FakeSupabase
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / "attendance_queue.db"))
+    yield queue
+    queue.close()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_queue_survives_a_restart(tmp_path):
+    path = str(tmp_path / "attendance_queue.db")
+    queue = AttendanceQueue(path)
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+    queue.close()
+    reopened = AttendanceQueue(path)
+    assert reopened.pending_count() == 1 and reopened.has_work.is_set()
+    assert reopened.peek_batch()[0][1]['student_id'] == 10
+    reopened.close()
+
+
+def test_ack_removes_only_the_accepted_rows(queue):
+    queue.enqueue_many([attendance_record(1, student_id, 'Verified', 'face_only')
+                        for student_id in (10, 11, 12)])
+    batch = queue.peek_batch(2)
+    assert [record['student_id'] for _, record in batch] == [10, 11]
+    queue.ack([row_id for row_id, _ in batch])
+    assert [record['student_id'] for _, record in queue.peek_batch()] == [12]
+
+
+def test_failed_rows_are_retried_after_healthy_ones(queue):
+    queue.enqueue_many([attendance_record(1, student_id, 'Verified', 'face_only')
+                        for student_id in (10, 11)])
+    first_row = queue.peek_batch(1)[0][0]
+    queue.mark_failed([first_row])
+    assert [record['student_id'] for _, record in queue.peek_batch()] == [11, 10]
+
+
+def test_sync_thread_uploads_in_batches(queue):
+    fake = FakeSupabase()
+    queue.enqueue_many([attendance_record(1, student_id, 'Verified', 'face_only')
+                        for student_id in range(10, 15)])
+    sync = AttendanceSyncThread(fake, queue, batch_size=2)
+    sync.start()
+    try:
+        assert wait_until(lambda: queue.pending_count() == 0)
+    finally:
+        sync.stop()
+        assert sync.wait(5000)
+    assert sorted(row['student_id'] for row in fake.rows('attendance')) == list(range(10, 15))
+    assert fake.requests == 3
+
+
+def test_sync_thread_retries_failed_uploads_until_accepted(queue, monkeypatch):
+    monkeypatch.setattr(attendance_queue, 'RETRY_DELAY', 0.05)
+    fake = FakeSupabase()
+    fake.fail_next(2)
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+    sync = AttendanceSyncThread(fake, queue)
+    sync.start()
+    try:
+        assert wait_until(lambda: queue.pending_count() == 0)
+    finally:
+        sync.stop()
+        assert sync.wait(5000)
+    assert len(fake.rows('attendance')) == 1
+    assert fake.requests == 3
+
+
+def test_each_record_gets_its_own_client_ref():
+    first = attendance_record(1, 10, 'Verified', 'face+fingerprint')
+    second = attendance_record(1, 10, 'Verified', 'face+fingerprint')
+    assert first['client_ref'] != second['client_ref']
+    uuid.UUID(first['client_ref'])
+
+
+def test_legacy_rows_get_a_stable_client_ref(queue):
+    record = attendance_record(1, 10, 'Verified', 'face_only')
+    del record['client_ref']
+    queue.enqueue(record)
+    first = queue.peek_batch()[0][1]['client_ref']
+    assert queue.peek_batch()[0][1]['client_ref'] == first
+
+
+def test_retrying_an_unacknowledged_batch_adds_no_duplicates(queue):
+    fake = FakeSupabase(unique={'attendance': ('client_ref',)})
+    queue.enqueue_many([attendance_record(1, student_id, 'Verified', 'face_only')
+                        for student_id in (10, 11, 12)])
+    # Stored by the server, but the reply was lost so nothing was acked
+    records = [record for _, record in queue.peek_batch()]
+    fake.table('attendance').upsert(records, on_conflict='client_ref', ignore_duplicates=True).execute()
+    assert queue.pending_count() == 3
+
+    sync = AttendanceSyncThread(fake, queue)
+    sync.start()
+    try:
+        assert wait_until(lambda: queue.pending_count() == 0)
+    finally:
+        sync.stop()
+        assert sync.wait(5000)
+    assert sorted(row['student_id'] for row in fake.rows('attendance')) == [10, 11, 12]
+
+
+def test_repeat_scans_are_known_from_queued_and_seeded_rows(queue):
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+    queue.enqueue(attendance_record(1, 11, 'Failed', 'face_only'))
+    queue.seed_verified(1, {12})
+    assert queue.verified_students(1) == {10, 12}
+    assert not queue.is_verified(2, 10)
+
+
+def test_verified_rows_queued_before_a_restart_are_still_repeat_scans(tmp_path):
+    path = str(tmp_path / "attendance_queue.db")
+    queue = AttendanceQueue(path)
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+    queue.close()
+    reopened = AttendanceQueue(path)
+    assert reopened.is_verified(1, 10)
+    reopened.close()
@@ -0,0 +1,151 @@
+"""Delta sync: stamp ordering, the SYNC_OVERLAP re-read and deletions, for exams and rosters"""
+
+from config import SYNC_OVERLAP
+from delta_sync import apply_exam_changes, fetch_exam_changes, newest_stamp, overlap_since, stamp_moment
+from fake_supabase import FakeSupabase
+from roster_cache import RosterCache
+
+MARK = "2026-05-04T10:00:00+00:00"
+BEFORE_MARK = "2026-05-04T09:59:30+00:00"  # committed late, inside the overlap window
+LONG_BEFORE = "2026-05-04T09:00:00+00:00"
+AFTER_MARK = "2026-05-04T10:05:00+00:00"
+LATER = "2026-05-04T10:10:00+00:00"
+
+
+def exam(exam_id, updated_at, day="2026-05-20"):
+    return {'id': exam_id, 'course_id': 1, 'exam_datetime': f"{day}T09:00:00+00:00",
+            'updated_at': updated_at}
+
+
+def deletion(row_id, table, deleted_at, old_row=None, seq=1):
+    return {'id': seq, 'table_name': table, 'row_id': row_id, 'old_row': old_row or {'id': row_id},
+            'deleted_at': deleted_at}
+
+
+def test_newest_stamp_ignores_empty_stamps():
+    assert newest_stamp(None, "", MARK, BEFORE_MARK) == MARK
+    assert newest_stamp(None, "") is None
+
+
+def test_newest_stamp_compares_instants_across_offsets():
+    # 10:30 in Lagos is 09:30 UTC, before the mark, though it sorts after it as a string
+    assert newest_stamp(MARK, "2026-05-04T10:30:00+01:00") == MARK
+    assert newest_stamp("2026-05-04T10:30:00+01:00", "2026-05-04T09:45:00Z") == "2026-05-04T09:45:00Z"
+    assert stamp_moment("2026-05-04T10:00:00") == stamp_moment(MARK)
+    assert stamp_moment("not a timestamp") < stamp_moment(LONG_BEFORE)
+
+
+def test_exam_deletion_is_ordered_against_changes_in_another_offset():
+    # Changed at 10:10 UTC, deleted at 10:05 UTC written as 11:05+01:00: the change wins
+    fake = FakeSupabase({'exams': [exam(1, LATER)],
+                         'deleted_rows': [deletion(1, 'exams', "2026-05-04T11:05:00+01:00")]})
+    changed, removed, high_water = fetch_exam_changes(fake, MARK)
+    assert [e['id'] for e in changed] == [1]
+    assert removed == set()
+    assert high_water == LATER
+
+
+def test_overlap_since_steps_back_by_the_overlap():
+    assert overlap_since(MARK, 30) == "2026-05-04T09:59:30+00:00"
+    assert overlap_since("not a timestamp") == "not a timestamp"
+
+
+def test_exam_changes_reread_rows_committed_just_before_the_mark():
+    assert SYNC_OVERLAP >= 30
+    fake = FakeSupabase({'exams': [exam(1, LONG_BEFORE), exam(2, BEFORE_MARK), exam(3, AFTER_MARK)]})
+    changed, removed, high_water = fetch_exam_changes(fake, MARK)
+    assert [e['id'] for e in changed] == [2, 3]
+    assert removed == set()
+    assert high_water == AFTER_MARK
+
+
+def test_exam_deleted_after_its_last_change_is_removed():
+    fake = FakeSupabase({
+        'exams': [exam(1, AFTER_MARK)],
+        'deleted_rows': [deletion(1, 'exams', LATER), deletion(2, 'exams', AFTER_MARK, seq=2),
+                         deletion(9, 'students', LATER, seq=3)],
+    })
+    changed, removed, high_water = fetch_exam_changes(fake, MARK)
+    assert changed == []
+    assert removed == {1, 2}
+    assert high_water == LATER
+
+
+def test_exam_changed_after_its_deletion_is_kept():
+    # Deleted and then created again with the same id
+    fake = FakeSupabase({'exams': [exam(1, LATER)], 'deleted_rows': [deletion(1, 'exams', AFTER_MARK)]})
+    changed, removed, _ = fetch_exam_changes(fake, MARK)
+    assert [e['id'] for e in changed] == [1]
+    assert removed == set()
+
+
+def test_apply_exam_changes_merges_removes_and_drops_past_exams():
+    exams = [exam(1, MARK, "2026-05-10"), exam(2, MARK, "2026-05-11"), exam(3, MARK, "2026-05-01")]
+    result = apply_exam_changes(exams, [exam(2, LATER, "2026-05-09"), exam(4, LATER, "2026-05-12")],
+                                {1}, "2026-05-04")
+    assert [(e['id'], e['updated_at']) for e in result] == [(2, LATER), (4, LATER)]
+
+
+def enrollment(student_id, updated_at=LONG_BEFORE, course_id=1, name=None):
+    return {'student_id': student_id, 'course_id': course_id, 'updated_at': updated_at, 'students': {
+        'id': student_id, 'matric_number': f"CSC/2021/{student_id:04d}",
+        'name': name or f"Student {student_id}", 'class': "300L", 'department': "Computer Science",
+        'faculty': "Science", 'photo_url': None, 'fingerprint_template': None,
+        'updated_at': updated_at}}
+
+
+def roster_for(fake, tmp_path):
+    roster = RosterCache({'id': 5, 'course_id': 1}, str(tmp_path))
+    roster.refresh(fake)
+    return roster
+
+
+def test_roster_overlap_rereads_do_not_count_as_changes(tmp_path):
+    fake = FakeSupabase({'student_courses': [enrollment(1), enrollment(2)]})
+    roster = roster_for(fake, tmp_path)
+    assert len(roster) == 2
+    roster.high_water = MARK
+
+    # Inside the overlap window but identical to the cached record
+    fake.tables['student_courses'][0]['students']['updated_at'] = BEFORE_MARK
+    fake.tables['student_courses'][0]['updated_at'] = BEFORE_MARK
+    changed, removed = roster.refresh(fake)
+    assert [s['id'] for s in changed] == [1]  # the new stamp is a real change
+    changed, removed = roster.refresh(fake)
+    assert (changed, removed) == ([], set())
+
+
+def test_roster_applies_late_commits_and_deletions(tmp_path):
+    fake = FakeSupabase({'student_courses': [enrollment(1), enrollment(2), enrollment(3)]})
+    roster = roster_for(fake, tmp_path)
+    roster.high_water = MARK
+
+    fake.tables['student_courses'][0] = enrollment(1, BEFORE_MARK, name="Renamed Student")
+    fake.tables['student_courses'].pop(1)
+    fake.tables['deleted_rows'] = [
+        deletion(2, 'student_courses', AFTER_MARK, {'student_id': 2, 'course_id': 1}),
+        deletion(3, 'student_courses', AFTER_MARK, {'student_id': 3, 'course_id': 99}, seq=2),
+    ]
+    changed, removed = roster.refresh(fake)
+    assert [s['name'] for s in changed] == ["Renamed Student"]
+    assert removed == {2}
+    assert sorted(roster.students) == [1, 3]  # student 3 was dropped from another course only
+    assert roster.high_water == AFTER_MARK
+
+    reloaded = RosterCache({'id': 5, 'course_id': 1}, str(tmp_path))
+    assert sorted(reloaded.students) == [1, 3]
+    assert reloaded.get(1)['name'] == "Renamed Student"
+
+
+def test_roster_student_enrolled_again_after_removal_is_kept(tmp_path):
+    fake = FakeSupabase({'student_courses': [enrollment(1), enrollment(2)]})
+    roster = roster_for(fake, tmp_path)
+    roster.high_water = MARK
+
+    fake.tables['student_courses'][1] = enrollment(2, LATER)
+    fake.tables['deleted_rows'] = [
+        deletion(2, 'student_courses', AFTER_MARK, {'student_id': 2, 'course_id': 1})]
+    changed, removed = roster.refresh(fake)
+    assert [s['id'] for s in changed] == [2]
+    assert removed == set()
+    assert 2 in roster.students
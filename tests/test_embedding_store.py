@@ -0,0 +1,113 @@
+"""EmbeddingStore: tombstones, growth, checksums and read-only opens"""
+
+import numpy as np
+import pytest
+
+from embedding_store import (EmbeddingStore, EmbeddingStoreError, HEADER_SIZE, TOMBSTONE,
+                             file_size)
+
+DIM = 16
+
+
+def unit(seed):
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture(params=['float32', 'float16', 'int8'])
+def store(request, tmp_path):
+    return EmbeddingStore.create(str(tmp_path / "embeddings.bin"), DIM, "test-model", capacity=2,
+                                 dtype=request.param)
+
+
+def test_append_and_reopen(store):
+    for student_id in (1, 2):
+        store.append(student_id, unit(student_id))
+    reopened = EmbeddingStore.open(store.path, model_name="test-model")
+    assert len(reopened) == 2 and 1 in reopened
+    assert np.dot(reopened.embedding(1), unit(1)) > 0.99
+
+
+def test_tombstone_hides_the_row_but_keeps_the_file_layout(store):
+    store.append(1, unit(1))
+    store.append(2, unit(2))
+    assert store.tombstone(1)
+    assert not store.tombstone(1)
+    assert 1 not in store and store.embedding(1) is None
+    ids, matrix, _ = store.live_view()
+    assert list(ids) == [TOMBSTONE, 2]
+    assert not matrix[0].any()
+
+    reopened = EmbeddingStore.open(store.path)
+    assert sorted(reopened.rows) == [2] and reopened.count == 2
+
+
+def test_replacing_a_student_tombstones_the_old_row(store):
+    store.append(1, unit(1))
+    store.append(1, unit(5))
+    assert len(store) == 1 and store.rows[1] == 1
+    assert np.dot(store.embedding(1), unit(5)) > 0.99
+
+
+def test_grow_doubles_capacity_and_keeps_rows(store):
+    for student_id in range(1, 6):
+        store.append(student_id, unit(student_id), flush=False)
+    store.flush()
+    assert store.capacity == 8
+    reopened = EmbeddingStore.open(store.path)
+    assert reopened.capacity == 8 and sorted(reopened.rows) == [1, 2, 3, 4, 5]
+    assert reopened.dtype == store.dtype
+    for student_id in range(1, 6):
+        assert np.dot(reopened.embedding(student_id), unit(student_id)) > 0.99
+
+
+def test_running_checksum_matches_a_full_recompute(store):
+    for student_id in range(1, 4):
+        store.append(student_id, unit(student_id), flush=False)
+    assert store.checksum == store.compute_checksum()
+    store.tombstone(2, flush=False)
+    store.flush()
+    assert store.checksum == store.compute_checksum()
+
+
+def test_corrupted_row_fails_the_checksum(store):
+    store.append(1, unit(1))
+    with open(store.path, 'r+b') as f:
+        f.seek(HEADER_SIZE + store.capacity * 12)
+        f.write(b"\x7f" * 4)
+    with pytest.raises(EmbeddingStoreError, match="checksum"):
+        EmbeddingStore.open(store.path)
+    # Readers that trust the builder can skip the check
+    EmbeddingStore.open(store.path, verify=False)
+
+
+def test_open_rejects_wrong_model_and_size(store):
+    store.append(1, unit(1))
+    with pytest.raises(EmbeddingStoreError, match="expected"):
+        EmbeddingStore.open(store.path, model_name="other-model")
+    with open(store.path, 'ab') as f:
+        f.write(b"\0")
+    with pytest.raises(EmbeddingStoreError, match="size"):
+        EmbeddingStore.open(store.path)
+
+
+def test_open_or_create_rebuilds_an_incompatible_store(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    EmbeddingStore.create(path, DIM, "test-model", dtype='float32').append(1, unit(1))
+    rebuilt = EmbeddingStore.open_or_create(path, DIM, "test-model", dtype='int8')
+    assert len(rebuilt) == 0 and rebuilt.dtype == np.int8
+    assert EmbeddingStore.open_or_create(path, DIM, "test-model", dtype='int8').dtype == np.int8
+
+
+def test_file_size_matches_the_layout(store):
+    assert file_size(store.capacity, DIM, store.dtype) == \
+        HEADER_SIZE + store.capacity * (8 + 4 + DIM * store.dtype.itemsize)
+
+
+def test_readonly_store_refuses_writes(store):
+    store.append(1, unit(1))
+    reader = EmbeddingStore.open(store.path, readonly=True)
+    assert reader.readonly and np.dot(reader.embedding(1), unit(1)) > 0.99
+    for write in (lambda: reader.append(2, unit(2)), lambda: reader.tombstone(1), reader.flush):
+        with pytest.raises(EmbeddingStoreError, match="read-only"):
+            write()
@@ -0,0 +1,158 @@
+"""Engine service API: routes, the shared-secret check and RemoteEngine's non-blocking end"""
+
+import threading
+import time
+
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+from camera import FrameFeed
+from engine_client import EngineClient, EngineError, RemoteEngine
+from engine_service import EventLog, check_address, make_server
+
+EXAM = {'id': 3, 'course_id': 1, 'exam_datetime': "2026-05-20T09:00:00+00:00"}
+
+
+class StubHost:
+    """The EngineHost methods the routes call, recording each call"""
+    frames = 'camera'
+    engine = None
+
+    def __init__(self):
+        self.events = EventLog()
+        self.calls = []
+        self.session = 0
+
+    def status(self):
+        return {'session': self.session or None}
+
+    def start_session(self, exam):
+        self.calls.append(('start_session', exam['id']))
+        self.session += 1
+        return {'session': self.session, 'after': self.events.seq}
+
+    def end_session(self, close_exam=False):
+        self.calls.append(('end_session', close_exam))
+
+    def start_attempt(self, student_id=None):
+        self.calls.append(('start_attempt', student_id))
+        return {'started': True}
+
+    def cancel_attempt(self):
+        self.calls.append(('cancel_attempt',))
+
+    def search(self, query, limit):
+        return [{'id': 7, 'query': query, 'limit': limit}]
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(scope='module')
+def app():
+    """Queued signals, such as a QThread's finished, need an application to be delivered"""
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """serve(token=None) -> (address, host) of a service on a Unix socket"""
+    servers = []
+
+    def serve(token=None):
+        address = f"unix:{tmp_path / 'engine.sock'}"
+        host = StubHost()
+        server = make_server(address, host, lambda fn: fn(), token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, host))
+        return address, host
+
+    yield serve
+    for server, host in servers:
+        host.events.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_routes_reach_the_host(serve):
+    address, host = serve()
+    client = EngineClient(address)
+    assert client.start_session(EXAM) == {'session': 1, 'after': 0}
+    assert client.status() == {'session': 1}
+    assert client.start_attempt(7) is True
+    client.cancel_attempt()
+    assert client.search("csc/2021", 3) == [{'id': 7, 'query': "csc/2021", 'limit': 3}]
+    client.end_session(close_exam=True)
+    assert host.calls == [('start_session', 3), ('start_attempt', 7), ('cancel_attempt',),
+                          ('end_session', True)]
+
+
+def test_bad_requests_are_refused(serve):
+    address, host = serve()
+    client = EngineClient(address)
+    with pytest.raises(EngineError, match="No route"):
+        client.request('GET', '/nothing')
+    with pytest.raises(EngineError, match="student_id must be an integer"):
+        client.request('POST', '/attempts', {'student_id': "7"})
+    with pytest.raises(EngineError, match="limit must be an integer"):
+        client.request('GET', '/search?q=a&limit=many')
+    with pytest.raises(EngineError, match="not taking frames"):
+        client.submit_frame(b"jpeg")
+    assert host.calls == []
+
+
+def test_event_backlog_after_a_sequence_number(serve):
+    address, host = serve()
+    for student_id in (7, 8, 9):
+        host.events.append('student_identified', session=1, student={'id': student_id})
+    events = EngineClient(address).request('GET', '/events?after=1&stream=0')
+    assert [(event['seq'], event['student']['id']) for event in events] == [(2, 8), (3, 9)]
+
+
+def test_every_request_needs_the_token_when_one_is_set(serve):
+    address, host = serve(token="s3cret")
+    for client in (EngineClient(address, token=None), EngineClient(address, token="wrong")):
+        with pytest.raises(EngineError, match="engine token"):
+            client.status()
+        with pytest.raises(EngineError, match="HTTP 401"):
+            next(client.events())
+        with pytest.raises(EngineError, match="engine token"):
+            client.end_session()
+    assert host.calls == []
+    assert EngineClient(address, token="s3cret").status() == {'session': None}
+
+
+def test_only_loopback_addresses_are_served_without_a_token():
+    assert check_address("http://127.0.0.1:8765", None) == ('tcp', ('127.0.0.1', 8765))
+    assert check_address("http://localhost:8765", None)[0] == 'tcp'
+    assert check_address("unix:data/engine.sock", None)[0] == 'unix'
+    for address in ("http://0.0.0.0:8765", "http://10.0.0.5:8765", "http://engine.local:8765"):
+        with pytest.raises(ValueError, match="ENGINE_API_TOKEN"):
+            check_address(address, None)
+        assert check_address(address, "s3cret")[0] == 'tcp'
+
+
+def test_remote_engine_ends_without_waiting_on_its_threads(app, serve):
+    address, host = serve()
+    capture = FrameFeed()
+    engine = RemoteEngine(address, EXAM, capture, power_saving=False)
+    torn_down = []
+    engine.torn_down.connect(lambda: torn_down.append(True))
+    engine.start()
+    assert wait_until(lambda: host.session == 1)
+
+    started = time.perf_counter()
+    engine.end(close_exam=True)
+    assert time.perf_counter() - started < 0.1
+    assert not capture.running
+    # The event stream is cut at once rather than at its next heartbeat
+    assert wait_until(lambda: torn_down and ('end_session', True) in host.calls, timeout=2)
+    assert engine.is_torn_down and not engine.events.isRunning() and not engine.uploader.isRunning()
+    assert capture.frame_listeners == []
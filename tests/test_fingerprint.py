@@ -0,0 +1,116 @@
+"""FingerprintSensor driven through PyFingerprint against the sensor simulator"""
+
+import base64
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from fingerprint import SIMULATOR_PORT, FingerprintSensor, decode_template
+
+
+def characteristics(seed):
+    return [random.Random(seed).randrange(256) for _ in range(512)]
+
+
+class Roster:
+    """The parts of a RosterCache the sensor reads"""
+
+    def __init__(self, exam_id, templates):
+        self.exam_id = exam_id
+        self.high_water = None
+        self.students = {student_id: {'id': student_id, 'matric_number': f"CSC/{student_id}",
+                                      'fingerprint_template': template}
+                         for student_id, template in templates.items()}
+
+    def __len__(self):
+        return len(self.students)
+
+
+def encoded(seed):
+    return base64.b64encode(bytes(characteristics(seed))).decode()
+
+
+@pytest.fixture
+def sensor(tmp_path):
+    sensor = FingerprintSensor(SIMULATOR_PORT)
+    sensor.manifest_path = str(tmp_path / "fingerprint_slots.json")
+    yield sensor
+    sensor.close()
+
+
+def test_decode_template_accepts_base64_and_json():
+    values = characteristics(1)
+    assert decode_template(base64.b64encode(bytes(values)).decode()) == values
+    assert decode_template(json.dumps(values)) == values
+    assert decode_template(bytes(values)) == values
+    assert decode_template("not base64!") is None
+    assert decode_template("[1, 256]") is None
+    assert decode_template("") is None
+
+
+def test_identify_finds_the_student_on_the_sensor(sensor):
+    assert sensor.load_roster(Roster(1, {10: encoded(10), 11: encoded(11), 12: None})) == 2
+    sensor.simulator.place_finger(characteristics(11))
+    student_id, accuracy = sensor.identify(timeout=2)
+    assert student_id == 11 and accuracy > 0
+
+
+def test_unknown_finger_matches_nobody(sensor):
+    sensor.load_roster(Roster(1, {10: encoded(10)}))
+    sensor.simulator.place_finger(characteristics(99))
+    assert sensor.identify(timeout=2) == (None, 0)
+
+
+def test_identify_times_out_without_a_finger(sensor):
+    sensor.load_roster(Roster(1, {10: encoded(10)}))
+    assert sensor.identify(timeout=0.3) is None
+
+
+def test_reloading_writes_only_changed_templates(sensor):
+    sensor.load_roster(Roster(1, {10: encoded(10), 11: encoded(11)}))
+    commands = sensor.simulator.commands
+    sensor.load_roster(Roster(1, {10: encoded(10), 11: encoded(11)}))
+    assert sensor.simulator.commands == commands
+
+    sensor.load_roster(Roster(1, {10: encoded(10), 11: encoded(21), 12: encoded(12)}))
+    assert sorted(sensor.slots.values()) == [10, 11, 12]
+    assert len(sensor.simulator.library) == 3
+
+    sensor.load_roster(Roster(1, {11: encoded(21)}))
+    assert list(sensor.slots.values()) == [11]
+    sensor.simulator.place_finger(characteristics(10))
+    assert sensor.identify(timeout=2) == (None, 0)
+    sensor.simulator.place_finger(characteristics(21))
+    assert sensor.identify(timeout=2)[0] == 11
+
+
+def test_identify_is_not_held_up_by_a_template_upload(sensor):
+    sensor.load_roster(Roster(1, {10: encoded(10)}))
+    sensor.simulator.place_finger(characteristics(10))
+    uploading, release = threading.Event(), threading.Event()
+
+    def upload():
+        with sensor.lock:
+            uploading.set()
+            release.wait(5)
+
+    uploader = threading.Thread(target=upload)
+    uploader.start()
+    uploading.wait(1)
+    try:
+        started = time.monotonic()
+        assert sensor.identify(timeout=0.3) is None
+        assert time.monotonic() - started < 1
+
+        stop = threading.Event()
+        threading.Timer(0.2, stop.set).start()
+        started = time.monotonic()
+        assert sensor.identify(timeout=10, should_continue=lambda: not stop.is_set()) is None
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        uploader.join()
+    assert sensor.identify(timeout=2)[0] == 10
@@ -0,0 +1,165 @@
+"""Fusion policies of VerificationOrchestrator, driven by stand-in modality threads"""
+
+import pytest
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from config import FINGERPRINT_FULL_ACCURACY
+from orchestrator import (VerificationOrchestrator, FACE, FINGERPRINT,
+                          METHOD_BOTH, METHOD_FACE, METHOD_FINGERPRINT)
+
+
+class FakeThread(QObject):
+    def __init__(self):
+        super().__init__()
+        self.started = False
+        self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def isRunning(self):
+        return self.started and not self.stopped
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeFaceThread(FakeThread):
+    face_identified = pyqtSignal(int, float)
+    face_detected = pyqtSignal(bool, str)
+
+    def match(self, student_id, score=0.9):
+        self.face_identified.emit(student_id, score)
+        self.face_detected.emit(True, "Face recognized")
+
+    def fail(self, message="Face not recognized"):
+        self.face_detected.emit(False, message)
+
+
+class FakeFingerprintThread(FakeThread):
+    fingerprint_identified = pyqtSignal(int, int)
+    fingerprint_verified = pyqtSignal(bool, str)
+
+    def match(self, student_id, accuracy=FINGERPRINT_FULL_ACCURACY):
+        self.fingerprint_identified.emit(student_id, accuracy)
+        self.fingerprint_verified.emit(True, "Fingerprint matched")
+
+    def fail(self, message="Fingerprint not recognized"):
+        self.fingerprint_verified.emit(False, message)
+
+
+def start(policy, face=True, fingerprint=True, **kwargs):
+    """(orchestrator, face thread, fingerprint thread, decisions) for a started attempt"""
+    orchestrator = VerificationOrchestrator(policy, **kwargs)
+    face_thread = FakeFaceThread() if face else None
+    fingerprint_thread = FakeFingerprintThread() if fingerprint else None
+    decisions = []
+    orchestrator.decided.connect(lambda *decision: decisions.append(decision))
+    orchestrator.start(face_thread, fingerprint_thread)
+    return orchestrator, face_thread, fingerprint_thread, decisions
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        VerificationOrchestrator('majority')
+
+
+def test_both_needs_the_same_student_from_each_modality():
+    orchestrator, face, finger, decisions = start('both')
+    face.match(7)
+    assert decisions == []
+    finger.match(7)
+    assert decisions == [(True, 7, METHOD_BOTH, "Face and fingerprint verified")]
+    assert not orchestrator.active
+
+
+def test_both_rejects_different_students():
+    _, face, finger, decisions = start('both')
+    face.match(7)
+    finger.match(8)
+    assert decisions[0][:3] == (False, 7, METHOD_BOTH)
+    assert "different students" in decisions[0][3]
+
+
+def test_both_fails_as_soon_as_one_modality_fails_and_cancels_the_other():
+    _, face, finger, decisions = start('both')
+    face.fail()
+    assert decisions == [(False, -1, METHOD_BOTH, "Face not recognized")]
+    assert finger.stopped
+
+
+def test_either_accepts_the_first_match_and_cancels_the_other():
+    _, face, finger, decisions = start('either')
+    face.match(3)
+    assert decisions == [(True, 3, METHOD_FACE, "Face recognized")]
+    assert finger.stopped
+    finger.match(4)  # too late to change the outcome
+    assert len(decisions) == 1
+
+
+def test_either_waits_for_the_fingerprint_after_a_face_failure():
+    _, face, finger, decisions = start('either')
+    face.fail()
+    assert decisions == []
+    finger.match(5)
+    assert decisions == [(True, 5, METHOD_FINGERPRINT, "Fingerprint matched")]
+
+
+def test_either_fails_when_both_fail():
+    _, face, finger, decisions = start('either')
+    face.fail()
+    finger.fail()
+    assert decisions == [(False, -1, METHOD_BOTH, "Fingerprint not recognized")]
+
+
+def test_either_without_a_face_thread_is_decided_by_the_fingerprint():
+    # Claimed-identity attempts run without the face modality
+    _, face, finger, decisions = start('either', face=False)
+    assert face is None and decisions == []
+    finger.match(9)
+    assert decisions == [(True, 9, METHOD_FINGERPRINT, "Fingerprint matched")]
+
+
+def test_score_combines_both_modalities():
+    _, face, finger, decisions = start('score', face_weight=0.5, score_threshold=0.7)
+    face.match(2, score=0.9)
+    assert decisions == []  # 0.45 so far; a fingerprint could still lift it over 0.7
+    finger.match(2, accuracy=FINGERPRINT_FULL_ACCURACY)
+    success, student_id, method, _ = decisions[0]
+    assert (success, student_id, method) == (True, 2, METHOD_BOTH)
+
+
+def test_score_fails_early_when_the_threshold_is_out_of_reach():
+    _, face, finger, decisions = start('score', face_weight=0.5, score_threshold=0.7)
+    face.fail()
+    assert decisions and decisions[0][0] is False
+    assert finger.stopped
+
+
+def test_score_rejects_different_students():
+    _, face, finger, decisions = start('score', face_weight=0.5, score_threshold=0.7)
+    face.match(2, score=0.9)
+    finger.match(3)
+    assert decisions[0][0] is False
+    assert "different students" in decisions[0][3]
+
+
+def test_cancel_stops_running_threads_and_ignores_late_results():
+    orchestrator, face, finger, decisions = start('both')
+    orchestrator.cancel()
+    assert face.stopped and finger.stopped
+    face.match(1)
+    finger.match(1)
+    assert decisions == []
+
+
+def test_stage_results_are_reported_per_modality():
+    orchestrator = VerificationOrchestrator('both')
+    stages = []
+    orchestrator.stage_result.connect(lambda *stage: stages.append(stage))
+    face, finger = FakeFaceThread(), FakeFingerprintThread()
+    orchestrator.start(face, finger)
+    face.match(4, score=0.8)
+    finger.fail("Fingerprint scan timeout")
+    assert stages == [(FACE, True, 4, "Face recognized"),
+                      (FINGERPRINT, False, -1, "Fingerprint scan timeout")]
@@ -0,0 +1,86 @@
+"""Prefetch: least-recently-used roster eviction and the disk budget of a prefetch pass"""
+
+import functools
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import prefetch
+import roster_cache
+from fake_supabase import FakeSupabase
+from prefetch import PrefetchThread, remember_exams, remembered_exams
+from roster_cache import EXAM_DIR_PREFIX, LAST_USED_FILE, cached_exams, evict_roster_caches, exam_lock
+
+KB = 1024
+
+
+def cache_roster(cache_dir, exam_id, size, last_used):
+    """A cached roster directory of size bytes, last used at last_used"""
+    path = os.path.join(cache_dir, f"{EXAM_DIR_PREFIX}{exam_id}")
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "roster.bin"), 'wb') as f:
+        f.write(b"\0" * size)
+    with open(os.path.join(path, LAST_USED_FILE), 'w') as f:
+        f.write(str(last_used))
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "rosters")
+
+
+def test_least_recently_used_rosters_are_evicted_first(cache_dir):
+    for exam_id, last_used in ((1, 300), (2, 100), (3, 200)):
+        cache_roster(cache_dir, exam_id, 10 * KB, last_used)
+    evicted, used = evict_roster_caches(25 * KB, cache_dir=cache_dir)
+    assert evicted == [2]
+    assert used <= 25 * KB
+    assert sorted(cached_exams(cache_dir)) == [1, 3]
+
+
+def test_kept_and_locked_rosters_are_never_evicted(cache_dir):
+    for exam_id, last_used in ((1, 100), (2, 200), (3, 300)):
+        cache_roster(cache_dir, exam_id, 10 * KB, last_used)
+    with exam_lock(2):
+        evicted, used = evict_roster_caches(5 * KB, keep={1}, cache_dir=cache_dir)
+    assert evicted == [3]
+    assert used > 5 * KB
+    assert sorted(cached_exams(cache_dir)) == [1, 2]
+
+
+def test_a_cache_within_budget_is_left_alone(cache_dir):
+    cache_roster(cache_dir, 1, 10 * KB, 100)
+    assert evict_roster_caches(20 * KB, cache_dir=cache_dir)[0] == []
+    assert evict_roster_caches(0, cache_dir=str(os.path.join(cache_dir, "missing"))) == ([], 0)
+
+
+def upcoming(exam_ids):
+    start = datetime.now().astimezone() + timedelta(days=1)
+    return [{'exam_id': exam_id, 'course_id': exam_id * 10, 'course_code': f"CSC{exam_id}",
+             'course_name': f"Course {exam_id}",
+             'exam_datetime': (start + timedelta(hours=exam_id)).isoformat()}
+            for exam_id in exam_ids]
+
+
+def test_prefetch_stops_once_upcoming_exams_fill_the_budget(cache_dir, monkeypatch):
+    monkeypatch.setattr(roster_cache, 'evict_roster_caches',
+                        functools.partial(evict_roster_caches, cache_dir=cache_dir))
+    monkeypatch.setattr(prefetch, 'remember_exams',
+                        functools.partial(remember_exams, cache_dir=cache_dir))
+    cache_roster(cache_dir, 99, 10 * KB, 0)  # a past exam's roster
+    fake = FakeSupabase(rpcs={'get_upcoming_exams': lambda db, params: upcoming([1, 2, 3, 4])})
+    thread = PrefetchThread(fake, budget_mb=15 * KB / 2**20)
+    fetched = []
+
+    def prefetch_exam(exam):
+        fetched.append(exam['id'])
+        cache_roster(cache_dir, exam['id'], 10 * KB, len(fetched))
+
+    monkeypatch.setattr(thread, 'prefetch_exam', prefetch_exam)
+    thread.set_active(2)
+    assert thread.prefetch_once() == (2, 4)
+    # Exam 2 is in session; exam 99 makes room for exam 1, then exams 1 and 3 alone fill the budget
+    assert fetched == [1, 3]
+    assert sorted(cached_exams(cache_dir)) == [1, 3]
+    assert [exam['id'] for exam in remembered_exams(cache_dir)] == [1, 2, 3, 4]
@@ -0,0 +1,135 @@
+"""Closing an exam: absentees, the bulk upload and the published summary, retried until stored"""
+
+import os
+
+import pytest
+
+import reconciliation
+from attendance_queue import (AttendanceQueue, AttendanceSyncThread, absent_record, attendance_record,
+                              upload_pending)
+from fake_supabase import FakeAPIError, FakeSupabase
+from reconciliation import close_exam
+
+EXAM = {'id': 1, 'course_id': 1, 'courses': {'course_code': "CSC401"}}
+
+
+class FlakySummaries(FakeSupabase):
+    """A server whose exam_summaries table is unavailable while summaries_down is set"""
+    summaries_down = False
+
+    def table(self, name):
+        if name == 'exam_summaries' and self.summaries_down:
+            raise FakeAPIError("exam_summaries unavailable")
+        return super().table(name)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / "attendance_queue.db"))
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def fake():
+    return FlakySummaries(unique={'attendance': ('client_ref',), 'exam_summaries': ('exam_id',)})
+
+
+@pytest.fixture(autouse=True)
+def summary_dir(tmp_path, monkeypatch):
+    """Summaries are written under tmp_path instead of SESSION_SUMMARY_DIR"""
+    directory = str(tmp_path / "summaries")
+    write_summary = reconciliation.write_summary
+    monkeypatch.setattr(reconciliation, 'write_summary', lambda summary: write_summary(summary, directory))
+    return directory
+
+
+def statuses(fake):
+    return sorted((row['student_id'], row['verification_status']) for row in fake.rows('attendance'))
+
+
+def test_absent_client_ref_is_derived_from_exam_and_student():
+    assert absent_record(1, 10)['client_ref'] == absent_record(1, 10)['client_ref']
+    assert absent_record(1, 10)['client_ref'] != absent_record(1, 11)['client_ref']
+    assert absent_record(1, 10)['client_ref'] != absent_record(2, 10)['client_ref']
+
+
+def test_upload_pending_sends_the_whole_queue_in_one_request(queue, fake):
+    queue.enqueue_many([attendance_record(1, student_id, 'Verified', 'face_only')
+                        for student_id in range(10, 20)])
+    assert upload_pending(fake, queue) == 10
+    assert fake.requests == 1 and queue.pending_count() == 0
+    assert upload_pending(fake, queue) == 0 and fake.requests == 1
+
+
+def test_failed_upload_keeps_rows_queued(queue, fake):
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+    fake.fail_next()
+    with pytest.raises(FakeAPIError):
+        upload_pending(fake, queue)
+    assert queue.pending_count() == 1
+    assert upload_pending(fake, queue) == 1
+    assert len(fake.rows('attendance')) == 1
+
+
+def test_closing_an_exam_twice_writes_each_absentee_once(queue, fake):
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+
+    summary = close_exam(fake, queue, EXAM, [10, 11, 12], {})
+    assert summary['absent_count'] == 2 and summary['pending'] == 0
+    assert 'deferred' not in summary
+    close_exam(fake, queue, EXAM, [10, 11, 12], {})
+    assert statuses(fake) == [(10, 'Verified'), (11, 'Absent'), (12, 'Absent')]
+    [row] = fake.rows('exam_summaries')
+    assert (row['roster_size'], row['verified_count'], row['absent_count']) == (3, 1, 2)
+    assert row['closed_at'].endswith("+00:00")
+
+
+def test_close_is_deferred_while_verified_students_cannot_be_fetched(queue, fake):
+    # Verified on another terminal; this one cannot see that while offline
+    fake.tables['attendance'] = [dict(attendance_record(1, 11, 'Verified', 'face_only'), id=1)]
+
+    fake.fail_next()
+    assert close_exam(fake, queue, EXAM, [10, 11], {}) == {'exam_id': 1, 'deferred': True}
+    assert queue.pending_count() == 0 and queue.pending_close_count() == 1
+
+    exam_data, roster_ids, report = queue.pending_closes()[0]
+    summary = close_exam(fake, queue, exam_data, roster_ids, report)
+    assert summary['absent_count'] == 1 and queue.pending_close_count() == 0
+    assert statuses(fake) == [(10, 'Absent'), (11, 'Verified')]
+
+
+def test_close_stays_queued_until_its_summary_is_stored(queue, fake, summary_dir):
+    queue.enqueue(attendance_record(1, 10, 'Verified', 'face_only'))
+    fake.summaries_down = True
+
+    summary = close_exam(fake, queue, EXAM, [10, 11, 12], {})
+    assert summary['deferred'] and queue.pending_close_count() == 1
+    assert fake.rows('exam_summaries') == []
+    assert len(os.listdir(summary_dir)) == 1  # kept on disk meanwhile
+    assert statuses(fake) == [(10, 'Verified'), (11, 'Absent'), (12, 'Absent')]
+
+    # The sync worker runs the close again and stops once the summary is stored
+    sync = AttendanceSyncThread(fake, queue)
+    sync.retry_closes()
+    assert queue.pending_close_count() == 1
+    fake.summaries_down = False
+    sync.retry_closes()
+    assert queue.pending_close_count() == 1  # backing off after the failure
+    sync._close_retry_at = 0
+    sync.retry_closes()
+    assert queue.pending_close_count() == 0
+    assert fake.rows('exam_summaries')[0]['absent_count'] == 2
+    assert statuses(fake) == [(10, 'Verified'), (11, 'Absent'), (12, 'Absent')]
+
+
+def test_retried_close_does_not_queue_its_absentees_again(queue, fake, monkeypatch):
+    def offline(client, queue):
+        raise FakeAPIError("Bulk upload failed")
+
+    # Neither the absentees nor the summary reach the server
+    monkeypatch.setattr(reconciliation, 'upload_pending', offline)
+    fake.summaries_down = True
+    for _ in range(3):
+        assert close_exam(fake, queue, EXAM, [11, 12], {})['deferred']
+    assert queue.pending_count() == 2 and queue.pending_close_count() == 1
@@ -0,0 +1,67 @@
+"""RosterIndex prefix search over matric numbers and names"""
+
+from roster_cache import RosterIndex, normalise
+
+STUDENTS = [
+    {'id': 1, 'matric_number': "CSC/2021/0042", 'name': "Adeyemi Chidi"},
+    {'id': 2, 'matric_number': "CSC/2021/0421", 'name': "Okafor Aisha"},
+    {'id': 3, 'matric_number': "MTH/2020/0042", 'name': "Bello Chinedu"},
+    {'id': 4, 'matric_number': "CSC/2022/0007", 'name': "Adeyemi Tunde"},
+]
+
+
+def ids(students):
+    return [student['id'] for student in students]
+
+
+def test_normalise_ignores_case_and_spacing():
+    assert normalise("  csc/2021   0042 ") == "csc/2021 0042"
+
+
+def test_full_matric_number_prefix():
+    index = RosterIndex(STUDENTS)
+    assert ids(index.search("csc/2021/004")) == [1]
+    assert ids(index.search("CSC/2021")) == [1, 2]
+    assert ids(index.search("CSC")) == [1, 2, 4]
+
+
+def test_matric_tail_after_a_slash():
+    index = RosterIndex(STUDENTS)
+    assert ids(index.search("0042")) == [1, 3]
+    assert ids(index.search("2021/0")) == [1, 2]
+    assert ids(index.search("2021/04")) == [2]
+
+
+def test_name_words_in_any_order():
+    index = RosterIndex(STUDENTS)
+    assert ids(index.search("chi")) == [1, 3]
+    assert ids(index.search("adeyemi")) == [1, 4]
+    assert ids(index.search("chidi adey")) == [1]
+    assert ids(index.search("adey tun")) == [4]
+
+
+def test_every_word_must_match():
+    index = RosterIndex(STUDENTS)
+    assert index.search("okafor tunde") == []
+    assert index.search("xyz") == []
+    assert index.search("   ") == []
+
+
+def test_whole_matric_prefixes_rank_first_and_limit_applies():
+    # Students 3 and 5 match on their whole matric number, student 6 only on a name word
+    students = [{'id': 5, 'matric_number': "MTH/2019/0001", 'name': "Musa Ngozi"},
+                {'id': 6, 'matric_number': "PHY/2021/0001", 'name': "Mth Eze"}]
+    index = RosterIndex(STUDENTS + students)
+    assert ids(index.search("mth")) == [5, 3, 6]
+    assert ids(index.search("mth", limit=1)) == [5]
+
+
+def test_roster_cache_search_uses_the_index(tmp_path):
+    from roster_cache import RosterCache, StudentRecord
+
+    roster = RosterCache({'id': 1, 'course_id': 1}, str(tmp_path))
+    for student in STUDENTS:
+        roster._index(StudentRecord.from_row(dict(student, updated_at="2026-01-01T00:00:00+00:00")))
+    assert ids(roster.search("csc/2021")) == [1, 2]
+    roster._remove(1)
+    assert ids(roster.search("csc/2021")) == [2]
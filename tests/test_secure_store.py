@@ -0,0 +1,107 @@
+"""Sealed cache files: round trips, and tampered or misplaced files being rejected"""
+
+import os
+import stat
+
+import pytest
+
+import secure_store
+from secure_store import MAGIC, SealError, cache_key, read_sealed, seal, unseal, write_sealed
+
+PAYLOAD = b'{"students": [{"id": 7, "fingerprint_template": "AAEC"}]}' * 20
+
+
+@pytest.fixture(autouse=True)
+def key(monkeypatch):
+    """A fresh in-memory cache key, so no key file is read or written"""
+    monkeypatch.setattr(secure_store, '_key', os.urandom(32))
+
+
+@pytest.fixture(params=[True, False], ids=['encrypted', 'plain'])
+def encrypted(request, monkeypatch):
+    monkeypatch.setattr(secure_store, 'CACHE_ENCRYPTION', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_seal_round_trips(encrypted, compress):
+    blob = seal(PAYLOAD, compress, b"roster.bin")
+    assert blob.startswith(MAGIC)
+    assert unseal(blob, b"roster.bin") == PAYLOAD
+    if compress:
+        assert len(blob) < len(PAYLOAD)
+    assert (b"fingerprint_template" in blob) == (not encrypted and not compress)
+
+
+def test_encrypted_seals_use_a_fresh_nonce(monkeypatch):
+    monkeypatch.setattr(secure_store, 'CACHE_ENCRYPTION', True)
+    assert seal(PAYLOAD) != seal(PAYLOAD)
+
+
+@pytest.mark.parametrize('offset', [len(MAGIC) + 1, len(MAGIC) + 20, -1])
+def test_altered_bytes_are_rejected(encrypted, offset):
+    blob = bytearray(seal(PAYLOAD, compress=False))
+    blob[offset] ^= 0x01
+    with pytest.raises(SealError):
+        unseal(bytes(blob))
+
+
+def test_truncated_and_foreign_files_are_rejected(encrypted):
+    blob = seal(PAYLOAD)
+    with pytest.raises(SealError):
+        unseal(blob[:len(blob) // 2])
+    with pytest.raises(SealError, match="Not a sealed file"):
+        unseal(PAYLOAD)
+    with pytest.raises(SealError, match="Not a sealed file"):
+        unseal(MAGIC)
+
+
+def test_a_file_moved_to_another_name_is_rejected(monkeypatch):
+    monkeypatch.setattr(secure_store, 'CACHE_ENCRYPTION', True)
+    with pytest.raises(SealError, match="authentication"):
+        unseal(seal(PAYLOAD, aad=b"roster.bin"), b"photo_7.jpg")
+
+
+def test_another_kiosks_key_cannot_unseal(monkeypatch):
+    monkeypatch.setattr(secure_store, 'CACHE_ENCRYPTION', True)
+    blob = seal(PAYLOAD)
+    monkeypatch.setattr(secure_store, '_key', os.urandom(32))
+    with pytest.raises(SealError):
+        unseal(blob)
+
+
+def test_write_and_read_sealed(encrypted, tmp_path):
+    path = str(tmp_path / "exam_1" / "roster.bin")
+    write_sealed(path, PAYLOAD)
+    assert read_sealed(path) == PAYLOAD
+    assert not os.path.exists(path + ".tmp")
+    moved = str(tmp_path / "roster_copy.bin")
+    os.rename(path, moved)
+    if encrypted:
+        with pytest.raises(SealError):
+            read_sealed(moved)
+
+
+def test_plain_files_are_only_read_when_allowed(tmp_path):
+    path = str(tmp_path / "photo_7.jpg")
+    with open(path, 'wb') as f:
+        f.write(b"\xff\xd8 a photo cached before encryption")
+    assert read_sealed(path, allow_plain=True) == b"\xff\xd8 a photo cached before encryption"
+    with pytest.raises(SealError):
+        read_sealed(path)
+
+
+def test_cache_key_is_created_owner_only_and_checked(tmp_path, monkeypatch):
+    monkeypatch.setattr(secure_store, '_key', None)
+    path = str(tmp_path / "keys" / "cache.key")
+    key = cache_key(path)
+    assert len(key) == 32
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    monkeypatch.setattr(secure_store, '_key', None)
+    assert cache_key(path) == key
+
+    monkeypatch.setattr(secure_store, '_key', None)
+    with open(path, 'wb') as f:
+        f.write(b"short")
+    with pytest.raises(SealError, match="32 bytes"):
+        cache_key(path)
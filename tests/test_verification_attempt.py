@@ -0,0 +1,98 @@
+"""VerificationAttempt: repeat-scan checks and attendance logging shared by the engine and lanes"""
+
+import pytest
+from PyQt5.QtCore import pyqtSignal
+
+from attendance_queue import AttendanceQueue, attendance_record
+from engine import ALREADY_VERIFIED, FAILED, VERIFIED, VerificationAttempt
+from orchestrator import FACE, FINGERPRINT, METHOD_BOTH, METHOD_FINGERPRINT
+from test_orchestrator import FakeFaceThread, FakeFingerprintThread
+
+EXAM_ID = 1
+ROSTER = {student_id: {'id': student_id, 'name': f"Student {student_id}",
+                       'matric_number': f"CSC/2021/{student_id:04d}"} for student_id in (7, 8, 9)}
+
+
+class RetryingFingerprintThread(FakeFingerprintThread):
+    fingerprint_retry = pyqtSignal(int)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / "attendance_queue.db"))
+    yield queue
+    queue.close()
+
+
+def start(queue, face=True, claimed_student=None):
+    """(attempt, face thread, fingerprint thread, reports) for a started attempt"""
+    face_thread = FakeFaceThread() if face else None
+    fingerprint_thread = RetryingFingerprintThread()
+    attempt = VerificationAttempt(ROSTER, EXAM_ID, queue, face_thread, fingerprint_thread,
+                                  claimed_student)
+    reports = {'stages': [], 'students': [], 'finished': []}
+    attempt.stage_changed.connect(lambda *stage: reports['stages'].append(stage))
+    attempt.student_identified.connect(lambda student: reports['students'].append(student['id']))
+    attempt.finished.connect(lambda *result: reports['finished'].append(result))
+    attempt.start()
+    return attempt, face_thread, fingerprint_thread, reports
+
+
+def queued(queue):
+    return [(record['student_id'], record['verification_status'], record['verification_method'])
+            for _, record in queue.peek_batch()]
+
+
+def test_verified_attempt_queues_attendance(queue):
+    attempt, face, finger, reports = start(queue)
+    face.match(7)
+    assert reports['students'] == [7]
+    finger.match(7)
+    assert reports['stages'] == [(FACE, "matched"), (FINGERPRINT, "matched")]
+    assert reports['finished'] == [(VERIFIED, ROSTER[7], METHOD_BOTH, "Face and fingerprint verified")]
+    assert queued(queue) == [(7, 'Verified', METHOD_BOTH)]
+    assert not attempt.active
+
+
+def test_failed_attempt_logs_the_student_it_saw(queue):
+    _, face, finger, reports = start(queue)
+    face.match(7)
+    finger.fingerprint_retry.emit(2)
+    assert reports['stages'][-1] == (FINGERPRINT, "not matched, 2 tries left")
+    finger.fail()
+    assert reports['finished'][0][:2] == (FAILED, ROSTER[7])
+    assert queued(queue) == [(7, 'Failed', METHOD_BOTH)]
+
+
+def test_fingerprint_match_on_a_verified_student_is_a_repeat_scan(queue):
+    queue.seed_verified(EXAM_ID, {8})
+    attempt, face, finger, reports = start(queue)
+    finger.match(8)
+    assert reports['finished'] == [(ALREADY_VERIFIED, ROSTER[8], None,
+                                    "This student has already been verified for this exam")]
+    assert face.stopped and not attempt.active
+    assert queued(queue) == []
+
+
+def test_face_match_alone_does_not_turn_a_student_away(queue):
+    queue.seed_verified(EXAM_ID, {8})
+    _, face, finger, reports = start(queue)
+    face.match(8)
+    assert reports['finished'] == [] and not finger.stopped
+
+
+def test_student_verified_elsewhere_meanwhile_is_a_repeat_scan(queue):
+    _, face, finger, reports = start(queue)
+    face.match(9)
+    # Another lane verifies the same student before this attempt decides
+    queue.enqueue(attendance_record(EXAM_ID, 9, 'Verified', METHOD_BOTH))
+    finger.match(9)
+    assert reports['finished'][0][0] == ALREADY_VERIFIED
+    assert len(queued(queue)) == 1
+
+
+def test_claimed_student_is_verified_by_the_fingerprint_alone(queue):
+    attempt, _, finger, reports = start(queue, face=False, claimed_student=ROSTER[9])
+    finger.match(9)
+    assert reports['finished'] == [(VERIFIED, ROSTER[9], METHOD_FINGERPRINT, "Fingerprint matched")]
+    assert queued(queue) == [(9, 'Verified', METHOD_FINGERPRINT)]